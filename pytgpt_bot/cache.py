@@ -0,0 +1,82 @@
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Hashable
+
+
+class LRUCache:
+    """Bounded least-recently-used cache with expiring entries"""
+
+    def __init__(self, maxsize: int = 1000, ttl: float = 300):
+        """Constructor
+
+        Args:
+            maxsize (int, optional): Maximum entries to keep, 0 disables caching. Defaults to 1000.
+            ttl (float, optional): Seconds an entry stays valid, 0 never expires. Defaults to 300.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits: int = 0
+        self.misses: int = 0
+        self.__entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Look up an entry and mark it as most recently used
+
+        Args:
+            key (Hashable): Entry key.
+            default (Any, optional): Returned on miss. Defaults to None.
+
+        Returns:
+            Any: Cached value or `default`.
+        """
+        entry = self.__entries.get(key)
+        if entry is None or (self.ttl and entry[0] < monotonic()):
+            if entry is not None:
+                del self.__entries[key]
+            self.misses += 1
+            return default
+        self.__entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Add or refresh an entry, evicting the least recently used ones
+
+        Args:
+            key (Hashable): Entry key.
+            value (Any): Value to cache.
+        """
+        if self.maxsize <= 0:
+            return
+        self.__entries[key] = (monotonic() + self.ttl, value)
+        self.__entries.move_to_end(key)
+        while len(self.__entries) > self.maxsize:
+            self.__entries.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        """Invalidate an entry"""
+        self.__entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Invalidate all entries"""
+        self.__entries.clear()
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    @property
+    def hit_rate(self) -> float:
+        """Ratio of lookups served from the cache"""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> dict[str, int | float]:
+        """Cache size and hit/miss counters"""
+        return dict(
+            size=len(self),
+            maxsize=self.maxsize,
+            ttl=self.ttl,
+            hits=self.hits,
+            misses=self.misses,
+            hit_rate=round(self.hit_rate, 4),
+        )
@@ -0,0 +1,180 @@
+import logging
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from typing import Awaitable, Callable
+import telebot
+from pytgpt_bot import metrics
+
+max_callback_bytes: int = 64
+"""Size limit of Telegram's `callback_data`"""
+
+media_callback_prefix: str = "re"
+"""Namespace of encoded media callbacks"""
+
+media_providers: tuple[str] = ("default", "prodia", "speech")
+"""Media providers in the order they're encoded"""
+
+temp_flag: int = 0x80
+"""Set when the callback carries a `Temp` id in place of the prompt"""
+
+
+def encode_varint(value: int) -> bytes:
+    """Encode a signed integer in as few bytes as possible (zigzag varint)"""
+    value = (value << 1) ^ (value >> 63)
+    encoded = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            encoded.append(byte | 0x80)
+        else:
+            encoded.append(byte)
+            return bytes(encoded)
+
+
+def decode_varint(encoded: bytes, offset: int = 0) -> tuple[int, int]:
+    """Decode a signed integer encoded by `encode_varint`
+
+    Returns:
+        tuple[int, int]: Integer and offset of the byte after it.
+    """
+    value = shift = 0
+    while True:
+        byte = encoded[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return (value >> 1) ^ -(value & 1), offset
+
+
+def encode_media_callback(
+    provider: str, user_id: int | str, prompt: str = None, temp_id: int = None
+) -> str | None:
+    """Pack a media regeneration callback
+
+    The provider and user id are packed into a base64 header followed by the
+    prompt as is, e.g `re:AbCdEf:Peaceful desert scene`.
+
+    Args:
+        provider (str): One of `media_providers`.
+        user_id (int | str): Id of the user or chat.
+        prompt (str, optional): Prompt media was generated from. Defaults to None.
+        temp_id (int, optional): Id of the `Temp` row keeping the prompt. Defaults to None.
+
+    Returns:
+        str | None: Callback data - None when the prompt doesn't fit in.
+    """
+    kind = media_providers.index(provider)
+    header = bytearray(encode_varint(int(user_id)))
+    if temp_id is None:
+        header.insert(0, kind)
+        body = prompt
+    else:
+        header.insert(0, kind | temp_flag)
+        header.extend(encode_varint(temp_id))
+        body = ""
+    data = f"{media_callback_prefix}:{urlsafe_b64encode(header).decode()}:{body}"
+    if len(data.encode()) > max_callback_bytes:
+        return
+    return data
+
+
+def decode_media_callback(data: str) -> tuple[str, str, str | None, int | None]:
+    """Unpack a media regeneration callback
+
+    Args:
+        data (str): Callback data made by `encode_media_callback`, less the namespace.
+
+    Raises:
+        ValueError: Data is malformed e.g forged.
+
+    Returns:
+        tuple[str, str, str | None, int | None]: Provider, user id, prompt and `Temp` id -
+            either of the last two is None.
+    """
+    try:
+        header, body = data.split(":", 1)
+        header = urlsafe_b64decode(header)
+        provider = media_providers[header[0] & ~temp_flag]
+        user_id, offset = decode_varint(header, 1)
+        if header[0] & temp_flag:
+            temp_id, offset = decode_varint(header, offset)
+            body = None
+        else:
+            temp_id = None
+    except (ValueError, IndexError) as e:
+        raise ValueError(f"Malformed media callback - {data}") from e
+    if offset != len(header):
+        raise ValueError(f"Malformed media callback - {data}")
+    return provider, str(user_id), body, temp_id
+
+
+CallbackHandler = Callable[[telebot.types.CallbackQuery, str], Awaitable]
+
+
+class CallbackRouter:
+    """Dispatches callback queries by the namespace their data starts with
+
+    Data is namespaced as `<namespace>:<payload>` e.g `voice:en-US:123`, so a
+    query is matched to its handler in a single lookup. Handlers get the
+    payload. Data of buttons made before namespaces - e.g `en-US:123` - is
+    matched by the handlers' legacy checks and passed on whole, which is the
+    same shape as the payload.
+
+    ```python
+    @callback_router.route("voice", legacy=all_voices.__contains__)
+    async def handler(call: telebot.types.CallbackQuery, payload: str):
+        ...
+    ```
+    """
+
+    def __init__(self):
+        self.routes: dict[str, CallbackHandler] = {}
+        self.legacy_routes: list[tuple[Callable[[str], bool], CallbackHandler]] = []
+
+    def route(
+        self, namespace: str, legacy: Callable[[str], bool] = None
+    ) -> Callable[[CallbackHandler], CallbackHandler]:
+        """Register a handler
+
+        Args:
+            namespace (str): Data namespace.
+            legacy (Callable[[str], bool], optional): Checks whether the first field of
+                un-namespaced data belongs to the handler. Defaults to None.
+        """
+
+        def decorator(handler: CallbackHandler) -> CallbackHandler:
+            self.routes[namespace] = handler
+            if legacy:
+                self.legacy_routes.append((legacy, handler))
+            return handler
+
+        return decorator
+
+    def resolve(self, data: str) -> tuple[CallbackHandler, str] | None:
+        """Handler of callback data and the payload to pass it"""
+        namespace, _, payload = data.partition(":")
+        handler = self.routes.get(namespace)
+        if handler:
+            return handler, payload
+        for matches, handler in self.legacy_routes:
+            if matches(namespace):
+                return handler, data
+
+    def matches(self, call: telebot.types.CallbackQuery) -> bool:
+        return bool(call.data) and self.resolve(call.data) is not None
+
+    async def dispatch(self, call: telebot.types.CallbackQuery):
+        """Pass a callback query on to its handler"""
+        handler, payload = self.resolve(call.data)
+        logging.debug(
+            "Serving callback [%s] - %s",
+            handler.__name__,
+            call.data,
+            extra=dict(
+                chat_id=call.message.chat.id if call.message else None,
+                handler=handler.__name__,
+            ),
+        )
+        with metrics.handler_seconds.time(handler.__name__):
+            return await handler(call, payload)
@@ -1,18 +1,62 @@
 import asyncio
 import click
-from pytgpt.utils import Audio
 from pytgpt_bot import __version__
 from os import environ
 import logging
-from pytgpt_bot.utils import provider_keys
-from pytgpt_bot.utils import bot_dir
 from shutil import rmtree
+from functools import cached_property
+from typing import Callable
 
 context_settings: dict = dict(auto_envvar_prefix="PYTGPT-BOT")
 
 # bot_token, max_tokens, timeout, voice, loglevel, logfile, admin_id
 
 
+class LazyChoice(click.Choice):
+    """Choice whose options are loaded on first use
+
+    Keeps heavy imports out of the cli until an option is rendered or parsed.
+    """
+
+    def __init__(
+        self,
+        load: Callable[[], list[str]],
+        metavar_size: int = None,
+        case_sensitive: bool = True,
+    ):
+        """Constructor
+
+        Args:
+            load (Callable[[], list[str]]): Returns the choices.
+            metavar_size (int, optional): Choices shown in help. Defaults to None (all).
+            case_sensitive (bool, optional): Match choices case sensitively. Defaults to True.
+        """
+        self.load = load
+        self.metavar_size = metavar_size
+        self.case_sensitive = case_sensitive
+
+    @cached_property
+    def choices(self) -> list[str]:
+        return self.load()
+
+    def get_metavar(self, param: click.Parameter) -> str:
+        if self.metavar_size:
+            return "|".join(self.choices[: self.metavar_size])
+        return super().get_metavar(param)
+
+
+def get_voices() -> list[str]:
+    from pytgpt.utils import Audio
+
+    return Audio.all_voices
+
+
+def get_provider_keys() -> list[str]:
+    from pytgpt_bot.utils import provider_keys
+
+    return provider_keys
+
+
 @click.group()
 @click.version_option(
     __version__, "-v", "--version", package_name="pytgpt-bot", prog_name="pytgpt-bot"
@@ -39,11 +83,34 @@ def bot():
     help="Http request timeout in seconds",
     default=30,
 )
+@click.option(
+    "--pool-size",
+    type=click.IntRange(1, 1000),
+    help="Connections kept alive per provider client",
+    default=20,
+)
+@click.option(
+    "--send-rate",
+    type=click.IntRange(1, 30),
+    help="Maximum messages sent per second across all chats",
+    default=30,
+)
+@click.option(
+    "--queue-depth",
+    type=click.IntRange(1, 100),
+    help="Requests a chat can have queued before new ones are turned down",
+    default=3,
+)
+@click.option(
+    "--concurrency",
+    type=click.IntRange(1, 1000),
+    help="Requests served at once across all chats",
+    default=50,
+)
 @click.option(
     "-v",
     "--voice",
-    type=click.Choice(Audio.all_voices),
-    metavar="|".join(Audio.all_voices[:10]),
+    type=LazyChoice(get_voices, metavar_size=10),
     help="The default voice for speech synthesis",
     default="Brian",
 )
@@ -67,7 +134,7 @@ def bot():
 @click.option(
     "-p",
     "--provider",
-    type=click.Choice(provider_keys),
+    type=LazyChoice(get_provider_keys),
     help="Default tgpt-based llm provider",
     default="auto",
 )
@@ -76,6 +143,201 @@ def bot():
     "--database",
     help="Database engine URL e.g sqlite:////:memory:",
 )
+@click.option(
+    "--cache-size",
+    type=click.IntRange(0),
+    help="Maximum chats whose settings are cached in memory",
+    default=1000,
+)
+@click.option(
+    "--cache-ttl",
+    type=click.IntRange(0),
+    help="Seconds cached chat settings stay valid",
+    default=300,
+)
+@click.option(
+    "--response-cache",
+    is_flag=True,
+    help="Reuse responses to identical first-turn and inline prompts.",
+)
+@click.option(
+    "--response-cache-size",
+    type=click.IntRange(0),
+    help="Responses kept in memory",
+    default=1000,
+)
+@click.option(
+    "--response-cache-ttl",
+    type=click.IntRange(0),
+    help="Seconds a response is reused",
+    default=3600,
+)
+@click.option(
+    "--response-cache-persist",
+    is_flag=True,
+    help="Keep cached responses in the database too.",
+)
+@click.option(
+    "--media-cache-bytes",
+    type=click.IntRange(0),
+    help="Bytes of generated images and audio kept on disk",
+    default=0,
+)
+@click.option(
+    "--media-ttl",
+    type=click.IntRange(0),
+    help="Seconds file ids of media sent are reused (0 - forever)",
+    default=30 * 24 * 3600,
+)
+@click.option(
+    "--inline-delay",
+    type=click.FloatRange(0),
+    help="Seconds an inline query waits for a newer one before it's served",
+    default=0.5,
+)
+@click.option(
+    "--inline-deadline",
+    type=click.FloatRange(1),
+    help="Seconds to generate an inline response before answering 'still thinking'",
+    default=8,
+)
+@click.option(
+    "--inline-cache-time",
+    type=click.IntRange(0),
+    help="Seconds Telegram caches inline query results",
+    default=300,
+)
+@click.option(
+    "--temp-ttl",
+    type=click.IntRange(0),
+    help="Seconds regenerate buttons keep working (0 - forever)",
+    default=7 * 24 * 3600,
+)
+@click.option(
+    "--sweep-interval",
+    type=click.IntRange(60),
+    help="Seconds between deletions of expired rows",
+    default=3600,
+)
+@click.option(
+    "--keyboard-page-size",
+    type=click.IntRange(4, 96),
+    help="Choices per page of /voice, /provider and /awesome keyboards",
+    default=24,
+)
+@click.option(
+    "--log-max-bytes",
+    type=click.IntRange(0),
+    help="Size at which the logfile is rotated (0 - never)",
+    default=0,
+)
+@click.option(
+    "--log-rotate-when",
+    type=click.Choice(
+        ["S", "M", "H", "D", "midnight", "W0", "W1", "W2", "W3", "W4", "W5", "W6"]
+    ),
+    help="Time the logfile is rotated at, unless rotated by size",
+)
+@click.option(
+    "--log-backups",
+    type=click.IntRange(1),
+    help="Rotated logfiles kept",
+    default=5,
+)
+@click.option(
+    "--log-compress",
+    is_flag=True,
+    help="Gzip rotated logfiles",
+)
+@click.option(
+    "--log-json",
+    is_flag=True,
+    help="Log JSON lines with chat id, handler and latency fields",
+)
+@click.option(
+    "--metrics",
+    is_flag=True,
+    help="Serve Prometheus metrics at /metrics",
+)
+@click.option(
+    "--metrics-host",
+    help="Interface metrics are served on",
+    default="127.0.0.1",
+)
+@click.option(
+    "--metrics-port",
+    type=click.IntRange(1, 65535),
+    help="Port metrics are served on - workers add their index",
+    default=9464,
+)
+@click.option(
+    "--failover",
+    type=click.IntRange(0, 10),
+    help="Other providers tried when the chat's provider fails",
+    default=2,
+)
+@click.option(
+    "--hedge",
+    is_flag=True,
+    help="Race slow requests against the next best provider.",
+)
+@click.option(
+    "--stream",
+    is_flag=True,
+    help="Send AI responses as they're being generated.",
+)
+@click.option(
+    "--stream-interval",
+    type=click.FloatRange(0.5, 10),
+    help="Seconds between edits of a streamed response",
+    default=1.5,
+)
+@click.option(
+    "-w",
+    "--workers",
+    type=click.IntRange(1, 64),
+    help="Worker processes updates are sharded onto by chat",
+    default=1,
+)
+@click.option(
+    "--webhook",
+    is_flag=True,
+    help="Serve updates pushed over http instead of long polling.",
+)
+@click.option(
+    "--webhook-url",
+    help="Public url Telegram pushes updates to - registers the webhook",
+)
+@click.option(
+    "--webhook-host",
+    help="Interface the webhook server listens on",
+    default="127.0.0.1",
+)
+@click.option(
+    "--webhook-port",
+    type=click.IntRange(1, 65535),
+    help="Port the webhook server listens on",
+    default=8443,
+)
+@click.option(
+    "--webhook-path",
+    help="Url path updates are posted to",
+    default="/webhook",
+)
+@click.option(
+    "--webhook-secret",
+    help="Secret token expected in update requests - generated if not set with --webhook-url",
+)
+@click.option(
+    "--webhook-cert",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Path to TLS certificate",
+)
+@click.option(
+    "--webhook-key",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Path to TLS certificate's private key",
+)
 @click.option(
     "--skip-pending",
     is_flag=True,
@@ -86,6 +348,12 @@ def bot():
     is_flag=True,
     help="Test g4f-based providers' working statuses.",
 )
+@click.option(
+    "--g4f-check-interval",
+    type=click.IntRange(60),
+    help="Seconds between tests of g4f-based providers",
+    default=3600,
+)
 @click.help_option("-h", "--help")
 def run(**kwargs):
     """Start the bot"""
@@ -94,18 +362,36 @@ def run(**kwargs):
     modded_kwargs: dict = {}
 
     for key, value in kwargs.items():
-        modded_kwargs[key.replace("_", "-")] = str(value) if value else ""
+        # 0 is a setting of its own e.g `--failover 0`, only unset options are blank
+        modded_kwargs[key.replace("_", "-")] = "" if value is None else str(value)
 
     environ.update(modded_kwargs)
+    skip_pending = modded_kwargs.get("skip-pending").lower() == "true"
     try:
-        from pytgpt_bot.main import bot
+        if kwargs.get("workers") > 1:
+            from pytgpt_bot.workers import start_front
+
+            asyncio.run(
+                start_front(
+                    workers=kwargs.get("workers"),
+                    timeout=kwargs.get("timeout"),
+                    skip_pending=skip_pending,
+                    webhook=kwargs.get("webhook"),
+                )
+            )
+        elif kwargs.get("webhook"):
+            from pytgpt_bot.main import start_webhook
+
+            asyncio.run(start_webhook(skip_pending=skip_pending))
+        else:
+            from pytgpt_bot.main import start_polling
 
-        asyncio.run(
-            bot.infinity_polling(
-                timeout=kwargs.get("timeout"),
-                skip_pending=modded_kwargs.get("skip-pending").lower() == "true",
+            asyncio.run(
+                start_polling(
+                    timeout=kwargs.get("timeout"),
+                    skip_pending=skip_pending,
+                )
             )
-        )
     except Exception as e:
         logging.error(e.args[1] if e.args and len(e.args) > 1 else str(e))
         click.secho("[^] Quitting", fg="yellow")
@@ -116,6 +402,8 @@ def run(**kwargs):
 @click.help_option("-h", "--help")
 def clear(yes: bool):
     """Clear bot's storage directory"""
+    from pytgpt_bot.utils import bot_dir
+
     if not yes and not click.confirm(
         f"Are you sure to clear path '{bot_dir.as_posix()}'."
     ):
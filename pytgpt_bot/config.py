@@ -13,9 +13,51 @@ provider: str = environ.get("provider", "auto")
 admin_id: str = environ.get("admin-id", "")
 max_tokens: int = int(environ.get("max-tokens", 600))
 timeout: int = int(environ.get("timeout", 30))
+pool_size: int = int(environ.get("pool-size", 20))
+send_rate: int = int(environ.get("send-rate", 30))
+queue_depth: int = int(environ.get("queue-depth", 3))
+concurrency: int = int(environ.get("concurrency", 50))
 loglevel: int = int(environ.get("loglevel", 20))
 logfile = environ.get("logfile", "")
+log_max_bytes: int = int(environ.get("log-max-bytes", 0))
+log_rotate_when: str = environ.get("log-rotate-when", "") or None
+log_backups: int = int(environ.get("log-backups", 5))
+log_compress: bool = str(environ.get("log-compress", "false")).lower() == "true"
+log_json: bool = str(environ.get("log-json", "false")).lower() == "true"
+metrics: bool = str(environ.get("metrics", "false")).lower() == "true"
+metrics_host: str = environ.get("metrics-host", "127.0.0.1")
+metrics_port: int = int(environ.get("metrics-port", 9464))
 voice: str = environ.get("voice", "Brian")
+stream: bool = str(environ.get("stream", "false")).lower() == "true"
+stream_interval: float = float(environ.get("stream-interval", 1.5))
+cache_size: int = int(environ.get("cache-size", 1000))
+cache_ttl: int = int(environ.get("cache-ttl", 300))
+response_cache: bool = str(environ.get("response-cache", "false")).lower() == "true"
+response_cache_size: int = int(environ.get("response-cache-size", 1000))
+response_cache_ttl: int = int(environ.get("response-cache-ttl", 3600))
+response_cache_persist: bool = (
+    str(environ.get("response-cache-persist", "false")).lower() == "true"
+)
+media_cache_bytes: int = int(environ.get("media-cache-bytes", 0))
+media_ttl: int = int(environ.get("media-ttl", 30 * 24 * 3600))
+inline_delay: float = float(environ.get("inline-delay", 0.5))
+inline_deadline: float = float(environ.get("inline-deadline", 8))
+inline_cache_time: int = int(environ.get("inline-cache-time", 300))
+temp_ttl: int = int(environ.get("temp-ttl", 7 * 24 * 3600))
+sweep_interval: int = int(environ.get("sweep-interval", 3600))
+keyboard_page_size: int = int(environ.get("keyboard-page-size", 24))
+failover: int = int(environ.get("failover", 2))
+hedge: bool = str(environ.get("hedge", "false")).lower() == "true"
+test_g4f: bool = str(environ.get("test-g4f", "false")).lower() == "true"
+g4f_check_interval: int = int(environ.get("g4f-check-interval", 3600))
+workers: int = int(environ.get("workers", 1))
+webhook_url: str = environ.get("webhook-url", "")
+webhook_host: str = environ.get("webhook-host", "127.0.0.1")
+webhook_port: int = int(environ.get("webhook-port", 8443))
+webhook_path: str = environ.get("webhook-path", "/webhook")
+webhook_secret: str = environ.get("webhook-secret", "")
+webhook_cert: str = environ.get("webhook-cert", "")
+webhook_key: str = environ.get("webhook-key", "")
 
 assert (
     provider in provider_keys
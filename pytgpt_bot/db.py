@@ -1,12 +1,79 @@
-from pytgpt_bot.models import Chat
-from pytgpt_bot.models import session
-from pytgpt_bot.config import admin_id
+from multiprocessing.sharedctypes import Synchronized
+from pytgpt_bot.models import Chat, ChatMessage
+from pytgpt_bot.models import Session
+from pytgpt_bot.config import admin_id, cache_size, cache_ttl, max_tokens
 from pytgpt_bot.utils import get_user_id
+from pytgpt_bot.cache import LRUCache
+from pytgpt_bot.history import estimate_tokens, render_message
+from pytgpt_bot.history import get_history_budget, ConversationWindow
+from sqlalchemy import select, delete, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
 from telebot.types import Message, CallbackQuery
 
+chat_cache = LRUCache(maxsize=cache_size, ttl=cache_ttl)
+"""Hot chat settings keyed by chat id"""
+
+cached_settings: tuple[str] = ("intro", "provider", "voice", "is_active")
+
+chat_windows = LRUCache(maxsize=cache_size, ttl=cache_ttl)
+"""Conversation windows keyed by chat id"""
+
+history_batch_size: int = 50
+
+add_turn_attempts: int = 5
+"""Times a turn is written when other turns of the chat take its seq"""
+
+shared_generation: Synchronized = None
+"""Counter shared by worker processes, bumped whenever their caches are invalidated"""
+
+seen_generation: int = 0
+"""Value of `shared_generation` the caches of this process are up to date with"""
+
+
+def share_invalidation(generation: Synchronized) -> None:
+    """Have the chat caches of this process invalidated along with other workers'
+
+    Args:
+        generation (multiprocessing.Value): Counter shared by the workers.
+    """
+    global shared_generation, seen_generation
+    shared_generation = generation
+    seen_generation = generation.value
+
+
+def invalidate_caches() -> None:
+    """Drop the cached chat settings and windows - of all workers"""
+    global seen_generation
+    chat_cache.clear()
+    chat_windows.clear()
+    if shared_generation is not None:
+        with shared_generation.get_lock():
+            shared_generation.value += 1
+            seen_generation = shared_generation.value
+
+
+def sync_caches() -> None:
+    """Drop the cached chat settings and windows if another worker invalidated them"""
+    global seen_generation
+    if shared_generation is None or shared_generation.value == seen_generation:
+        return
+    chat_cache.clear()
+    chat_windows.clear()
+    seen_generation = shared_generation.value
+
 
 class User:
-    """User dummy model"""
+    """User dummy model
+
+    Owns a database session for the lifetime of a single update.
+
+    ```python
+    async with User(message) as user:
+        user.chat.voice = "Brian"
+    ```
+    """
 
     def __init__(self, message: Message | CallbackQuery = None, user_id: int = None):
         """Constructor
@@ -16,22 +83,197 @@ class User:
             user_id (int): User id. Defaults to None
         """
 
-        id = get_user_id(message, user_id)
+        self.id: str = get_user_id(message, user_id)
+        self.session: AsyncSession = None
+        self.chat: Chat = None
 
-        chat = session.query(Chat).filter_by(id=id).first()
+    async def open(self) -> "User":
+        """Start a session and load the chat, creating it if it doesn't exist
+
+        The session is closed again if the chat can't be loaded.
+        """
+        self.session = Session()
+        try:
+            await self.load()
+        except BaseException as e:
+            await self.close(e)
+            raise
+        return self
+
+    async def load(self) -> None:
+        """Load the chat into the session, creating it if it doesn't exist"""
+        sync_caches()
+        settings: dict = chat_cache.get(self.id)
+        if settings:
+            # Attach cached settings without querying. The other columns stay
+            # unloaded - an AsyncSession can't lazy load them on access, so
+            # read them with `await session.refresh(chat, [...])` first
+            chat = Chat(id=self.id, **settings)
+            make_transient_to_detached(chat)
+            self.chat = await self.session.merge(chat, load=False)
+            return
+
+        chat = await self.session.get(Chat, self.id)
         if chat:
             # chat exist
             self.chat = chat
         else:
-            self.chat = Chat(id=id)
-            session.add(self.chat)
-            session.commit()  # For the sake of async
+            self.chat = Chat(id=self.id)
+            self.session.add(self.chat)
+        try:
+            # Release the connection while the update is being served
+            await self.session.commit()
+        except IntegrityError:
+            # Created by another update of the chat in the meantime
+            await self.session.rollback()
+            self.chat = await self.session.get(Chat, self.id)
+            await self.session.commit()
+        chat_cache.set(self.id, self.settings)
+
+    async def close(self, exception: Exception = None) -> None:
+        """Persist changes made to the chat and end the session
+
+        Args:
+            exception (Exception, optional): Error raised while serving the update. Defaults to None.
+        """
+        if self.session is None:
+            return
+        try:
+            if exception is None:
+                is_deleted = self.chat in self.session.deleted
+                is_modified = self.session.is_modified(self.chat)
+                await self.session.commit()
+                if is_deleted:
+                    chat_cache.pop(self.id)
+                elif is_modified:
+                    # write-through
+                    chat_cache.set(self.id, self.settings)
+            else:
+                await self.session.rollback()
+        finally:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self) -> "User":
+        return await self.open()
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        await self.close(exc_value)
+
+    @property
+    def settings(self) -> dict:
+        """Chat settings that are cached"""
+        return {key: getattr(self.chat, key) for key in cached_settings}
 
     @property
     def is_admin(self) -> bool:
         """Checks user admin status"""
         return self.chat.id == admin_id
 
-    def delete(self) -> None:
+    async def delete(self) -> None:
         """Delete user"""
-        session.delete(self.chat)
+        await self.session.execute(delete(ChatMessage).filter_by(chat_id=self.id))
+        await self.session.delete(self.chat)
+        chat_windows.pop(self.id)
+
+    async def get_history(self, budget: int = None) -> tuple[list[ChatMessage], bool]:
+        """Latest chat messages whose token estimates fit the budget
+
+        Args:
+            budget (int, optional): Maximum tokens. Defaults to None (everything).
+
+        Returns:
+            tuple[list[ChatMessage], bool]: Messages in chronological order and
+                whether older ones were left out.
+        """
+        messages: list[ChatMessage] = []
+        used: int = 0
+        offset: int = 0
+        # Short-lived session so that no connection is held during the update
+        async with Session() as session:
+            while True:
+                batch = (
+                    await session.scalars(
+                        select(ChatMessage)
+                        .filter_by(chat_id=self.id)
+                        .order_by(ChatMessage.seq.desc())
+                        .offset(offset)
+                        .limit(history_batch_size)
+                    )
+                ).all()
+                for message in batch:
+                    used += message.token_estimate
+                    if budget is not None and used > budget:
+                        return messages[::-1], True
+                    messages.append(message)
+                if len(batch) < history_batch_size:
+                    return messages[::-1], False
+                offset += history_batch_size
+
+    async def add_turn(self, prompt: str, response: str) -> list[ChatMessage]:
+        """Append a prompt and its response to the chat history
+
+        Args:
+            prompt (str): User prompt.
+            response (str): LLM response.
+
+        Returns:
+            list[ChatMessage]: Messages added.
+        """
+        for attempt in range(add_turn_attempts):
+            messages: list[ChatMessage] = []
+            async with Session() as session:
+                last_seq = await session.scalar(
+                    select(func.max(ChatMessage.seq)).filter_by(chat_id=self.id)
+                )
+                seq = -1 if last_seq is None else last_seq
+                for role, content in (("user", prompt), ("llm", response)):
+                    seq += 1
+                    messages.append(
+                        ChatMessage(
+                            chat_id=self.id,
+                            seq=seq,
+                            role=role,
+                            content=content,
+                            token_estimate=estimate_tokens(
+                                render_message(role, content)
+                            ),
+                        )
+                    )
+                session.add_all(messages)
+                try:
+                    await session.commit()
+                    break
+                except IntegrityError:
+                    # Another turn of the chat took the same seq e.g an inline query
+                    await session.rollback()
+                    if attempt + 1 == add_turn_attempts:
+                        raise
+        window: ConversationWindow = chat_windows.get(self.id)
+        if window:
+            for message in messages:
+                window.append(message.role, message.content, message.token_estimate)
+        return messages
+
+    async def get_window(self) -> ConversationWindow:
+        """Rolling window of the chat's latest messages
+
+        Returns:
+            ConversationWindow: Window sized for the chat's intro.
+        """
+        budget = get_history_budget("", self.chat.intro, max_tokens)
+        window: ConversationWindow = chat_windows.get(self.id)
+        if window and (budget <= window.budget or not window.truncated):
+            window.resize(budget)
+            return window
+        messages, truncated = await self.get_history(budget)
+        window = ConversationWindow(budget, messages, truncated)
+        chat_windows.set(self.id, window)
+        return window
+
+    async def count_messages(self) -> int:
+        """Total messages in the chat history"""
+        async with Session() as session:
+            return await session.scalar(
+                select(func.count()).select_from(ChatMessage).filter_by(chat_id=self.id)
+            )
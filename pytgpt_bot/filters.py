@@ -1,6 +1,6 @@
 from telebot.asyncio_filters import SimpleCustomFilter
-from telebot import types, TeleBot
-from telebot.util import extract_command, extract_arguments
+from telebot import types
+from telebot.util import extract_command
 from pytgpt_bot.db import User
 from pytgpt_bot.config import admin_ids
 from pytgpt_bot.utils import get_user_id
@@ -13,8 +13,9 @@ class IsActiveFilter(SimpleCustomFilter):
 
     async def check(self, message: types.Message | types.CallbackQuery):
         if isinstance(message, types.CallbackQuery):
-            return User(message.message).chat.is_active
-        return User(message).chat.is_active
+            async with User(message.message) as user:
+                return user.chat.is_active
+        return message.user.chat.is_active
 
 
 class IsBotOwnerFilter(SimpleCustomFilter):
@@ -23,7 +24,7 @@ class IsBotOwnerFilter(SimpleCustomFilter):
     key: str = "is_bot_owner"
 
     async def check(self, message: types.Message):
-        return str(User(message).chat.id) in admin_ids
+        return message.user.id in admin_ids
 
 
 class IsAdminFilter(SimpleCustomFilter):
@@ -71,11 +72,11 @@ class IsBotTaggedFilter(SimpleCustomFilter):
 
     key: str = "is_bot_tagged"
 
-    def __init__(self, bot_info: types.User):
+    def __init__(self, bot_info: types.User = None):
         """Constructor
 
         Args:
-            bot_info (types.User): Bot info.
+            bot_info (types.User, optional): Bot info - set on startup. Defaults to None.
         """
         self.bot_info = bot_info
 
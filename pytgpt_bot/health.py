@@ -0,0 +1,179 @@
+import asyncio
+import json
+import logging
+from pathlib import Path
+from time import time, monotonic
+from pytgpt.gpt4free import AsyncGPT4FREE
+from pytgpt_bot.utils import bot_dir
+
+path_to_health_file = bot_dir / "g4f-health.json"
+
+
+def is_valid_response(text: str) -> bool:
+    """Checks a test response the way `pytgpt` does"""
+    return (
+        isinstance(text, str)
+        and len(text.strip()) > 2
+        and "</" not in text
+        and ":" not in text
+    )
+
+
+class ProviderHealth:
+    """Working statuses of g4f providers
+
+    Providers are tested concurrently in the background and the results are
+    saved to disk, so a restart picks up where the last run left off.
+    """
+
+    def __init__(
+        self,
+        path: Path = path_to_health_file,
+        interval: int = 3600,
+        test_at_once: int = 5,
+        timeout: int = 20,
+    ):
+        """Constructor
+
+        Args:
+            path (Path, optional): File results are saved to. Defaults to path_to_health_file.
+            interval (int, optional): Seconds between checks. Defaults to 3600.
+            test_at_once (int, optional): Providers tested at once. Defaults to 5.
+            timeout (int, optional): Seconds each test can take. Defaults to 20.
+        """
+        self.path = path
+        self.interval = interval
+        self.test_at_once = test_at_once
+        self.timeout = timeout
+        self.statuses: dict[str, dict] = {}
+        self.__task: asyncio.Task = None
+
+    def load(self) -> None:
+        """Read saved results"""
+        try:
+            self.statuses = json.loads(self.path.read_text())["providers"]
+        except (FileNotFoundError, json.JSONDecodeError, KeyError) as e:
+            logging.debug("No saved g4f provider statuses - %s", e)
+
+    def save(self) -> None:
+        """Write results to disk"""
+        temp_path = self.path.with_suffix(".tmp")
+        temp_path.write_text(json.dumps({"providers": self.statuses}, indent=2))
+        temp_path.replace(self.path)
+
+    def seed(self, providers: list[str]) -> None:
+        """Mark providers as working without testing them
+
+        Args:
+            providers (list[str]): Provider names.
+        """
+        for name in providers:
+            self.statuses[name] = dict(working=True, latency=None, checked_on=None)
+
+    @property
+    def healthy(self) -> list[str]:
+        """Working providers, fastest first"""
+        working = [
+            (status["latency"] or 0, name)
+            for name, status in self.statuses.items()
+            if status["working"]
+        ]
+        return [name for _, name in sorted(working)]
+
+    @property
+    def checked_on(self) -> float:
+        """Time of the oldest check"""
+        return min(
+            (status["checked_on"] or 0 for status in self.statuses.values()),
+            default=0,
+        )
+
+    def resolve(self, name: str, fallback: str) -> str:
+        """Provider to use in place of one that has stopped working
+
+        Args:
+            name (str): Chosen provider.
+            fallback (str): Provider used when the chosen one isn't working.
+
+        Returns:
+            str: Provider name.
+        """
+        status = self.statuses.get(name)
+        if status is None or status["working"]:
+            return name
+        logging.debug(
+            "Provider [%s] isn't working, falling back to [%s]", name, fallback
+        )
+        return fallback
+
+    async def check(self, name: str, semaphore: asyncio.Semaphore) -> None:
+        """Test a provider"""
+        async with semaphore:
+            started = monotonic()
+            try:
+                client = AsyncGPT4FREE(
+                    provider=name, is_conversation=False, timeout=self.timeout
+                )
+                text = await asyncio.wait_for(client.chat("hello there"), self.timeout)
+                working = is_valid_response(text)
+            except Exception as e:
+                logging.debug("Provider [%s] failed test - %s", name, e)
+                working = False
+        self.statuses[name] = dict(
+            working=working,
+            latency=round(monotonic() - started, 3) if working else None,
+            checked_on=time(),
+        )
+
+    async def check_all(self) -> None:
+        """Test all g4f providers and save the results"""
+        from pytgpt.gpt4free.utils import TestProviders
+
+        candidates: list[str] = await asyncio.to_thread(
+            lambda: TestProviders(quiet=True, do_log=False).working_providers
+        )
+        started = monotonic()
+        semaphore = asyncio.Semaphore(self.test_at_once)
+        await asyncio.gather(*(self.check(name, semaphore) for name in candidates))
+        # Forget providers that are no longer listed
+        self.statuses = {name: self.statuses[name] for name in candidates}
+        self.save()
+        logging.info(
+            "Tested %s g4f providers in %.2fs - working : %s",
+            len(candidates),
+            monotonic() - started,
+            ", ".join(self.healthy) or "none",
+        )
+
+    async def run(self, check: bool = True) -> None:
+        """Keep statuses fresh until cancelled
+
+        Args:
+            check (bool, optional): Test providers when results are due, otherwise
+                re-read results saved by another process. Defaults to True.
+        """
+        while True:
+            if not check:
+                await asyncio.sleep(self.interval)
+                self.load()
+                continue
+            due = self.checked_on + self.interval - time()
+            if due > 0:
+                await asyncio.sleep(due)
+                continue
+            try:
+                await self.check_all()
+            except Exception as e:
+                logging.error("Failed to check g4f providers - %s", e)
+                await asyncio.sleep(self.interval)
+
+    def start(self, check: bool = True) -> None:
+        """Run in the background"""
+        self.__task = asyncio.create_task(self.run(check))
+
+    async def stop(self) -> None:
+        """Stop running in the background"""
+        if self.__task:
+            self.__task.cancel()
+            await asyncio.gather(self.__task, return_exceptions=True)
+            self.__task = None
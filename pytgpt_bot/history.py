@@ -0,0 +1,166 @@
+import re
+from math import ceil
+from collections import deque
+from itertools import islice
+from typing import Iterable
+from pytgpt.utils import Conversation
+
+history_format: dict[str, str] = {"user": "\nUser : %s", "llm": "\nLLM :%s"}
+"""Rendering of each role - mirrors `Conversation.history_format`"""
+
+history_offset: int = Conversation().history_offset
+"""Maximum characters of intro, history and completion combined"""
+
+chars_per_token: int = 4
+
+legacy_history_pattern = re.compile(
+    r"\nUser : (.*?)\nLLM :(.*?)(?=\nUser : |\Z)", re.DOTALL
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough number of tokens in a text
+
+    Args:
+        text (str): Text.
+
+    Returns:
+        int: Token estimate.
+    """
+    return ceil(len(text) / chars_per_token)
+
+
+def render_message(role: str, content: str) -> str:
+    """Render a message the way `Conversation` lays out history
+
+    Args:
+        role (str): user|llm
+        content (str): Message text.
+
+    Returns:
+        str: Rendered message.
+    """
+    return history_format[role] % content
+
+
+def render_history(messages: Iterable) -> str:
+    """Render messages (objects with `role` and `content`) as a chat history text"""
+    return "".join(
+        render_message(message.role, message.content) for message in messages
+    )
+
+
+def split_history(history: str) -> list[tuple[str, str]]:
+    """Split a legacy history text into (role, content) messages
+
+    Args:
+        history (str): Chat history as rendered by `Conversation`.
+
+    Returns:
+        list[tuple[str, str]]: Messages in chronological order.
+    """
+    messages: list[tuple[str, str]] = []
+    for prompt, response in legacy_history_pattern.findall(history or ""):
+        messages.append(("user", prompt))
+        messages.append(("llm", response))
+    return messages
+
+
+def get_history_budget(prompt: str, intro: str, max_tokens: int) -> int:
+    """Tokens of history that fit alongside the intro, prompt and completion
+
+    Args:
+        prompt (str): New user prompt.
+        intro (str): Chat intro.
+        max_tokens (int): Tokens to be sampled upon completion.
+
+    Returns:
+        int: Token budget for history.
+    """
+    used = (
+        max_tokens
+        + len(intro)
+        + len(render_message("user", prompt))
+        + len(render_message("llm", ""))
+    )
+    return max(history_offset - used, 0) // chars_per_token
+
+
+class ConversationWindow:
+    """Rolling window of the latest chat messages that fit a token budget
+
+    Messages are rendered and measured once as they're appended and the oldest
+    ones are evicted from the head, so assembling a prompt doesn't depend on the
+    length of the whole chat history.
+    """
+
+    def __init__(self, budget: int, messages: Iterable = (), truncated: bool = False):
+        """Constructor
+
+        Args:
+            budget (int): Maximum tokens of history to keep.
+            messages (Iterable[ChatMessage], optional): Messages in chronological order. Defaults to ().
+            truncated (bool, optional): Older messages were left out. Defaults to False.
+        """
+        self.budget = budget
+        self.truncated = truncated
+        self.tokens: int = 0
+        self.messages: deque[tuple[str, int]] = deque()
+        for message in messages:
+            self.append(message.role, message.content, message.token_estimate)
+
+    def append(self, role: str, content: str, tokens: int = None) -> None:
+        """Add a message to the tail of the window
+
+        Args:
+            role (str): user|llm
+            content (str): Message text.
+            tokens (int, optional): Token estimate of the rendered message. Defaults to None.
+        """
+        rendered = render_message(role, content)
+        tokens = estimate_tokens(rendered) if tokens is None else tokens
+        self.messages.append((rendered, tokens))
+        self.tokens += tokens
+        self.resize(self.budget)
+
+    def resize(self, budget: int) -> None:
+        """Change the budget, evicting the oldest messages that no longer fit
+
+        Args:
+            budget (int): Maximum tokens of history to keep.
+        """
+        self.budget = budget
+        while self.tokens > self.budget and self.messages:
+            _, tokens = self.messages.popleft()
+            self.tokens -= tokens
+            self.truncated = True
+
+    def gen_complete_prompt(self, prompt: str, intro: str, max_tokens: int) -> str:
+        """Generate the incomplete conversation sent to the provider
+
+        Args:
+            prompt (str): New user prompt.
+            intro (str): Chat intro.
+            max_tokens (int): Tokens to be sampled upon completion.
+
+        Returns:
+            str: Conversation prompt.
+        """
+        budget = get_history_budget(prompt, intro, max_tokens)
+        tokens = self.tokens
+        truncated = self.truncated
+        skip = 0
+        # Long prompts leave less room - skip the oldest messages without evicting them
+        for _, message_tokens in self.messages:
+            if tokens <= budget:
+                break
+            tokens -= message_tokens
+            skip += 1
+            truncated = True
+        return (
+            intro
+            + ("... " if truncated else "")
+            + "".join(rendered for rendered, _ in islice(self.messages, skip, None))
+            + render_message("user", prompt)
+            + render_message("llm", "")
+        )
@@ -0,0 +1,182 @@
+from base64 import urlsafe_b64encode
+from difflib import get_close_matches
+from hashlib import blake2b
+import telebot
+from pytgpt_bot.callbacks import max_callback_bytes
+from pytgpt_bot.search import TrigramIndex
+from pytgpt_bot.utils import get_user_id
+
+page_namespace: str = "page"
+"""Namespace of page navigation callbacks"""
+
+
+class PagedKeyboard:
+    """Inline keyboard of choices split into pages
+
+    Pages are built and serialized once - whenever the choices change - and
+    sent as is. Buttons carry `<namespace>:<choice>`, the chat they're for is
+    the one the keyboard is sent to. Choices too long for `callback_data` are
+    referred to by a hash of theirs, `<namespace>:~<key>`, which stays the
+    same across restarts and changes of the other choices.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        choices: list[str],
+        page_size: int = 24,
+        columns: int = 3,
+        index: TrigramIndex = None,
+    ):
+        """Constructor
+
+        Args:
+            namespace (str): Callback namespace of the choices.
+            choices (list[str]): Choices listed.
+            page_size (int, optional): Choices per page. Defaults to 24.
+            columns (int, optional): Choices per row. Defaults to 3.
+            index (TrigramIndex, optional): Searched in place of the choices. Defaults to None.
+        """
+        self.namespace = namespace
+        self.page_size = page_size
+        self.columns = columns
+        self.index = index
+        self.choices: tuple[str] = ()
+        self.pages: list[str] = []
+        self.update(choices)
+
+    def update(self, choices: list[str]) -> None:
+        """Rebuild the pages if the choices have changed"""
+        choices = tuple(choices)
+        if choices == self.choices and self.pages:
+            return
+        self.choices = choices
+        self.__keys = {self.make_key(choice): choice for choice in choices}
+        self.__choices = frozenset(choices)
+        total = max(1, -(-len(choices) // self.page_size))
+        self.pages = [
+            self.render(
+                choices[index * self.page_size : (index + 1) * self.page_size],
+                index,
+                total,
+            )
+            for index in range(total)
+        ]
+
+    def __contains__(self, choice: str) -> bool:
+        return choice in self.__choices
+
+    @staticmethod
+    def make_key(choice: str) -> str:
+        """Short key of a choice"""
+        return urlsafe_b64encode(
+            blake2b(choice.encode(), digest_size=6).digest()
+        ).decode()
+
+    def make_callback_data(self, choice: str) -> str:
+        data = f"{self.namespace}:{choice}"
+        if len(data.encode()) > max_callback_bytes:
+            return f"{self.namespace}:~{self.make_key(choice)}"
+        return data
+
+    def render(self, choices: list[str], index: int = 0, total: int = 1) -> str:
+        """Serialized markup of a page
+
+        Args:
+            choices (list[str]): Choices on the page.
+            index (int, optional): Page index. Defaults to 0.
+            total (int, optional): Number of pages. Defaults to 1.
+
+        Returns:
+            str: Markup json.
+        """
+        markup = telebot.types.InlineKeyboardMarkup(row_width=self.columns)
+        markup.add(
+            *(
+                telebot.types.InlineKeyboardButton(
+                    choice, callback_data=self.make_callback_data(choice)
+                )
+                for choice in choices
+            )
+        )
+        if total > 1:
+            make_nav = lambda text, page: telebot.types.InlineKeyboardButton(
+                text, callback_data=f"{page_namespace}:{self.namespace}:{page}"
+            )
+            markup.row(
+                make_nav("◀️", (index - 1) % total),
+                make_nav(f"{index + 1}/{total}", index),
+                make_nav("▶️", (index + 1) % total),
+            )
+        return markup.to_json()
+
+    def page(self, index: int = 0) -> str:
+        """Serialized markup of a page, wrapping around"""
+        return self.pages[index % len(self.pages)]
+
+    def search(self, query: str) -> list[str]:
+        """Choices matching a query - prefix matches, then substring, then fuzzy ones
+        unless an index is searched
+
+        Args:
+            query (str): Text searched for.
+
+        Returns:
+            list[str]: Choices matched.
+        """
+        if self.index:
+            return [
+                choice
+                for choice in self.index.search(query, limit=self.page_size)
+                if choice in self
+            ]
+        query = query.lower()
+        lowered = {choice.lower(): choice for choice in self.choices}
+        prefixed = [choice for key, choice in lowered.items() if key.startswith(query)]
+        contained = [
+            choice
+            for key, choice in lowered.items()
+            if query in key and not key.startswith(query)
+        ]
+        matched = set(prefixed + contained)
+        fuzzy = [
+            lowered[key]
+            for key in get_close_matches(query, lowered, n=self.page_size, cutoff=0.6)
+            if lowered[key] not in matched
+        ]
+        return prefixed + contained + fuzzy
+
+    def render_search(self, query: str) -> tuple[str | None, int]:
+        """Serialized markup of the choices matching a query
+
+        Returns:
+            tuple[str | None, int]: Markup json of the first `page_size` matches - None
+                when nothing matches - and the number of matches.
+        """
+        matches = self.search(query)
+        if not matches:
+            return None, 0
+        return self.render(matches[: self.page_size]), len(matches)
+
+    def parse(
+        self, call: telebot.types.CallbackQuery, payload: str
+    ) -> tuple[str, str] | None:
+        """Choice made and the id of the user it's for
+
+        Args:
+            call (telebot.types.CallbackQuery): Callback query.
+            payload (str): `<choice>`, `~<key>` or legacy `<choice>:<user_id>`.
+
+        Returns:
+            tuple[str, str] | None: Choice and user id - None when the choice is
+                no longer listed e.g buttons of a provider that stopped working.
+        """
+        user_id = get_user_id(user_id=call.message.chat.id)
+        if payload in self:
+            return payload, user_id
+        if payload.startswith("~") and payload[1:] in self.__keys:
+            return self.__keys[payload[1:]], user_id
+        choice, _, user_id = payload.rpartition(":")
+        if choice in self and user_id.isdigit():
+            # Buttons made before keyboards were paginated
+            return choice, user_id
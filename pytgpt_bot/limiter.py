@@ -0,0 +1,276 @@
+import asyncio
+import logging
+from contextvars import ContextVar
+from heapq import heappush, heappop
+from itertools import count
+from time import monotonic
+from typing import Awaitable, Callable
+from telebot.async_telebot import AsyncTeleBot
+from telebot.asyncio_helper import ApiTelegramException
+from pytgpt_bot import metrics
+
+INTERACTIVE: int = 0
+BULK: int = 10
+
+max_chat_buckets: int = 10000
+
+send_priority: ContextVar[int] = ContextVar("send_priority", default=INTERACTIVE)
+"""Priority of sends made in the current context - lower goes first"""
+
+
+class TokenBucket:
+    """Refills `rate` tokens per second up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float):
+        """Constructor
+
+        Args:
+            rate (float): Tokens added per second.
+            capacity (float): Maximum tokens held.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens: float = capacity
+        self.updated: float = monotonic()
+
+    def __refill(self) -> None:
+        now = monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        """Seconds until a token is available"""
+        self.__refill()
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self) -> None:
+        """Take a token"""
+        self.__refill()
+        self.tokens -= 1
+
+    def pause(self, seconds: float) -> None:
+        """Withhold tokens for a while"""
+        self.__refill()
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+
+class SendScheduler:
+    """Paces outbound messages within Telegram's flood limits
+
+    Every chat has its own bucket (~1 message/s in private chats, 20/min in
+    groups) and all chats share a global one (~30 messages/s). When the global
+    bucket runs dry, waiting sends are released in order of priority. Requests
+    not bound to a chat's messages e.g answers to callback queries only take
+    from the global bucket.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30,
+        chat_rate: float = 1,
+        group_rate: float = 20 / 60,
+        group_capacity: float = 20,
+        retries: int = 3,
+    ):
+        """Constructor
+
+        Args:
+            global_rate (float, optional): Messages per second across all chats. Defaults to 30.
+            chat_rate (float, optional): Messages per second in a private chat. Defaults to 1.
+            group_rate (float, optional): Messages per second in a group. Defaults to 20/60.
+            group_capacity (float, optional): Burst allowed in a group. Defaults to 20.
+            retries (int, optional): Resends after "Too Many Requests". Defaults to 3.
+        """
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.group_capacity = group_capacity
+        self.retries = retries
+        self.chat_buckets: dict[str, TokenBucket] = {}
+        self.__waiters: list[tuple[int, int, asyncio.Future]] = []
+        self.__counter = count()
+        self.__pump: asyncio.Task = None
+
+    def __chat_bucket(self, chat_id: int | str) -> TokenBucket:
+        chat_id = str(chat_id)
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) >= max_chat_buckets:
+                # Forget chats whose buckets have refilled
+                self.chat_buckets = {
+                    key: value
+                    for key, value in self.chat_buckets.items()
+                    if value.delay() or value.tokens < value.capacity
+                }
+            bucket = (
+                TokenBucket(self.group_rate, self.group_capacity)
+                if chat_id.startswith("-")
+                else TokenBucket(self.chat_rate, 1)
+            )
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def __release_waiters(self) -> None:
+        while self.__waiters:
+            delay = self.global_bucket.delay()
+            if delay:
+                await asyncio.sleep(delay)
+                continue
+            _, _, future = heappop(self.__waiters)
+            if not future.done():
+                self.global_bucket.consume()
+                future.set_result(None)
+
+    async def acquire(
+        self, chat_id: int | str = None, priority: int = INTERACTIVE
+    ) -> None:
+        """Wait for a chance to send a message
+
+        Args:
+            chat_id (int | str, optional): Target chat. Defaults to None (global bucket only).
+            priority (int, optional): Lower is served first. Defaults to INTERACTIVE.
+        """
+        if chat_id is not None:
+            bucket = self.__chat_bucket(chat_id)
+            while delay := bucket.delay():
+                await asyncio.sleep(delay)
+            bucket.consume()
+
+        if not self.__waiters and not self.global_bucket.delay():
+            self.global_bucket.consume()
+            return
+        future = asyncio.get_running_loop().create_future()
+        heappush(self.__waiters, (priority, next(self.__counter), future))
+        if self.__pump is None or self.__pump.done():
+            self.__pump = asyncio.create_task(self.__release_waiters())
+        await future
+
+    @property
+    def waiting(self) -> int:
+        """Sends waiting for the global bucket"""
+        return len(self.__waiters)
+
+    async def send(
+        self,
+        chat_id: int | str,
+        request: Callable[[], Awaitable],
+        method: str = "send_message",
+    ):
+        """Make a send request once allowed, retrying after flood waits
+
+        Args:
+            chat_id (int | str): Target chat - None for requests not bound to one.
+            request (Callable[[], Awaitable]): Makes the api call.
+            method (str, optional): Api method, for metrics. Defaults to "send_message".
+
+        Returns:
+            Any: Api response.
+        """
+        for attempt in range(self.retries + 1):
+            started = monotonic()
+            await self.acquire(chat_id, send_priority.get())
+            metrics.send_wait_seconds.observe(monotonic() - started, method)
+            try:
+                with metrics.send_seconds.time(method):
+                    return await request()
+            except ApiTelegramException as e:
+                if e.error_code != 429 or attempt == self.retries:
+                    raise
+                retry_after = (e.result_json.get("parameters") or {}).get(
+                    "retry_after", 1
+                )
+                logging.warning(
+                    "Flood limit hit on chat [%s], retrying after %ss",
+                    chat_id,
+                    retry_after,
+                )
+                # Telegram might be limiting the bot as a whole
+                self.global_bucket.pause(retry_after)
+                if chat_id is not None:
+                    self.__chat_bucket(chat_id).pause(retry_after)
+
+
+class RateLimitedTeleBot(AsyncTeleBot):
+    """AsyncTeleBot whose outbound messages go through a `SendScheduler`"""
+
+    def __init__(self, *args, scheduler: SendScheduler = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scheduler = scheduler or SendScheduler()
+
+    async def send_message(self, chat_id: int | str, *args, **kwargs):
+        send_message = super().send_message
+        return await self.scheduler.send(
+            chat_id, lambda: send_message(chat_id, *args, **kwargs)
+        )
+
+    async def send_photo(self, chat_id: int | str, *args, **kwargs):
+        send_photo = super().send_photo
+        return await self.scheduler.send(
+            chat_id, lambda: send_photo(chat_id, *args, **kwargs), "send_photo"
+        )
+
+    async def send_audio(self, chat_id: int | str, *args, **kwargs):
+        send_audio = super().send_audio
+        return await self.scheduler.send(
+            chat_id, lambda: send_audio(chat_id, *args, **kwargs), "send_audio"
+        )
+
+    async def send_document(self, chat_id: int | str, *args, **kwargs):
+        send_document = super().send_document
+        return await self.scheduler.send(
+            chat_id, lambda: send_document(chat_id, *args, **kwargs), "send_document"
+        )
+
+    async def edit_message_text(
+        self, text: str, chat_id: int | str = None, *args, **kwargs
+    ):
+        edit_message_text = super().edit_message_text
+        if chat_id is None:
+            # inline message
+            return await edit_message_text(text, chat_id, *args, **kwargs)
+        return await self.scheduler.send(
+            chat_id,
+            lambda: edit_message_text(text, chat_id, *args, **kwargs),
+            "edit_message_text",
+        )
+
+    async def edit_message_reply_markup(
+        self, chat_id: int | str = None, *args, **kwargs
+    ):
+        edit_message_reply_markup = super().edit_message_reply_markup
+        if chat_id is None:
+            # inline message
+            return await edit_message_reply_markup(chat_id, *args, **kwargs)
+        return await self.scheduler.send(
+            chat_id,
+            lambda: edit_message_reply_markup(chat_id, *args, **kwargs),
+            "edit_message_reply_markup",
+        )
+
+    # Requests below don't post messages, so they don't hold up the chat's
+
+    async def send_chat_action(self, *args, **kwargs):
+        send_chat_action = super().send_chat_action
+        return await self.scheduler.send(
+            None, lambda: send_chat_action(*args, **kwargs), "send_chat_action"
+        )
+
+    async def delete_message(self, *args, **kwargs):
+        delete_message = super().delete_message
+        return await self.scheduler.send(
+            None, lambda: delete_message(*args, **kwargs), "delete_message"
+        )
+
+    async def answer_callback_query(self, *args, **kwargs):
+        answer_callback_query = super().answer_callback_query
+        return await self.scheduler.send(
+            None,
+            lambda: answer_callback_query(*args, **kwargs),
+            "answer_callback_query",
+        )
+
+    async def answer_inline_query(self, *args, **kwargs):
+        answer_inline_query = super().answer_inline_query
+        return await self.scheduler.send(
+            None, lambda: answer_inline_query(*args, **kwargs), "answer_inline_query"
+        )
@@ -0,0 +1,242 @@
+import atexit
+import gzip
+import json
+import logging
+import os
+import re
+import shutil
+from datetime import datetime
+from io import BytesIO, SEEK_END
+from logging.handlers import (
+    QueueHandler,
+    QueueListener,
+    RotatingFileHandler,
+    TimedRotatingFileHandler,
+)
+from queue import Queue
+from typing import Iterator
+
+log_format: str = "%(asctime)s : %(levelname)s - %(message)s"
+log_datefmt: str = "%d-%b-%Y %H:%M:%S"
+
+record_start = re.compile(r"^\d{2}-\w{3}-\d{4} \d{2}:\d{2}:\d{2} : (\w+) - ")
+"""Matches the first line of a record in `log_format`"""
+
+log_levels: tuple[str] = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+
+json_fields: tuple[str] = ("chat_id", "handler", "latency")
+"""Fields taken from records' `extra` into JSON lines"""
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as JSON lines"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = dict(
+            time=datetime.fromtimestamp(record.created).isoformat(
+                timespec="milliseconds"
+            ),
+            level=record.levelname,
+            message=record.getMessage(),
+        )
+        for field in json_fields:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def rotate_compressed(source: str, destination: str) -> None:
+    """Gzip a rotated log file"""
+    with open(source, "rb") as uncompressed, gzip.open(destination, "wb") as compressed:
+        shutil.copyfileobj(uncompressed, compressed)
+    os.remove(source)
+
+
+def setup_logging(
+    level: int = logging.INFO,
+    logfile: str = None,
+    max_bytes: int = 0,
+    when: str = None,
+    backups: int = 5,
+    compress: bool = False,
+    json_lines: bool = False,
+    queue: Queue = None,
+) -> QueueListener | None:
+    """Log through a queue, writing records from a background thread
+
+    Handlers only put records on the queue, so the event loop never waits on
+    the disk. Processes whose root logger already logs to a queue - workers -
+    are left as they are.
+
+    Args:
+        level (int, optional): Log level. Defaults to logging.INFO.
+        logfile (str, optional): File to log to - stderr if not set. Defaults to None.
+        max_bytes (int, optional): Size at which the file is rotated, 0 disables it. Defaults to 0.
+        when (str, optional): Time the file is rotated at e.g midnight - see `TimedRotatingFileHandler`. Defaults to None.
+        backups (int, optional): Rotated files kept. Defaults to 5.
+        compress (bool, optional): Gzip rotated files. Defaults to False.
+        json_lines (bool, optional): Log JSON lines. Defaults to False.
+        queue (Queue, optional): Queue records are put on - one shared with other processes. Defaults to None.
+
+    Returns:
+        QueueListener | None: Listener writing the records, started.
+    """
+    root = logging.getLogger()
+    if any(isinstance(handler, QueueHandler) for handler in root.handlers):
+        return
+    if not logfile:
+        handler = logging.StreamHandler()
+    elif max_bytes:
+        handler = RotatingFileHandler(
+            logfile, maxBytes=max_bytes, backupCount=backups, encoding="utf-8"
+        )
+    elif when:
+        handler = TimedRotatingFileHandler(
+            logfile, when=when, backupCount=backups, encoding="utf-8"
+        )
+    else:
+        handler = logging.FileHandler(logfile, encoding="utf-8")
+    if compress and (max_bytes or when):
+        handler.namer = lambda name: f"{name}.gz"
+        handler.rotator = rotate_compressed
+    handler.setFormatter(
+        JsonFormatter() if json_lines else logging.Formatter(log_format, log_datefmt)
+    )
+    queue = queue or Queue(-1)
+    forward_logs(queue, level)
+    listener = QueueListener(queue, handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def forward_logs(queue: Queue, level: int = logging.INFO) -> None:
+    """Put the records of this process on a queue
+
+    Args:
+        queue (Queue): Queue records are put on.
+        level (int, optional): Log level. Defaults to logging.INFO.
+    """
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(QueueHandler(queue))
+    root.setLevel(level)
+
+
+def get_level(line: str) -> str | None:
+    """Level of a line starting a record - plain or JSON"""
+    if line.startswith("{"):
+        try:
+            return json.loads(line).get("level")
+        except (json.JSONDecodeError, AttributeError):
+            return
+    match = record_start.match(line)
+    return match[1] if match else None
+
+
+def read_lines_backwards(path: str, block_size: int = 64 * 1024) -> Iterator[str]:
+    """Lines of a file, last first, reading it from the end in blocks
+
+    Args:
+        path (str): File path.
+        block_size (int, optional): Bytes read at once. Defaults to 64KiB.
+
+    Yields:
+        str: Line.
+    """
+    with open(path, "rb") as fh:
+        position = fh.seek(0, SEEK_END)
+        remainder = b""
+        while position > 0:
+            size = min(block_size, position)
+            position -= size
+            fh.seek(position)
+            lines = (fh.read(size) + remainder).split(b"\n")
+            # First line might carry on in the block before
+            remainder = lines.pop(0)
+            for line in reversed(lines):
+                yield line.decode("utf-8", errors="replace")
+        yield remainder.decode("utf-8", errors="replace")
+
+
+def tail(
+    path: str, count: int = 50, level: str = None, pattern: str = None
+) -> list[str]:
+    """Last records of a log file
+
+    Lines that don't start a record e.g tracebacks belong to the record above.
+
+    Args:
+        path (str): Log file path.
+        count (int, optional): Records returned. Defaults to 50.
+        level (str, optional): Lowest level of the records returned e.g WARNING. Defaults to None.
+        pattern (str, optional): Text the records must contain - case insensitive. Defaults to None.
+
+    Returns:
+        list[str]: Records, oldest first.
+    """
+    min_level = logging.getLevelName(level.upper()) if level else 0
+    pattern = pattern.lower() if pattern else None
+    records: list[str] = []
+    continuation: list[str] = []
+    for line in read_lines_backwards(path):
+        record_level = get_level(line)
+        if not record_level:
+            if line:
+                continuation.append(line)
+            continue
+        record = "\n".join([line, *reversed(continuation)])
+        continuation.clear()
+        if logging.getLevelName(record_level) < min_level:
+            continue
+        if pattern and pattern not in record.lower():
+            continue
+        records.append(record)
+        if len(records) >= count:
+            break
+    return records[::-1]
+
+
+def parse_arguments(arguments: str) -> tuple[int, str | None, str | None, bool]:
+    """Split `/logs` arguments - `[N] [level] [gz] [text]` in any order
+
+    Args:
+        arguments (str): Command arguments e.g `100 error timeout`.
+
+    Returns:
+        tuple[int, str | None, str | None, bool]: Number of records, level, text
+            searched for and whether the whole log is wanted compressed.
+    """
+    count, level, compress, words = 50, None, False, []
+    for word in (arguments or "").split():
+        if word.isdigit():
+            count = int(word)
+        elif word.upper() in log_levels:
+            level = word.upper()
+        elif word.lower() in ("gz", "gzip"):
+            compress = True
+        else:
+            words.append(word)
+    return count, level, " ".join(words) or None, compress
+
+
+def compress(path: str) -> BytesIO:
+    """Gzip a file into memory, copying it over in blocks
+
+    Args:
+        path (str): File path.
+
+    Returns:
+        BytesIO: Compressed contents, at the start.
+    """
+    buffer = BytesIO()
+    with open(path, "rb") as source, gzip.GzipFile(
+        fileobj=buffer, mode="wb"
+    ) as destination:
+        shutil.copyfileobj(source, destination)
+    buffer.seek(0)
+    return buffer
@@ -2,16 +2,16 @@ import telebot
 import json
 import logging
 import asyncio
-from telebot.async_telebot import AsyncTeleBot
 import telebot.util as telebot_util
-import pytgpt.imager as image_generator
+from telebot.asyncio_helper import ApiTelegramException
 from pytgpt.utils import Audio as audio_generator
-from pytgpt.utils import Conversation
 from pytgpt.utils import AwesomePrompts
-from pytgpt.gpt4free import AsyncGPT4FREE
 from functools import wraps
-from sqlalchemy import text
-from uuid import uuid4
+from time import monotonic
+from pathlib import Path
+from typing import AsyncGenerator, Awaitable, Any, Callable
+from multiprocessing.queues import Queue
+from sqlalchemy import text, delete, func, select
 
 from pytgpt_bot import __version__, __repo__
 
@@ -19,20 +19,77 @@ from pytgpt_bot.config import (
     bot_token,
     max_tokens,
     timeout,
+    pool_size,
+    send_rate,
+    queue_depth,
+    concurrency,
+    workers,
+    stream,
+    stream_interval,
     loglevel,
     logfile,
     admin_ids,
+    log_max_bytes,
+    log_rotate_when,
+    log_backups,
+    log_compress,
+    log_json,
+    test_g4f,
+    response_cache as response_cache_enabled,
+    response_cache_size,
+    response_cache_ttl,
+    response_cache_persist,
+    failover,
+    cache_size,
+    media_cache_bytes,
+    media_ttl,
+    inline_delay,
+    inline_deadline,
+    inline_cache_time,
+    temp_ttl,
+    keyboard_page_size,
+    sweep_interval,
+    hedge,
+    g4f_check_interval,
+    metrics as metrics_enabled,
+    metrics_host,
+    metrics_port,
 )
-from pytgpt_bot.db import User
+from pytgpt_bot.config import provider as default_provider
+from pytgpt_bot.db import User, chat_cache, invalidate_caches
 from pytgpt_bot.utils import (
     provider_keys,
     get_random_emoji,
-    provider_map,
     make_delete_markup,
-    get_user_id,
     get_g4f_providers,
 )
-from pytgpt_bot.models import session, Chat, Temp, create_all, drop_all
+from pytgpt_bot.models import Session, Chat, ChatMessage, Temp, create_all, drop_all
+from pytgpt_bot.models import table_stats
+from pytgpt_bot.models import CachedResponse, MediaFile
+from pytgpt_bot.models import init_db, engine
+from pytgpt_bot.history import ConversationWindow, get_history_budget, render_history
+from pytgpt_bot.middlewares import UserMiddleware
+from pytgpt_bot.providers import ProviderPool
+from pytgpt_bot.health import ProviderHealth
+from pytgpt_bot.routing import ProviderRouter
+from pytgpt_bot.responses import ResponseCache
+from pytgpt_bot.media import MediaCache
+from pytgpt_bot.sweeper import Sweeper
+from pytgpt_bot.keyboards import PagedKeyboard, page_namespace
+from pytgpt_bot.search import TrigramIndex
+from pytgpt_bot import logs, metrics
+from pytgpt_bot.metrics import Gauge, MetricsServer
+from pytgpt_bot.callbacks import (
+    CallbackRouter,
+    media_callback_prefix,
+    encode_media_callback,
+    decode_media_callback,
+)
+from pytgpt_bot.limiter import RateLimitedTeleBot, SendScheduler
+from pytgpt_bot.limiter import send_priority, BULK
+from pytgpt_bot.queues import ChatQueues, ChatQueueFull, Debouncer, Superseded
+from pytgpt_bot.webhook import WebhookServer
+from pytgpt_bot.workers import get_update_key, unordered_updates
 from pytgpt_bot.filters import (
     IsActiveFilter,
     IsBotOwnerFilter,
@@ -41,32 +98,86 @@ from pytgpt_bot.filters import (
     IsChatCommandFilter,
 )
 
-
-log_params = dict(
-    format="%(asctime)s : %(levelname)s - %(message)s",
-    datefmt="%d-%b-%Y %H:%M:%S",
-    level=loglevel,
+log_listener = logs.setup_logging(
+    loglevel,
+    logfile,
+    max_bytes=log_max_bytes,
+    when=log_rotate_when,
+    backups=log_backups,
+    compress=log_compress,
+    json_lines=log_json,
 )
 
-if logfile:
-    log_params["filename"] = logfile
 
-logging.basicConfig(**log_params)
+bot = RateLimitedTeleBot(
+    bot_token,
+    # Worker processes share the global rate
+    scheduler=SendScheduler(global_rate=send_rate / workers),
+    disable_web_page_preview=True,
+)
+
+provider_pool = ProviderPool(pool_size=pool_size)
 
+provider_health = ProviderHealth(interval=g4f_check_interval)
 
-bot = AsyncTeleBot(bot_token, disable_web_page_preview=True)
+provider_router = ProviderRouter(
+    provider_pool,
+    candidates=lambda: provider_keys + provider_health.healthy,
+    failover=failover,
+    hedge=hedge,
+)
 
-loop = asyncio.get_event_loop()
+media_cache = MediaCache(maxsize=cache_size, max_bytes=media_cache_bytes)
 
-logging.info(
-    f"Bot started sucessfully {get_random_emoji('happy')}. Admin IDs - [{', '.join(admin_ids)}]"
+response_cache = (
+    ResponseCache(
+        maxsize=response_cache_size,
+        ttl=response_cache_ttl,
+        persist=response_cache_persist,
+    )
+    if response_cache_enabled
+    else None
 )
 
-asyncio.run(bot.remove_webhook())
+chat_queues = ChatQueues(max_depth=queue_depth, concurrency=concurrency)
 
-awesome_prompts_dict: dict = AwesomePrompts().get_acts()
-awesome_prompts_keys: list = list(awesome_prompts_dict.keys())
-g4f_providers = get_g4f_providers()
+inline_debouncer = Debouncer(delay=inline_delay)
+
+metrics_server = MetricsServer(host=metrics_host, port=metrics_port)
+if metrics_enabled:
+    metrics.instrument_engine(engine)
+
+callback_router = CallbackRouter()
+
+sweeper = Sweeper(interval=sweep_interval)
+sweeper.add(Temp.updated_on, temp_ttl)
+if response_cache_persist:
+    sweeper.add(CachedResponse.created_on, response_cache_ttl)
+sweeper.add(MediaFile.created_on, media_ttl)
+
+bot_tagged_filter = IsBotTaggedFilter()
+
+# Loaded on startup
+awesome_prompts_dict: dict = {}
+awesome_prompts_keys: list = []
+
+all_voices: frozenset[str] = frozenset(audio_generator.all_voices)
+text_providers: frozenset[str] = frozenset(provider_keys)
+
+voice_keyboard = PagedKeyboard(
+    "voice", audio_generator.all_voices, page_size=keyboard_page_size, columns=4
+)
+provider_keyboard = PagedKeyboard(
+    "prov", provider_keys, page_size=keyboard_page_size, columns=2
+)
+awesome_index = TrigramIndex()
+awesome_keyboard = PagedKeyboard(
+    "aw", [], page_size=keyboard_page_size, columns=2, index=awesome_index
+)
+keyboards: dict[str, PagedKeyboard] = {
+    keyboard.namespace: keyboard
+    for keyboard in (voice_keyboard, provider_keyboard, awesome_keyboard)
+}
 
 usage_info = (
     "Welcome to [PYTGPT-BOT](https://github.com/Simatwa/pytgpt-bot) ✨.\n"
@@ -102,7 +213,9 @@ admin_commands = (
     "/total : Total chats available 📊\n"
     "/drop : Delete all tables and bot logs 🗑️\n"
     "/sql : Run sql statements against database ⏳\n"
-    "/logs : View bot's log 📜"
+    "/logs : View bot's log - [N] [level] [text] [gz] 📜\n"
+    "/stats : View cache statistics 📈\n"
+    "/tables : View table sizes 🗄️"
 )
 
 
@@ -119,13 +232,22 @@ def handler_formatter(text: bool = False, preserve: bool = False):
 
         @wraps(func)
         async def decorator(message: telebot.types.Message):
+            started = monotonic()
+            outcome = "ok"
+            extra = dict(chat_id=message.user.id, handler=func.__name__)
             try:
                 if message.chat.type == "private":
                     logging.info(
-                        f"Serving user [{get_user_id(message)}] ({message.from_user.full_name}) - Function [{func.__name__}]"
+                        "Serving user [%s] (%s) - Function [%s]",
+                        message.user.id,
+                        message.from_user.full_name,
+                        func.__name__,
+                        extra=extra,
                     )
                 else:
-                    logging.info(f"Serving Group  - Function [{func.__name__}]")
+                    logging.info(
+                        "Serving Group  - Function [%s]", func.__name__, extra=extra
+                    )
                 if not preserve:
                     message.text = telebot_util.extract_arguments(message.text)
 
@@ -138,9 +260,13 @@ def handler_formatter(text: bool = False, preserve: bool = False):
 
                 return await func(message)
             except Exception as e:
+                outcome = "error"
                 # logging.exception(e)
                 logging.error(
-                    f"Error on function - {func.__name__} - {e.args[1] if e.args and len(e.args)>1 else e}"
+                    "Error on function - %s - %s",
+                    func.__name__,
+                    e.args[1] if e.args and len(e.args) > 1 else e,
+                    extra=extra,
                 )
                 logging.debug(str(e))
                 return await bot.reply_to(
@@ -148,12 +274,43 @@ def handler_formatter(text: bool = False, preserve: bool = False):
                     text=f"{get_random_emoji('angry')} An error occured and I could't complete that request ❗️❗️❗️",
                     reply_markup=make_delete_markup(message),
                 )
+            finally:
+                latency = round(monotonic() - started, 3)
+                metrics.handler_seconds.observe(latency, func.__name__, outcome)
+                logging.debug(
+                    "Served function [%s] in %ss",
+                    func.__name__,
+                    latency,
+                    extra=dict(extra, latency=latency),
+                )
 
         return decorator
 
     return main
 
 
+def queued(func):
+    """Serve the chat's requests one after another, turning down excess ones"""
+
+    @wraps(func)
+    async def decorator(message: telebot.types.Message):
+        try:
+            async with chat_queues.slot(
+                message.user.id, getattr(message, "ticket", None)
+            ):
+                return await func(message)
+        except ChatQueueFull as e:
+            logging.info("%s - Function [%s]", e, func.__name__)
+            return await bot.reply_to(
+                message,
+                f"{get_random_emoji()} I'm still working on your previous requests. "
+                "Kindly wait for them before sending more ⏳",
+                reply_markup=make_delete_markup(message),
+            )
+
+    return decorator
+
+
 async def send_and_add_delete_button(
     message: telebot.types.Message,
     text: str,
@@ -200,17 +357,88 @@ async def send_long_text(
         as_reply (bool). Highlight the user message. Default to False.
     """
     parts: list = telebot_util.smart_split(text)
-    if add_delete:
-        for part in parts:
-            await send_and_add_delete_button(
-                message, part, parse_mode=parse_mode, as_reply=as_reply
-            )
-    else:
-        for part in parts:
-            if as_reply:
-                await bot.reply_to(message, part, parse_mode=parse_mode)
-            else:
-                await bot.send_message(message.chat.id, part, parse_mode=parse_mode)
+    # Long dumps yield to short interactive replies
+    priority = send_priority.set(BULK) if len(parts) > 1 else None
+    try:
+        if add_delete:
+            for part in parts:
+                await send_and_add_delete_button(
+                    message, part, parse_mode=parse_mode, as_reply=as_reply
+                )
+        else:
+            for part in parts:
+                if as_reply:
+                    await bot.reply_to(message, part, parse_mode=parse_mode)
+                else:
+                    await bot.send_message(message.chat.id, part, parse_mode=parse_mode)
+    finally:
+        if priority:
+            send_priority.reset(priority)
+
+
+async def send_streaming_text(
+    message: telebot.types.Message,
+    chunks: AsyncGenerator[str, None],
+    parse_mode: str = "Markdown",
+    as_reply: bool = False,
+) -> str:
+    """Send text as it's being generated by editing the sent message
+
+    Edits are coalesced to one per `stream_interval` seconds and the text rolls
+    over to a new message at the boundaries `send_long_text` splits on.
+
+    Args:
+        message (telebot.types.Message): Message object.
+        chunks (AsyncGenerator[str, None]): Text generated so far.
+        parse_mode (str): Applied once a message is complete. Defaults to Markdown.
+        as_reply (bool). Highlight the user message. Default to False.
+
+    Returns:
+        str: Complete text.
+    """
+    text: str = ""
+    offset: int = 0
+    sent: telebot.types.Message = None
+    shown: str = ""
+    last_edit: float = 0
+
+    async def show(part: str, complete: bool = False):
+        nonlocal sent, shown, last_edit
+        if not part.strip() or (part == shown and not complete):
+            return
+        # Partial texts are sent raw as their markdown might not be balanced yet
+        for mode in (parse_mode, None) if complete and parse_mode else (None,):
+            try:
+                if sent is None and as_reply:
+                    sent = await bot.reply_to(message, part, parse_mode=mode)
+                elif sent is None:
+                    sent = await bot.send_message(
+                        message.chat.id, part, parse_mode=mode
+                    )
+                else:
+                    await bot.edit_message_text(
+                        part, message.chat.id, sent.id, parse_mode=mode
+                    )
+                break
+            except ApiTelegramException as e:
+                if "message is not modified" in str(e.description):
+                    break
+                if mode is None:
+                    raise
+        shown = part
+        last_edit = monotonic()
+
+    async for text in chunks:
+        *complete_parts, part = telebot_util.smart_split(text[offset:])
+        for complete_part in complete_parts:
+            await show(complete_part, complete=True)
+            offset += len(complete_part)
+            sent, shown = None, ""
+        if sent is None or monotonic() - last_edit >= stream_interval:
+            await show(part)
+
+    await show(text[offset:], complete=True)
+    return text
 
 
 async def make_regenerate_and_delete_markup(
@@ -227,16 +455,18 @@ async def make_regenerate_and_delete_markup(
         telebot.types.InlineKeyboardMarkup: Markup
     """
     markup = telebot.types.InlineKeyboardMarkup(row_width=2)
-    uuid = uuid4().__str__()
-    session.add(
-        Temp(
-            uuid=uuid,
-            provider=provider,
-            prompt=prompt,
+    callback_data = encode_media_callback(provider, message.user.id, prompt)
+    if callback_data is None:
+        # Prompt is too long to fit in - keep it in the database
+        temp = Temp(provider=provider, prompt=prompt)
+        async with Session() as session:
+            session.add(temp)
+            await session.commit()
+        callback_data = encode_media_callback(
+            provider, message.user.id, temp_id=temp.id
         )
-    )
     regenerate_button = telebot.types.InlineKeyboardButton(
-        text="♻️", callback_data=f"media:{get_user_id(message,)}:{uuid}"
+        text="♻️", callback_data=callback_data
     )
     delete_button = telebot.types.InlineKeyboardButton(
         text="🗑️", callback_data=f"delete:{message.chat.id}:{message.id}"
@@ -258,7 +488,7 @@ async def home(message: telebot.types.Message):
     )
     return await bot.send_message(
         message.chat.id,
-        text=(usage_info + admin_commands if User(message).is_admin else usage_info),
+        text=(usage_info + admin_commands if message.user.is_admin else usage_info),
         reply_markup=markup,
         parse_mode="Markdown",
     )
@@ -270,7 +500,7 @@ async def home(message: telebot.types.Message):
 async def echo_user_id(message: telebot.types.Message):
     return await bot.reply_to(
         message,
-        f"Greetings {message.from_user.first_name} {get_random_emoji('love')}. Your Telegram ID is {get_user_id(message)}.",
+        f"Greetings {message.from_user.first_name} {get_random_emoji('love')}. Your Telegram ID is {message.user.id}.",
         reply_markup=make_delete_markup(message),
     )
 
@@ -282,13 +512,20 @@ async def set_chat_intro(message: telebot.types.Message):
     """Set new value for chat intro"""
     intro = awesome_prompts_dict.get(message.text, message.text)
     if not len(intro) > 10:
+        if awesome_index.search(intro, limit=1):
+            # Likely meant an awesome prompt
+            return await send_keyboard(
+                message,
+                awesome_keyboard,
+                intro,
+                f"Choose awesome {get_random_emoji('love')}",
+            )
         return await bot.reply_to(
             message,
             f"{get_random_emoji('angry')} The chat introduction must be at least 10 characters long.",
             reply_markup=make_delete_markup(message),
         )
-    user = User(message)
-    user.chat.intro = intro
+    message.user.chat.intro = intro
     return await bot.reply_to(
         message,
         f"{get_random_emoji('happy')} New intro set successfully.",
@@ -296,45 +533,94 @@ async def set_chat_intro(message: telebot.types.Message):
     )
 
 
+async def send_keyboard(
+    message: telebot.types.Message, keyboard: PagedKeyboard, query: str, text: str
+):
+    """Send a keyboard's first page or the choices matching a query
+
+    Args:
+        message (telebot.types.Message): Message object.
+        keyboard (PagedKeyboard): Keyboard of choices.
+        query (str): Narrows down the choices.
+        text (str): Message text.
+    """
+    if query:
+        markup, matches = keyboard.render_search(query)
+        if markup is None:
+            return await send_and_add_delete_button(
+                message,
+                f"{get_random_emoji('angry')} Nothing matches `{query}`",
+                as_reply=True,
+            )
+        if matches > keyboard.page_size:
+            text += f" - {keyboard.page_size} of {matches} matches"
+    else:
+        markup = keyboard.page(0)
+    await bot.delete_message(message.chat.id, message.id)
+    return await bot.send_message(message.chat.id, f"{text}:", reply_markup=markup)
+
+
+@callback_router.route(page_namespace)
+async def keyboard_page_callback_handler(
+    call: telebot.types.CallbackQuery, payload: str
+):
+    """Keyboard page navigation callback handler"""
+    namespace, index = payload.split(":")
+    try:
+        await bot.edit_message_reply_markup(
+            call.message.chat.id,
+            call.message.id,
+            reply_markup=keyboards[namespace].page(int(index)),
+        )
+    except ApiTelegramException as e:
+        # Page is already shown
+        logging.debug("Failed to turn keyboard page - %s", e)
+        await bot.answer_callback_query(call.id)
+
+
+async def answer_unlisted_choice(call: telebot.types.CallbackQuery):
+    """Tell that a keyboard's button is no longer valid"""
+    await bot.answer_callback_query(
+        call.id, "That option is no longer available, send the command again ❗️"
+    )
+
+
 @bot.message_handler(commands=["voice"], is_chat_admin=True)
 @bot.channel_post_handler(commands=["voice"], is_chat_admin=True)
 @handler_formatter(text=False, preserve=True)
 async def set_new_speech_voice(message: telebot.types.Message):
     """Set new voice for speech synthesis"""
-    user_id: str = get_user_id(message)
     arguments: str = telebot_util.extract_arguments(message.text)
-    if arguments and arguments in audio_generator.all_voices:
-        User(user_id=user_id).chat.voice = arguments
+    if arguments and arguments in all_voices:
+        message.user.chat.voice = arguments
         return await send_and_add_delete_button(
             message,
             f"{get_random_emoji('happy')} New voice set : `{arguments}`",
             as_reply=True,
         )
 
-    markup = telebot.types.InlineKeyboardMarkup(row_width=4)
-    make_item = lambda voice: telebot.types.InlineKeyboardButton(
-        voice, callback_data=f"{voice}:{user_id}"
-    )
-    markup.add(*map(make_item, audio_generator.all_voices))
-    await bot.delete_message(message.chat.id, message.id)
-    return await bot.send_message(
-        message.chat.id,
-        f"Choose a voice {get_random_emoji('happy')}:",
-        reply_markup=markup,
+    return await send_keyboard(
+        message,
+        voice_keyboard,
+        arguments,
+        f"Choose a voice {get_random_emoji('happy')}",
     )
 
 
-@bot.callback_query_handler(
-    func=lambda call: call.data.split(":")[0] in audio_generator.all_voices
-)
-async def set_new_speech_voice_callback_handler(call: telebot.types.CallbackQuery):
+@callback_router.route("voice", legacy=all_voices.__contains__)
+async def set_new_speech_voice_callback_handler(
+    call: telebot.types.CallbackQuery, payload: str
+):
     """Set new voice for speech synthesis callback handler"""
+    parsed = voice_keyboard.parse(call, payload)
+    if parsed is None:
+        return await answer_unlisted_choice(call)
     await bot.delete_message(call.message.chat.id, call.message.id)
-    voice, user_id = call.data.split(":")
+    voice, user_id = parsed
     message = call.message
     markup = make_delete_markup(call.message)
-    user = User(user_id=user_id)
-    user.chat.voice = voice
+    async with User(user_id=user_id) as user:
+        user.chat.voice = voice
     return await bot.send_message(
         message.chat.id,
         f"{get_random_emoji('happy')} New voice set : `{voice}`",
@@ -348,39 +634,43 @@ async def set_new_speech_voice_callback_handler(call: telebot.types.CallbackQuer
 @handler_formatter(text=False, preserve=True)
 async def set_new_chat_provider(message: telebot.types.Message):
     """Set new text provider"""
-    user_id: str = get_user_id(message)
     arguments: str = telebot_util.extract_arguments(message.text)
-    if arguments and arguments in provider_keys + g4f_providers:
-        User(user_id=user_id).chat.provider = arguments
+    if arguments and (
+        arguments in provider_keys or arguments in provider_health.healthy
+    ):
+        message.user.chat.provider = arguments
         return await send_and_add_delete_button(
             message,
             f"New text provider set {get_random_emoji('love')}: `{arguments}`",
             as_reply=True,
         )
-    markup = telebot.types.InlineKeyboardMarkup(row_width=2)
-    make_item = lambda provider: telebot.types.InlineKeyboardButton(
-        provider, callback_data=f"{provider}:{user_id}"
-    )
-    markup.add(*map(make_item, provider_keys + g4f_providers))
-    await bot.delete_message(message.chat.id, message.id)
-    return await bot.send_message(
-        message.chat.id,
-        f"Choose a provider {get_random_emoji('love')}:",
-        reply_markup=markup,
+    # Rebuilt only when the working g4f providers have changed
+    provider_keyboard.update(provider_keys + provider_health.healthy)
+    return await send_keyboard(
+        message,
+        provider_keyboard,
+        arguments,
+        f"Choose a provider {get_random_emoji('love')}",
     )
 
 
-@bot.callback_query_handler(
-    func=lambda call: call.data.split(":")[0] in provider_keys + g4f_providers
+@callback_router.route(
+    "prov",
+    legacy=lambda name: name in text_providers or name in provider_health.statuses,
 )
-async def set_new_chat_provider_callback_handler(call: telebot.types.CallbackQuery):
+async def set_new_chat_provider_callback_handler(
+    call: telebot.types.CallbackQuery, payload: str
+):
     """Set new text provider callback handler"""
+    parsed = provider_keyboard.parse(call, payload)
+    if parsed is None:
+        return await answer_unlisted_choice(call)
     await bot.delete_message(call.message.chat.id, call.message.id)
-    provider, user_id = call.data.split(":")
+    provider, user_id = parsed
     message = call.message
     markup = make_delete_markup(call.message)
-    user = User(user_id=user_id)
-    user.chat.provider = provider
+    async with User(user_id=user_id) as user:
+        user.chat.provider = provider
     return await bot.send_message(
         message.chat.id,
         f"New text provider set {get_random_emoji('love')}: `{provider}`",
@@ -394,40 +684,35 @@ async def set_new_chat_provider_callback_handler(call: telebot.types.CallbackQue
 @handler_formatter(text=False, preserve=True)
 async def set_awesome_prompt_as_chat_intro(message: telebot.types.Message):
     """Set awesome prompt as intro"""
-    user_id: str = get_user_id(message)
     arguments: str = telebot_util.extract_arguments(message.text)
-    if arguments and arguments in awesome_prompts_keys:
+    if arguments and arguments in awesome_prompts_dict:
         new_awesome: str = awesome_prompts_dict.get(arguments)
-        User(user_id=user_id).chat.intro = new_awesome
+        message.user.chat.intro = new_awesome
         return await send_and_add_delete_button(
             message,
             f"""New awesome-intro set:\n```{new_awesome}\n```.""",
             as_reply=True,
         )
-    markup = telebot.types.InlineKeyboardMarkup(row_width=4)
-    make_item = lambda awesome: telebot.types.InlineKeyboardButton(
-        awesome, callback_data=f"{awesome}:{user_id}"
-    )
-    markup.add(*map(make_item, awesome_prompts_keys))
-    await bot.delete_message(message.chat.id, message.id)
-    return await bot.send_message(
-        message.chat.id,
-        f"Choose awesome {get_random_emoji('love')}:",
-        reply_markup=markup,
+    return await send_keyboard(
+        message,
+        awesome_keyboard,
+        arguments,
+        f"Choose awesome {get_random_emoji('love')}",
     )
 
 
-@bot.callback_query_handler(
-    func=lambda call: call.data.split(":")[0] in awesome_prompts_keys
-)
+@callback_router.route("aw", legacy=awesome_prompts_dict.__contains__)
 async def set_awesome_prompt_as_chat_intro_callback_handler(
-    call: telebot.types.CallbackQuery,
+    call: telebot.types.CallbackQuery, payload: str
 ):
     """Set awesome prompt as intro callback handler"""
+    parsed = awesome_keyboard.parse(call, payload)
+    if parsed is None:
+        return await answer_unlisted_choice(call)
     await bot.delete_message(call.message.chat.id, call.message.id)
-    awesome_prompt, user_id = call.data.split(":")
-    user = User(user_id=user_id)
-    user.chat.intro = awesome_prompts_dict.get(awesome_prompt)
+    awesome_prompt, user_id = parsed
+    async with User(user_id=user_id) as user:
+        user.chat.intro = awesome_prompts_dict.get(awesome_prompt)
     return await bot.send_message(
         call.message.chat.id,
         f"""New awesome-intro set:\n```{user.chat.intro}\n```.""",
@@ -441,10 +726,10 @@ async def set_awesome_prompt_as_chat_intro_callback_handler(
 @handler_formatter()
 async def check_current_settings(message: telebot.types.Message):
     """Check current user settings"""
-    chat = User(message).chat
+    chat = message.user.chat
     current_user_settings = (
         f"Is Active :  `{chat.is_active}`\n"
-        f"Chat Length : `{len(chat.history) if chat.history else 0}`\n"
+        f"Chat Length : `{await message.user.count_messages()}`\n"
         f"Speech Voice : `{chat.voice}`\n"
         f"Chat Provider : `{chat.provider}`\n"
         f"Chat Intro : `{chat.intro}`"
@@ -461,89 +746,156 @@ async def check_current_settings(message: telebot.types.Message):
 @bot.channel_post_handler(commands=["history"], is_chat_admin=True, is_chat_active=True)
 @handler_formatter()
 async def check_chat_history(message: telebot.types.Message):
-    user = User(message)
+    history, _ = await message.user.get_history()
     return await send_long_text(
         message,
-        user.chat.history or f"{get_random_emoji()} Your chat history is empty ❗️",
+        render_history(history)
+        or f"{get_random_emoji()} Your chat history is empty ❗️",
         add_delete=True,
         parse_mode="Markdown",
     )
 
 
-async def text_to_image_default(message: telebot.types.Message):
+async def send_media(
+    message: telebot.types.Message,
+    kind: str,
+    variant: str,
+    generate: Callable[[], Awaitable[bytes]],
+    send: Callable[[bytes | str], Awaitable[telebot.types.Message]],
+    regenerate: bool = False,
+) -> telebot.types.Message:
+    """Send media generated from the message text, reusing the one sent before
+
+    Args:
+        message (telebot.types.Message): Message object.
+        kind (str): image|speech
+        variant (str): Image provider or voice.
+        generate (Callable[[], Awaitable[bytes]]): Generates the media.
+        send (Callable[[bytes | str], Awaitable[telebot.types.Message]]): Sends media bytes or file id.
+        regenerate (bool, optional): Generate new media. Defaults to False.
+
+    Returns:
+        telebot.types.Message: Message sent.
+    """
+    key = media_cache.make_key(kind, variant, message.text)
+    content: bytes = None
+    if not regenerate:
+        file_id = await media_cache.get_file_id(key)
+        if file_id:
+            try:
+                return await send(file_id)
+            except ApiTelegramException as e:
+                logging.debug("Cached media is no longer valid - %s", e)
+                await media_cache.forget(key)
+        content = await media_cache.get_bytes(key)
+    if content is None:
+        content = await generate()
+        await media_cache.set_bytes(key, content)
+    sent = await send(content)
+    media = sent.photo[-1] if sent.photo else sent.audio
+    await media_cache.set_file_id(key, kind, media.file_id)
+    return sent
+
+
+async def text_to_image_default(
+    message: telebot.types.Message, regenerate: bool = False
+):
     """Shared obj : Generate image using `image`"""
     await bot.send_chat_action(message.chat.id, "upload_photo", timeout=timeout)
-    generator_obj = image_generator.AsyncImager(
-        timeout=timeout,
-    )
-    image_chunk = await generator_obj.generate(
-        message.text,
-    )
-    return await bot.send_photo(
-        message.chat.id,
-        photo=image_chunk[0],
-        caption=message.text + " (default)",
-        reply_markup=await make_regenerate_and_delete_markup(
-            message, provider="default", prompt=message.text
-        ),
-    )
+
+    async def generate() -> bytes:
+        generator_obj = provider_pool.get("default", timeout)
+        image_chunk = await generator_obj.generate(
+            message.text,
+        )
+        return image_chunk[0]
+
+    async def send(photo: bytes | str) -> telebot.types.Message:
+        return await bot.send_photo(
+            message.chat.id,
+            photo=photo,
+            caption=message.text + " (default)",
+            reply_markup=await make_regenerate_and_delete_markup(
+                message, provider="default", prompt=message.text
+            ),
+        )
+
+    return await send_media(message, "image", "default", generate, send, regenerate)
 
 
 @bot.message_handler(commands=["image", "img"], is_chat_active=True)
 @bot.channel_post_handler(commands=["image", "img"], is_chat_active=True)
 @handler_formatter(text=True)
+@queued
 async def text_to_image_default_handler(message: telebot.types.Message):
     """Handler for image generation - default"""
     await text_to_image_default(message)
 
 
-async def text_to_image_prodia(message: telebot.types.Message):
+async def text_to_image_prodia(
+    message: telebot.types.Message, regenerate: bool = False
+):
     """Shared obj : Generate image using `prodia` and respond"""
     await bot.send_chat_action(message.chat.id, "upload_photo", timeout=timeout)
-    generator_obj = image_generator.AsyncProdia(timeout=timeout)
-    image_chunk = await generator_obj.generate(message.text)
-    return await bot.send_photo(
-        message.chat.id,
-        photo=image_chunk[0],
-        caption=message.text + " (prodia)",
-        reply_markup=await make_regenerate_and_delete_markup(
-            message, provider="prodia", prompt=message.text
-        ),
-    )
+
+    async def generate() -> bytes:
+        generator_obj = provider_pool.get("prodia", timeout)
+        image_chunk = await generator_obj.generate(message.text)
+        return image_chunk[0]
+
+    async def send(photo: bytes | str) -> telebot.types.Message:
+        return await bot.send_photo(
+            message.chat.id,
+            photo=photo,
+            caption=message.text + " (prodia)",
+            reply_markup=await make_regenerate_and_delete_markup(
+                message, provider="prodia", prompt=message.text
+            ),
+        )
+
+    return await send_media(message, "image", "prodia", generate, send, regenerate)
 
 
 @bot.message_handler(commands=["prodia", "prod"], is_chat_active=True)
 @bot.channel_post_handler(commands=["prodia", "prod"], is_chat_active=True)
 @handler_formatter(text=True)
+@queued
 async def text_to_image_prodia_handler(message: telebot.types.Message):
     """Handler for text to image"""
     await text_to_image_prodia(message)
 
 
-async def text_to_speech(message: telebot.types.Message):
+async def text_to_speech(message: telebot.types.Message, regenerate: bool = False):
     """Shared obj : Convert text to speech and respond"""
     await bot.send_chat_action(message.chat.id, "upload_audio", timeout=timeout)
-    voice = User(message).chat.voice
-    audio_chunk = await audio_generator.async_text_to_audio(
-        message=message.text,
-        voice=voice,
-        timeout=timeout,
-    )
-    return await bot.send_audio(
-        message.chat.id,
-        audio=audio_chunk,
-        caption=message.text,
-        reply_markup=await make_regenerate_and_delete_markup(
-            message, provider="speech", prompt=message.text
-        ),
-        performer=voice,
-        title="Text-to-Speech",
-    )
+    voice = message.user.chat.voice
+
+    async def generate() -> bytes:
+        return await audio_generator.async_text_to_audio(
+            message=message.text,
+            voice=voice,
+            timeout=timeout,
+        )
+
+    async def send(audio: bytes | str) -> telebot.types.Message:
+        return await bot.send_audio(
+            message.chat.id,
+            audio=audio,
+            caption=message.text,
+            reply_markup=await make_regenerate_and_delete_markup(
+                message, provider="speech", prompt=message.text
+            ),
+            performer=voice,
+            title="Text-to-Speech",
+        )
+
+    return await send_media(message, "speech", voice, generate, send, regenerate)
 
 
 @bot.message_handler(commands=["speak", "spe"], is_chat_active=True)
 @bot.channel_post_handler(commands=["speak", "spe"], is_chat_active=True)
 @handler_formatter(text=True)
+@queued
 async def text_to_speech_handler(message: telebot.types.Message):
     """Handler for text to speech"""
     await text_to_speech(message)
@@ -554,8 +906,7 @@ async def text_to_speech_handler(message: telebot.types.Message):
 @handler_formatter()
 async def reset_chat(message: telebot.types.Message):
     """Reset current chat thread"""
-    user = User(message)
-    session.delete(user.chat)
+    await message.user.delete()
     return await bot.reply_to(
         message,
         f"New chat instance created. {get_random_emoji('happy')}",
@@ -567,8 +918,7 @@ async def reset_chat(message: telebot.types.Message):
 @bot.channel_post_handler(commands=["suspend"], is_chat_admin=True, is_chat_active=True)
 @handler_formatter()
 async def change_chat_status_to_inactive(message: telebot.types.Message):
-    chats = User(message).chat
-    chats.is_active = False
+    message.user.chat.is_active = False
     return await bot.reply_to(
         message, text=f"Service Suspended 🚫.", reply_markup=make_delete_markup(message)
     )
@@ -578,8 +928,7 @@ async def change_chat_status_to_inactive(message: telebot.types.Message):
 @bot.channel_post_handler(commands=["resume"], is_chat_admin=True)
 @handler_formatter()
 async def change_chat_status_to_active(message: telebot.types.Message):
-    chat = User(message).chat
-    chat.is_active = True
+    message.user.chat.is_active = True
     return await bot.reply_to(
         message, text=f"Service Resumed 🚀.", reply_markup=make_delete_markup(message)
     )
@@ -589,10 +938,22 @@ async def change_chat_status_to_active(message: telebot.types.Message):
 @handler_formatter()
 async def clear_chats(message: telebot.types.Message):
     """Delete all Tables"""
-    session.query(Chat).delete()
-    session.query(Temp).delete()
+    async with Session() as session:
+        await session.execute(delete(Chat))
+        await session.execute(delete(Temp))
+        await session.execute(delete(ChatMessage))
+        await session.execute(delete(CachedResponse))
+        await session.execute(delete(MediaFile))
+        await session.commit()
+    invalidate_caches()
+    media_cache.clear()
+    if response_cache:
+        response_cache.clear()
     logging.warning(
-        f"Clearing Chats - [{message.from_user.full_name}] ({get_user_id(message)}, {message.from_user.username})"
+        "Clearing Chats - [%s] (%s, %s)",
+        message.from_user.full_name,
+        message.user.id,
+        message.from_user.username,
     )
     return await bot.reply_to(
         message,
@@ -605,9 +966,13 @@ async def clear_chats(message: telebot.types.Message):
 @handler_formatter()
 async def total_chats_query(message: telebot.types.Message):
     """Query total chats"""
-    total_chats = session.query(Chat).count()
+    async with Session() as session:
+        total_chats = await session.scalar(select(func.count()).select_from(Chat))
     logging.warning(
-        f"Total Chats query - [{message.from_user.full_name}] ({get_user_id(message)}, {message.from_user.username})"
+        "Total Chats query - [%s] (%s, %s)",
+        message.from_user.full_name,
+        message.user.id,
+        message.from_user.username,
     )
     return await bot.reply_to(
         message,
@@ -624,13 +989,22 @@ async def total_chats_table_and_logs(message: telebot.types.Message):
         with open(logfile, "w") as fh:
             pass
         logging.info(
-            f"ADMIN CLEARED LOGS & DROPPED CHAT TABLE [{get_user_id(message)}] - ({message.from_user.full_name})\n"
+            "ADMIN CLEARED LOGS & DROPPED CHAT TABLE [%s] - (%s)\n",
+            message.user.id,
+            message.from_user.full_name,
         )
     logging.warning(
-        f"Dropping all tables and recreate - [{message.from_user.full_name}] ({get_user_id(message)}, {message.from_user.username})"
+        "Dropping all tables and recreate - [%s] (%s, %s)",
+        message.from_user.full_name,
+        message.user.id,
+        message.from_user.username,
     )
-    drop_all()
-    create_all()
+    await drop_all()
+    await create_all()
+    invalidate_caches()
+    media_cache.clear()
+    if response_cache:
+        response_cache.clear()
     return await bot.reply_to(
         message,
         f"{get_random_emoji('love')} All tables dropped and logs cleared. New one created.",
@@ -643,26 +1017,34 @@ async def total_chats_table_and_logs(message: telebot.types.Message):
 async def run_sql_statement(message: telebot.types.Message):
     """Run sql statements against database"""
     logging.warning(
-        f"Running SQL statements - [{message.from_user.full_name}] ({get_user_id(message)}, {message.from_user.username})"
+        "Running SQL statements - [%s] (%s, %s)",
+        message.from_user.full_name,
+        message.user.id,
+        message.from_user.username,
     )
     try:
-        results = session.execute(text(message.text))
-        response: dict[str, list] = {}
-        if results:
-            for count, row in enumerate(results):
-                response[count] = str(row)
-            jsonified_response = json.dumps(
-                response,
-                indent=3,
-            )
-            response = f"```json\n{jsonified_response}\n```"
-        else:
-            response = f"```\n{results}\n```"
-        session.commit()
+        async with Session() as session:
+            results = await session.execute(text(message.text))
+            response: dict[str, list] = {}
+            if results.returns_rows:
+                for count, row in enumerate(results):
+                    response[count] = str(row)
+                jsonified_response = json.dumps(
+                    response,
+                    indent=3,
+                )
+                response = f"```json\n{jsonified_response}\n```"
+            else:
+                response = f"```\n{results.rowcount} row(s) affected\n```"
+            await session.commit()
 
     except Exception as e:
         response = f"{e.args[1] if e.args and len(e.args)>1 else e}"
 
+    else:
+        # Statements might have altered the chats
+        invalidate_caches()
+
     finally:
         return await send_long_text(
             message,
@@ -674,16 +1056,98 @@ async def run_sql_statement(message: telebot.types.Message):
 @bot.message_handler(commands=["logs"], is_bot_owner=True)
 @handler_formatter()
 async def check_current_settings(message: telebot.types.Message):
-    """View bot logs"""
+    """View the last N bot logs of a level and above, containing a text,
+    or the whole log compressed"""
     if not logfile:
         return await bot.reply_to(
             message,
             f"{get_random_emoji()} Logfile not specified ❗️",
             reply_markup=make_delete_markup(message),
         )
-    with open(logfile, encoding="utf-8") as fh:
-        contents: str = fh.read()
-    return await send_long_text(message, contents, add_delete=True, parse_mode=None)
+    count, level, pattern, compress = logs.parse_arguments(message.text)
+    if compress:
+        await bot.send_chat_action(message.chat.id, "upload_document", timeout=timeout)
+        # Dumps yield to interactive replies
+        priority = send_priority.set(BULK)
+        try:
+            return await bot.send_document(
+                message.chat.id,
+                await asyncio.to_thread(logs.compress, logfile),
+                visible_file_name=f"{Path(logfile).name}.gz",
+                reply_markup=make_delete_markup(message),
+            )
+        finally:
+            send_priority.reset(priority)
+    records = await asyncio.to_thread(logs.tail, logfile, count, level, pattern)
+    if not records:
+        return await bot.reply_to(
+            message,
+            f"{get_random_emoji()} No logs match ❗️",
+            reply_markup=make_delete_markup(message),
+        )
+    return await send_long_text(
+        message, "\n".join(records), add_delete=True, parse_mode=None
+    )
+
+
+@bot.message_handler(commands=["stats"], is_bot_owner=True)
+@handler_formatter()
+async def cache_statistics(message: telebot.types.Message):
+    """View cache statistics"""
+    stats = "\n".join(
+        f"{key.replace('_', ' ').title()} : `{value}`"
+        for key, value in chat_cache.stats().items()
+    )
+    responses = (
+        "\n".join(
+            f"{key.replace('_', ' ').title()} : `{value}`"
+            for key, value in response_cache.stats().items()
+        )
+        if response_cache
+        else "Disabled"
+    )
+    media = "\n".join(
+        f"{key.replace('_', ' ').title()} : `{value}`"
+        for key, value in media_cache.stats().items()
+    )
+    providers = "\n".join(
+        f"{entry['name']} : `{entry['requests']}` requests, "
+        f"p50 `{entry['p50'] or 0:.2f}s`, p95 `{entry['p95'] or 0:.2f}s`, "
+        f"errors `{entry['error_rate']:.0%}`"
+        for entry in provider_router.summary()
+    )
+    return await bot.reply_to(
+        message,
+        f"*Chat settings cache* 📈\n{stats}\n\n"
+        f"*Requests in flight* : `{chat_queues.in_flight}/{chat_queues.concurrency}`\n\n"
+        f"*Providers* 🌐\n{providers or 'No requests yet'}\n\n"
+        f"*Response cache* 💾\n{responses}\n\n"
+        f"*Media cache* 🖼️\n{media}",
+        reply_markup=make_delete_markup(message),
+        parse_mode="Markdown",
+    )
+
+
+@bot.message_handler(commands=["tables"], is_bot_owner=True)
+@handler_formatter()
+async def table_statistics(message: telebot.types.Message):
+    """View table row counts and sizes"""
+    tables = "\n".join(
+        f"{table['name']} : `{table['rows']}` rows"
+        + (f", `{table['size'] / 1024:.1f}` KiB" if table["size"] is not None else "")
+        + (
+            f", `{sweeper.deleted[table['name']]}` expired"
+            if table["name"] in sweeper.deleted
+            else ""
+        )
+        for table in await table_stats()
+    )
+    return await bot.reply_to(
+        message,
+        f"*Tables* 🗄️\n{tables}",
+        reply_markup=make_delete_markup(message),
+        parse_mode="Markdown",
+    )
 
 
 @bot.message_handler(content_types=["text"], is_chat_active=True, is_chat_command=True)
@@ -693,58 +1157,111 @@ async def check_current_settings(message: telebot.types.Message):
     commands=["chat"],
 )
 @handler_formatter(preserve=True)
+@queued
 async def text_chat(message: telebot.types.Message):
     """Text generation"""
     if telebot_util.extract_command(message.text):
         message.text = telebot_util.extract_arguments(message.text)
 
-    user = User(message)
-    conversation = Conversation(max_tokens=max_tokens)
-    conversation.chat_history = user.chat.history
-    conversation_prompt = conversation.gen_complete_prompt(
-        message.text, intro=user.chat.intro
+    user: User = message.user
+    provider = provider_health.resolve(user.chat.provider, default_provider)
+    window = await user.get_window()
+    conversation_prompt = window.gen_complete_prompt(
+        message.text, intro=user.chat.intro, max_tokens=max_tokens
     )
     await bot.send_chat_action(message.chat.id, "typing")
 
-    provider_class = provider_map.get(user.chat.provider, AsyncGPT4FREE)
-    provider_class_kwargs: dict = dict(is_conversation=False, timeout=timeout)
-
-    if user.chat.provider in g4f_providers:
-        # gp4f provider
-        provider_class_kwargs["provider"] = user.chat.provider
-
-    ai_response = await provider_class(**provider_class_kwargs).chat(
-        conversation_prompt
-    )
-    conversation.update_chat_history(
-        prompt=message.text, response=ai_response, force=True
-    )
-    user.chat.history = conversation.chat_history
-    await send_long_text(
-        message, ai_response, as_reply=False if message.from_user else True
-    )
+    as_reply = False if message.from_user else True
+    cache_key: str = None
+    if response_cache and not (window.messages or window.truncated):
+        # First turns don't depend on chat history
+        cache_key = response_cache.make_key(provider, user.chat.intro, message.text)
+        ai_response = await response_cache.get(cache_key)
+        if ai_response is not None:
+            await user.add_turn(message.text, ai_response)
+            return await send_long_text(message, ai_response, as_reply=as_reply)
+
+    started = monotonic()
+    if stream:
+        ai_response = await send_streaming_text(
+            message,
+            provider_router.stream(provider, conversation_prompt, timeout),
+            as_reply=as_reply,
+        )
+    else:
+        provider, ai_response = await provider_router.chat(
+            provider, conversation_prompt, timeout
+        )
+    if cache_key:
+        await response_cache.set(cache_key, ai_response, monotonic() - started)
+    await user.add_turn(message.text, ai_response)
+    if not stream:
+        await send_long_text(message, ai_response, as_reply=as_reply)
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("media:"))
+@callback_router.route(media_callback_prefix)
 async def media_regeneration_callback_handler(
-    call: telebot.types.CallbackQuery,
+    call: telebot.types.CallbackQuery, payload: str
 ):
     """Media regeneration callback handler"""
-    action, user_id, uuid = call.data.split(":")
-    message = call.message
-    message.from_user.id = user_id
-    temp = session.query(Temp).filter_by(uuid=uuid).first()
+    try:
+        provider, user_id, prompt, temp_id = decode_media_callback(payload)
+    except ValueError as e:
+        logging.debug("%s", e)
+        return await bot.answer_callback_query(call.id, "That button is not valid ❗️")
+    return await regenerate_media(call, provider, user_id, prompt, dict(id=temp_id))
 
-    if temp:
-        message.text = temp.prompt
-        if temp.provider == "prodia":
-            return await text_to_image_prodia(message)
 
-        elif temp.provider == "default":
-            return await text_to_image_default(message)
+@callback_router.route("media")
+async def legacy_media_regeneration_callback_handler(
+    call: telebot.types.CallbackQuery, payload: str
+):
+    """Media regeneration callback handler of buttons made before callbacks were encoded"""
+    user_id, uuid = payload.split(":")
+    return await regenerate_media(call, None, user_id, None, dict(uuid=uuid))
+
+
+async def regenerate_media(
+    call: telebot.types.CallbackQuery,
+    provider: str | None,
+    user_id: str,
+    prompt: str | None,
+    temp_filter: dict,
+):
+    """Generate media again
 
-        elif temp.provider == "speech":
-            return await text_to_speech(message)
+    Args:
+        call (telebot.types.CallbackQuery): Callback query.
+        provider (str | None): Media provider - None when kept in `Temp`.
+        user_id (str): Id of the user or chat.
+        prompt (str | None): Prompt - None when kept in `Temp`.
+        temp_filter (dict): Finds the `Temp` row keeping the prompt.
+    """
+    message = call.message
+    message.from_user.id = user_id
+    if prompt is None:
+        async with Session() as session:
+            temp = await session.scalar(select(Temp).filter_by(**temp_filter))
+        if temp:
+            provider, prompt = temp.provider, temp.prompt
+
+    if prompt is not None:
+        message.text = prompt
+        try:
+            async with chat_queues.slot(user_id), User(user_id=user_id) as message.user:
+                # Regeneration is meant to bring about new media
+                if provider == "prodia":
+                    return await text_to_image_prodia(message, regenerate=True)
+
+                elif provider == "default":
+                    return await text_to_image_default(message, regenerate=True)
+
+                elif provider == "speech":
+                    return await text_to_speech(message, regenerate=True)
+        except ChatQueueFull:
+            await bot.answer_callback_query(
+                call.id, "Still working on your previous requests ⏳"
+            )
     else:
         await send_and_add_delete_button(
             message,
@@ -756,19 +1273,64 @@ async def media_regeneration_callback_handler(
 @bot.inline_handler(lambda query: query.query.endswith("..."))
 async def handle_inline_query(inline_query: telebot.types.InlineQuery):
     """Process the inline query and return AI response"""
+    started = monotonic()
+    outcome = "ok"
     try:
-        user_id = get_user_id(user_id=inline_query.from_user.id)
-        logging.info(f"Serving INLINE-QUERY - [{user_id}].")
-        prompt = inline_query.query[:-3]
-        user = User(user_id=user_id)
-        conversation = Conversation(max_tokens=max_tokens)
-        user_provider = provider_map.get(user.chat.provider)
-        conversation_prompt = conversation.gen_complete_prompt(
-            prompt, intro=user.chat.intro
+        user_id = inline_query.user.id
+        logging.info(
+            "Serving INLINE-QUERY - [%s].",
+            user_id,
+            extra=dict(chat_id=user_id, handler="handle_inline_query"),
         )
-        ai_response = user_provider(is_conversation=False, timeout=timeout).chat(
-            conversation_prompt
+        prompt = inline_query.query[:-3]
+        chat = inline_query.user.chat
+        provider = provider_health.resolve(chat.provider, default_provider)
+        # Inline queries don't carry on the chat
+        window = ConversationWindow(get_history_budget("", chat.intro, max_tokens))
+        conversation_prompt = window.gen_complete_prompt(
+            prompt, intro=chat.intro, max_tokens=max_tokens
         )
+
+        async def generate() -> str:
+            # Counts towards the requests in flight along with chats'
+            async with chat_queues.capacity():
+                _, response = await provider_router.chat(
+                    provider, conversation_prompt, timeout
+                )
+            return response
+
+        async def respond() -> str:
+            if response_cache:
+                return await response_cache.get_or_generate(
+                    provider, chat.intro, prompt, generate
+                )
+            return await generate()
+
+        try:
+            # Queries are sent as the user types - only the latest one is served
+            ai_response = await inline_debouncer.run(
+                user_id, f"{provider}:{chat.intro}:{prompt}", respond, inline_deadline
+            )
+        except Superseded:
+            logging.debug("Inline query superseded - [%s]", user_id)
+            return
+        except asyncio.TimeoutError:
+            # Generation carries on, its response is served to the query sent again
+            return await bot.answer_inline_query(
+                inline_query.id,
+                [
+                    telebot.types.InlineQueryResultArticle(
+                        id="0",
+                        title="Still thinking ⏳",
+                        description="Send the query again in a moment for the response",
+                        input_message_content=telebot.types.InputTextMessageContent(
+                            prompt
+                        ),
+                    )
+                ],
+                cache_time=0,
+                is_personal=True,
+            )
         feedback_options = [
             telebot.types.InlineQueryResultArticle(
                 id="1",
@@ -778,12 +1340,24 @@ async def handle_inline_query(inline_query: telebot.types.InlineQuery):
                 ),
             )
         ]
-        await bot.answer_inline_query(inline_query.id, feedback_options)
+        await bot.answer_inline_query(
+            inline_query.id,
+            feedback_options,
+            cache_time=inline_cache_time,
+            is_personal=True,
+        )
 
     except Exception as e:
-        logging.debug(f"Error while handling inline query - [{user_id}]. {e}")
+        outcome = "error"
+        logging.debug("Error while handling inline query - [%s]. %s", user_id, e)
         logging.error(
-            f"Error while handling inline query - [{user_id}] : {e.args[1] if e.args and len(e.args)>1 else e}"
+            "Error while handling inline query - [%s] : %s",
+            user_id,
+            e.args[1] if e.args and len(e.args) > 1 else e,
+        )
+    finally:
+        metrics.handler_seconds.observe(
+            monotonic() - started, "handle_inline_query", outcome
         )
 
 
@@ -804,12 +1378,10 @@ async def any_other_action(message):
     )
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("delete:"))
-async def delete_callback_handler(
-    call: telebot.types.CallbackQuery,
-):
+@callback_router.route("delete")
+async def delete_callback_handler(call: telebot.types.CallbackQuery, payload: str):
     """Delete callback handler"""
-    action, trigger_chat_id, trigger_message_id = call.data.split(":")
+    trigger_chat_id, trigger_message_id = payload.split(":")
     try:
         await bot.delete_message(trigger_chat_id, trigger_message_id)
     except:
@@ -820,8 +1392,225 @@ async def delete_callback_handler(
         pass
 
 
+bot.register_callback_query_handler(
+    callback_router.dispatch, func=callback_router.matches
+)
+
+
+def cache_metrics() -> dict[tuple[str, str], float]:
+    """Size and hit rate of each cache"""
+    caches = dict(chat=chat_cache, media=media_cache)
+    if response_cache:
+        caches["response"] = response_cache
+    values = {}
+    for name, cache in caches.items():
+        stats = cache.stats()
+        for stat in ("size", "hits", "misses", "hit_rate"):
+            values[(name, stat)] = stats[stat]
+    return values
+
+
+for gauge in (
+    Gauge(
+        "pytgpt_bot_chat_requests_in_flight",
+        "Chat requests being served",
+        function=lambda: chat_queues.in_flight,
+    ),
+    Gauge(
+        "pytgpt_bot_chat_requests_queued",
+        "Chat requests waiting for their chat's turn",
+        function=lambda: chat_queues.queued,
+    ),
+    Gauge(
+        "pytgpt_bot_inline_queries_pending",
+        "Inline queries waiting for typing to pause or generating",
+        function=lambda: inline_debouncer.pending,
+    ),
+    Gauge(
+        "pytgpt_bot_sends_waiting",
+        "Outbound Telegram requests waiting for flood limits",
+        function=lambda: bot.scheduler.waiting,
+    ),
+    Gauge(
+        "pytgpt_bot_cache",
+        "Size and hit counters of the caches",
+        labels=("cache", "stat"),
+        function=cache_metrics,
+    ),
+):
+    metrics.registry.register(gauge)
+
+
+async def log_duration(stage: str, awaitable: Awaitable, fallback: Any = None):
+    """Await a startup stage and log how long it took
+
+    Args:
+        stage (str): Stage name.
+        awaitable (Awaitable): Stage's work.
+        fallback (Any, optional): Result of an optional stage that fails. Defaults to None (required).
+
+    Returns:
+        Any: Stage's result.
+    """
+    started = monotonic()
+    try:
+        result = await awaitable
+    except Exception as e:
+        if fallback is None:
+            raise
+        logging.error("Startup stage [%s] failed - %s", stage, e)
+        result = fallback
+    logging.info("Startup stage [%s] took %.2fs", stage, monotonic() - started)
+    return result
+
+
+async def load_g4f_providers(check: bool) -> None:
+    """Load saved g4f provider statuses, falling back to `pytgpt`'s test results
+    when they're not to be checked in the background"""
+    provider_health.load()
+    if not provider_health.statuses and not check:
+        provider_health.seed(await asyncio.to_thread(get_g4f_providers))
+
+
+async def startup(check_providers: bool = True, init_database: bool = True):
+    """Prepare the database, bot info, awesome prompts and g4f providers concurrently
+
+    Args:
+        check_providers (bool, optional): Test g4f providers in the background when
+            `test-g4f` is set, otherwise only re-read the statuses saved. Expired rows
+            are also swept by this process only. Defaults to True.
+        init_database (bool, optional): Create and migrate tables. Workers skip it,
+            the front process has done it before starting them. Defaults to True.
+    """
+    started = monotonic()
+    sweep = check_providers
+    check_providers = check_providers and test_g4f
+    _, bot_info, awesome_prompts, _ = await asyncio.gather(
+        log_duration("database", init_db()) if init_database else asyncio.sleep(0),
+        log_duration("bot info", bot.get_me()),
+        log_duration(
+            "awesome prompts",
+            asyncio.to_thread(lambda: AwesomePrompts().get_acts()),
+            fallback={},
+        ),
+        log_duration(
+            "g4f providers", load_g4f_providers(check_providers), fallback=False
+        ),
+    )
+    if sweep:
+        # Tables exist by now
+        sweeper.start()
+    bot_tagged_filter.bot_info = bot_info
+    awesome_prompts_dict.update(awesome_prompts)
+    awesome_prompts_keys.extend(awesome_prompts_dict.keys())
+    awesome_keyboard.update(awesome_prompts_keys)
+    indexing_started = monotonic()
+    if awesome_index.update(awesome_prompts_dict):
+        logging.debug(
+            "Indexed %d awesome prompts in %.3fs",
+            len(awesome_prompts_dict),
+            monotonic() - indexing_started,
+        )
+    if metrics_enabled:
+        await log_duration("metrics", metrics_server.start(), fallback=False)
+    if test_g4f:
+        provider_health.start(check=check_providers)
+    logging.info(
+        "Bot started sucessfully in %.2fs %s. Admin IDs - [%s]",
+        monotonic() - started,
+        get_random_emoji("happy"),
+        ", ".join(admin_ids),
+    )
+
+
+async def shutdown():
+    """Stop background tasks and release long-lived clients"""
+    await provider_health.stop()
+    await sweeper.stop()
+    await metrics_server.stop()
+    await provider_pool.close()
+
+
+async def start_polling(timeout: int, skip_pending: bool = False):
+    """Poll for updates until stopped then release long-lived clients
+
+    Args:
+        timeout (int): Http request timeout.
+        skip_pending (bool, optional): Ignore updates sent before launch. Defaults to False.
+    """
+    try:
+        await startup()
+        await bot.remove_webhook()
+        await bot.infinity_polling(timeout=timeout, skip_pending=skip_pending)
+    finally:
+        await shutdown()
+
+
+async def start_webhook(skip_pending: bool = False):
+    """Serve updates pushed to the webhook until stopped then release long-lived clients
+
+    Args:
+        skip_pending (bool, optional): Ignore updates sent before launch. Defaults to False.
+    """
+    server = WebhookServer.from_config(bot)
+    try:
+        await startup()
+        await server.register(skip_pending)
+        await server.serve()
+    finally:
+        await shutdown()
+
+
+async def start_worker(queue: Queue, check_providers: bool = True, index: int = 0):
+    """Serve updates handed over by the front process until a `None` is received
+    then release long-lived clients
+
+    Updates of a chat are served one after another, in the order they
+    arrive. Callback and inline queries are served right away - delete
+    presses aren't held up by generations and newer inline queries have to
+    reach the debouncer to supersede older ones.
+
+    Args:
+        queue (multiprocessing.Queue): Updates routed to this worker.
+        check_providers (bool, optional): Test g4f providers and sweep expired rows in this worker. Defaults to True.
+        index (int, optional): Worker index - offsets the metrics port. Defaults to 0.
+    """
+    metrics_server.port += index
+    loop = asyncio.get_running_loop()
+    tasks: set[asyncio.Task] = set()
+    tails: dict[str, asyncio.Task] = {}
+    """Chat id to the task serving the chat's latest update"""
+
+    async def serve(update: dict, previous: asyncio.Task = None):
+        if previous:
+            await asyncio.wait([previous])
+        await bot.process_new_updates([telebot.types.Update.de_json(update)])
+
+    def release(key: str, task: asyncio.Task):
+        if tails.get(key) is task:
+            del tails[key]
+
+    try:
+        await startup(check_providers, init_database=False)
+        while (update := await loop.run_in_executor(None, queue.get)) is not None:
+            if unordered_updates.intersection(update):
+                task = asyncio.create_task(serve(update))
+            else:
+                key = get_update_key(update)
+                task = asyncio.create_task(serve(update, tails.get(key)))
+                tails[key] = task
+                task.add_done_callback(lambda task, key=key: release(key, task))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        await shutdown()
+
+
+bot.setup_middleware(UserMiddleware(chat_queues))
 bot.add_custom_filter(IsBotOwnerFilter())
 bot.add_custom_filter(IsAdminFilter(bot))
 bot.add_custom_filter(IsActiveFilter())
-bot.add_custom_filter(IsBotTaggedFilter(loop.run_until_complete(bot.get_me())))
+bot.add_custom_filter(bot_tagged_filter)
 bot.add_custom_filter(IsChatCommandFilter())
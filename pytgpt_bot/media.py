@@ -0,0 +1,141 @@
+import asyncio
+import logging
+from datetime import datetime
+from hashlib import sha256
+from pathlib import Path
+from threading import Lock
+from pytgpt_bot.cache import LRUCache
+from pytgpt_bot.models import Session, MediaFile
+from pytgpt_bot.utils import bot_dir
+
+path_to_media_dir = bot_dir / "media"
+
+
+class MediaCache:
+    """Telegram file ids of media sent, keyed by what they were generated from
+
+    Sending a file id again skips both the generation and the upload. The
+    generated bytes can also be kept on disk, up to a size, so that media whose
+    file id no longer works isn't generated again.
+    """
+
+    def __init__(
+        self, maxsize: int = 1000, path: Path = path_to_media_dir, max_bytes: int = 0
+    ):
+        """Constructor
+
+        Args:
+            maxsize (int, optional): File ids kept in memory. Defaults to 1000.
+            path (Path, optional): Directory media bytes are kept in. Defaults to path_to_media_dir.
+            max_bytes (int, optional): Size of media bytes kept on disk, 0 disables it. Defaults to 0.
+        """
+        self.memory = LRUCache(maxsize=maxsize, ttl=0)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits: int = 0
+        self.misses: int = 0
+        self.__disk_usage: int = None
+        self.__disk_lock = Lock()
+
+    @staticmethod
+    def make_key(kind: str, variant: str, prompt: str) -> str:
+        """Hash of what determines the media
+
+        Args:
+            kind (str): image|speech
+            variant (str): Image provider or voice.
+            prompt (str): Text media is generated from.
+
+        Returns:
+            str: Media key.
+        """
+        return sha256("\0".join((kind, variant, prompt)).encode()).hexdigest()
+
+    async def get_file_id(self, key: str) -> str | None:
+        """File id of media sent before"""
+        file_id = self.memory.get(key)
+        if file_id is None:
+            async with Session() as session:
+                media = await session.get(MediaFile, key)
+            if media:
+                file_id = media.file_id
+                self.memory.set(key, file_id)
+        if file_id is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return file_id
+
+    async def set_file_id(self, key: str, kind: str, file_id: str) -> None:
+        """Keep the file id of media sent"""
+        self.memory.set(key, file_id)
+        async with Session() as session:
+            await session.merge(
+                MediaFile(
+                    key=key, kind=kind, file_id=file_id, created_on=datetime.utcnow()
+                )
+            )
+            await session.commit()
+
+    async def forget(self, key: str) -> None:
+        """Drop a file id that no longer works"""
+        self.memory.pop(key)
+        async with Session() as session:
+            media = await session.get(MediaFile, key)
+            if media:
+                await session.delete(media)
+                await session.commit()
+
+    async def get_bytes(self, key: str) -> bytes | None:
+        """Media bytes kept on disk"""
+        if not self.max_bytes:
+            return
+        return await asyncio.to_thread(self.__read, key)
+
+    async def set_bytes(self, key: str, content: bytes) -> None:
+        """Keep media bytes on disk, evicting the oldest ones past `max_bytes`"""
+        if not self.max_bytes or len(content) > self.max_bytes:
+            return
+        await asyncio.to_thread(self.__write, key, content)
+
+    def __read(self, key: str) -> bytes | None:
+        try:
+            return (self.path / key).read_bytes()
+        except FileNotFoundError:
+            return
+
+    def __write(self, key: str, content: bytes) -> None:
+        # Runs in a thread, the lock keeps the disk usage count consistent
+        with self.__disk_lock:
+            self.path.mkdir(parents=True, exist_ok=True)
+            if self.__disk_usage is None:
+                self.__disk_usage = sum(
+                    file.stat().st_size for file in self.path.iterdir()
+                )
+            (self.path / key).write_bytes(content)
+            self.__disk_usage += len(content)
+            if self.__disk_usage <= self.max_bytes:
+                return
+            files = sorted(self.path.iterdir(), key=lambda file: file.stat().st_mtime)
+            for file in files:
+                if self.__disk_usage <= self.max_bytes:
+                    break
+                size = file.stat().st_size
+                file.unlink(missing_ok=True)
+                self.__disk_usage -= size
+                logging.debug("Evicted cached media - %s", file.name)
+
+    def clear(self) -> None:
+        """Drop file ids kept in memory"""
+        self.memory.clear()
+
+    def stats(self) -> dict:
+        """Hit and miss counters"""
+        lookups = self.hits + self.misses
+        return dict(
+            size=len(self.memory),
+            hits=self.hits,
+            misses=self.misses,
+            hit_rate=round(self.hits / lookups, 3) if lookups else 0,
+            disk_usage=self.__disk_usage or 0,
+        )
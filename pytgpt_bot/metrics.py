@@ -0,0 +1,303 @@
+import abc
+import logging
+from bisect import bisect_left
+from contextlib import contextmanager
+from time import monotonic
+from typing import Callable, Iterator
+from aiohttp import web
+
+default_buckets: tuple[float] = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+)
+"""Upper bounds of latency histograms' buckets in seconds"""
+
+
+def escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names: tuple[str], values: tuple[str]) -> str:
+    if not names:
+        return ""
+    return "{%s}" % ",".join(
+        f'{name}="{escape(value)}"' for name, value in zip(names, values)
+    )
+
+
+class Metric(abc.ABC):
+    """Metric rendered in the Prometheus text format"""
+
+    kind: str = "untyped"
+
+    def __init__(self, name: str, help: str, labels: tuple[str] = ()):
+        """Constructor
+
+        Args:
+            name (str): Metric name e.g pytgpt_bot_updates_total.
+            help (str): Description.
+            labels (tuple[str], optional): Label names. Defaults to ().
+        """
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+
+    @abc.abstractmethod
+    def samples(self) -> Iterator[tuple[str, str, float]]:
+        """Suffix, labels and value of each sample"""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(
+            f"{self.name}{suffix}{labels} {value}"
+            for suffix, labels, value in self.samples()
+        )
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """Value that only goes up"""
+
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values: dict[tuple[str], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        """Add to the value of a label set"""
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self) -> Iterator[tuple[str, str, float]]:
+        for labels, value in self.values.items():
+            yield "", format_labels(self.labels, labels), value
+
+
+class Histogram(Metric):
+    """Distribution of observed values e.g latencies"""
+
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: tuple[float] = default_buckets, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        self.values: dict[tuple[str], list] = {}
+        """Label set to its bucket counts, sum and count"""
+
+    def observe(self, value: float, *labels: str) -> None:
+        """Record a value of a label set"""
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = [[0] * len(self.buckets), 0.0, 0]
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            entry[0][index] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        """Observe the seconds a block takes, labelled with its outcome
+
+        ```python
+        with histogram.time("text_chat"):
+            ...
+        ```
+
+        The outcome - `ok` or `error` - is appended to the labels.
+        """
+        started = monotonic()
+        outcome = "ok"
+        try:
+            yield
+        except BaseException:
+            outcome = "error"
+            raise
+        finally:
+            self.observe(monotonic() - started, *labels, outcome)
+
+    def samples(self) -> Iterator[tuple[str, str, float]]:
+        for labels, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield "_bucket", format_labels(
+                    (*self.labels, "le"), (*labels, bound)
+                ), cumulative
+            yield "_bucket", format_labels(
+                (*self.labels, "le"), (*labels, "+Inf")
+            ), count
+            yield "_sum", format_labels(self.labels, labels), round(total, 6)
+            yield "_count", format_labels(self.labels, labels), count
+
+
+class Gauge(Metric):
+    """Value read when rendered e.g queue depth
+
+    The function returns the value, or a dict of label values to values.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, *args, function: Callable[[], float | dict], **kwargs):
+        super().__init__(*args, **kwargs)
+        self.function = function
+
+    def samples(self) -> Iterator[tuple[str, str, float]]:
+        value = self.function()
+        if not isinstance(value, dict):
+            yield "", "", value
+            return
+        for labels, label_value in value.items():
+            labels = labels if isinstance(labels, tuple) else (labels,)
+            yield "", format_labels(self.labels, labels), label_value
+
+
+class Registry:
+    """Metrics exposed together"""
+
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Metrics in the Prometheus text format"""
+        rendered = []
+        for metric in self.metrics.values():
+            try:
+                rendered.append(metric.render())
+            except Exception as e:
+                logging.debug("Failed to render metric %s - %s", metric.name, e)
+        return "\n".join(rendered) + "\n"
+
+
+registry = Registry()
+
+handler_seconds: Histogram = registry.register(
+    Histogram(
+        "pytgpt_bot_handler_seconds",
+        "Time taken to serve updates",
+        labels=("handler", "outcome"),
+    )
+)
+provider_seconds: Histogram = registry.register(
+    Histogram(
+        "pytgpt_bot_provider_seconds",
+        "Time taken by chat providers",
+        labels=("provider", "outcome"),
+    )
+)
+query_seconds: Histogram = registry.register(
+    Histogram(
+        "pytgpt_bot_query_seconds",
+        "Time taken by database queries",
+        labels=("statement",),
+    )
+)
+send_seconds: Histogram = registry.register(
+    Histogram(
+        "pytgpt_bot_send_seconds",
+        "Time taken by outbound Telegram requests, flood waits excluded",
+        labels=("method", "outcome"),
+    )
+)
+hedged_requests: Counter = registry.register(
+    Counter(
+        "pytgpt_bot_hedged_requests_total",
+        "Slow chat requests raced against another provider",
+        labels=("provider",),
+    )
+)
+send_wait_seconds: Histogram = registry.register(
+    Histogram(
+        "pytgpt_bot_send_wait_seconds",
+        "Time outbound Telegram requests waited for flood limits",
+        labels=("method",),
+    )
+)
+
+
+def instrument_engine(engine) -> None:
+    """Time the queries of a SQLAlchemy engine
+
+    Args:
+        engine (AsyncEngine | Engine): Database engine.
+    """
+    from sqlalchemy import event
+
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    # Start times are kept on the statement's execution context, which is
+    # dropped along with it whether the statement succeeds or fails
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        if context is not None:
+            context.query_started = monotonic()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, many):
+        started = getattr(context, "query_started", None)
+        if started is not None:
+            query_seconds.observe(
+                monotonic() - started, statement.lstrip().split(" ", 1)[0].upper()
+            )
+
+
+class MetricsServer:
+    """Serves metrics over http at `/metrics`"""
+
+    def __init__(
+        self,
+        registry: Registry = registry,
+        host: str = "127.0.0.1",
+        port: int = 9464,
+    ):
+        """Constructor
+
+        Args:
+            registry (Registry, optional): Metrics served. Defaults to registry.
+            host (str, optional): Interface listened on. Defaults to "127.0.0.1".
+            port (int, optional): Port listened on. Defaults to 9464.
+        """
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.__runner: web.AppRunner = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        return web.Response(
+            text=self.registry.render(),
+            content_type="text/plain",
+            charset="utf-8",
+            headers={"X-Content-Type-Options": "nosniff"},
+        )
+
+    async def start(self) -> None:
+        """Listen in the background"""
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle)
+        self.__runner = web.AppRunner(app, access_log=None)
+        await self.__runner.setup()
+        await web.TCPSite(self.__runner, self.host, self.port).start()
+        logging.info("Serving metrics on http://%s:%s/metrics", self.host, self.port)
+
+    async def stop(self) -> None:
+        """Stop listening"""
+        if self.__runner:
+            await self.__runner.cleanup()
+            self.__runner = None
@@ -0,0 +1,53 @@
+from telebot.asyncio_handler_backends import BaseMiddleware
+from telebot import types
+from pytgpt_bot.db import User
+from pytgpt_bot.queues import ChatQueues
+
+
+class UserMiddleware(BaseMiddleware):
+    """Loads the chat once per update and shares it with filters and handlers
+
+    The loaded `User` is attached to the update as `message.user`. Messages
+    also reserve their chat's turn on arrival, as `message.ticket`, which is
+    released once they're served.
+    """
+
+    def __init__(self, chat_queues: ChatQueues = None):
+        """Constructor
+
+        Args:
+            chat_queues (ChatQueues, optional): Queues messages reserve turns of. Defaults to None.
+        """
+        self.update_types: list[str] = ["message", "channel_post", "inline_query"]
+        self.chat_queues = chat_queues
+
+    async def pre_process(
+        self, message: types.Message | types.InlineQuery, data: dict
+    ) -> None:
+        if isinstance(message, types.InlineQuery):
+            user = User(user_id=message.from_user.id)
+        else:
+            user = User(message)
+            if self.chat_queues:
+                # Reserved before awaiting anything, in the order of arrival
+                message.ticket = self.chat_queues.reserve(user.id)
+                data["ticket"] = (user.id, message.ticket)
+        try:
+            message.user = await user.open()
+        except BaseException:
+            if data.get("ticket"):
+                self.chat_queues.release(*data["ticket"])
+            raise
+        data["user"] = user
+
+    async def post_process(
+        self,
+        message: types.Message | types.InlineQuery,
+        data: dict,
+        exception: Exception | None,
+    ) -> None:
+        if data.get("ticket"):
+            self.chat_queues.release(*data["ticket"])
+        user: User = data.get("user")
+        if user:
+            await user.close(exception)
@@ -1,12 +1,20 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import logging
+from sqlalchemy.engine import make_url, URL
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.orm import declarative_base
-from sqlalchemy.orm import relationship
-from sqlalchemy import Column, Integer, Text, String, Boolean, DateTime
+from sqlalchemy import Column, Integer, Text, String, Boolean, DateTime, Index, Float
+from sqlalchemy import select, func, text, inspect
+from sqlalchemy import Connection, MetaData, Table
+from sqlalchemy.exc import IntegrityError
 from pytgpt.utils import Conversation
 from pytgpt_bot.config import database as database_str
 from pytgpt_bot.config import provider as default_provider
 from pytgpt_bot.config import voice
+from pytgpt_bot.history import split_history, render_message, render_history
+from pytgpt_bot.history import estimate_tokens
 from datetime import datetime
 
 if not database_str:
@@ -14,15 +22,48 @@ if not database_str:
 
     database_str: str = f"sqlite:///{path_to_default_db.as_posix()}"
 
-engine = create_engine(database_str)
+async_drivers: dict[str, str] = {
+    "sqlite": "aiosqlite",
+    "postgresql": "asyncpg",
+    "mysql": "aiomysql",
+    "mariadb": "aiomysql",
+}
+"""Asyncio driver used for each database backend"""
 
-autocommit_engine = engine.execution_options(isolation_level="AUTOCOMMIT")
+known_async_drivers: tuple[str] = (
+    "aiosqlite",
+    "asyncpg",
+    "aiomysql",
+    "asyncmy",
+    "psycopg",
+)
 
-Session = sessionmaker(bind=autocommit_engine)
 
-session = Session()
+def get_async_url(url: str) -> URL:
+    """Swaps the driver of a database url for its asyncio counterpart
 
-Base = declarative_base()
+    Args:
+        url (str): Database engine URL e.g sqlite:///telegram.db
+
+    Returns:
+        URL: Url with an asyncio driver e.g sqlite+aiosqlite:///telegram.db
+    """
+    url = make_url(url)
+    if url.get_driver_name() in known_async_drivers:
+        return url
+    backend = url.get_backend_name()
+    assert (
+        backend in async_drivers
+    ), f"Database backend '{backend}' is not one of {', '.join(async_drivers)}"
+    return url.set(drivername=f"{backend}+{async_drivers[backend]}")
+
+
+engine = create_async_engine(get_async_url(database_str))
+
+Session = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+"""Session factory - open one session per update"""
+
+Base = declarative_base(cls=AsyncAttrs)
 
 
 class Chat(Base):
@@ -30,30 +71,173 @@ class Chat(Base):
     id = Column(String(20), primary_key=True)
     intro = Column(Text, default=Conversation.intro, nullable=False)
     provider = Column(String(20), default=default_provider, nullable=False)
-    history = Column(Text, default="")
+    history = Column(Text, default="")  # legacy - see `ChatMessage`
     voice = Column(String(30), default=voice, nullable=False)
     is_active = Column(Boolean, default=True, nullable=False)
     updated_on = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
+class ChatMessage(Base):
+    __tablename__ = "messages"
+    __table_args__ = (Index("ux_messages_chat_id_seq", "chat_id", "seq", unique=True),)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    chat_id = Column(String(20), nullable=False)
+    seq = Column(Integer, nullable=False)
+    role = Column(String(10), nullable=False)
+    content = Column(Text, nullable=False)
+    token_estimate = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
 class Temp(Base):
     __tablename__ = "temps"
     id = Column(Integer, primary_key=True, autoincrement=True)
     uuid = Column(String(48), unique=True)
     prompt = Column(Text)
     provider = Column(String(20))
-    updated_on = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_on = Column(
+        DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True
+    )
 
 
-def create_all():
-    """Create tables from models"""
-    Base.metadata.create_all(engine)
+class CachedResponse(Base):
+    __tablename__ = "responses"
+    key = Column(String(64), primary_key=True)
+    response = Column(Text, nullable=False)
+    latency = Column(Float, default=0)
+    created_on = Column(DateTime, default=datetime.utcnow, index=True)
 
 
-def drop_all():
-    """Drop all tables created"""
-    Base.metadata.drop_all(engine)
+class MediaFile(Base):
+    __tablename__ = "media"
+    key = Column(String(64), primary_key=True)
+    kind = Column(String(10), nullable=False)
+    file_id = Column(String(255), nullable=False)
+    created_on = Column(DateTime, default=datetime.utcnow, index=True)
 
 
-# drop_all()
-create_all()
+async def create_all():
+    """Create tables from models"""
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+
+
+async def drop_all():
+    """Drop all tables created"""
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.drop_all)
+
+
+legacy_indexes: dict[str, str] = {"ix_messages_chat_id_seq": "ux_messages_chat_id_seq"}
+"""Indexes replaced, mapped to the ones replacing them"""
+
+
+async def create_indexes():
+    """Add indexes declared after their tables were created and drop the ones
+    they replace"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                async with engine.begin() as connection:
+                    await connection.run_sync(index.create, checkfirst=True)
+            except IntegrityError as e:
+                # Rows written before the index was unique
+                logging.warning("Failed to create index %s - %s", index.name, e)
+    async with engine.begin() as connection:
+        await connection.run_sync(drop_legacy_indexes)
+
+
+def drop_legacy_indexes(connection: Connection) -> None:
+    """Drop indexes in `legacy_indexes` once the ones replacing them exist"""
+    for table in Base.metadata.sorted_tables:
+        existing = {
+            index["name"] for index in inspect(connection).get_indexes(table.name)
+        }
+        legacy = {
+            name
+            for name, replacement in legacy_indexes.items()
+            if name in existing and replacement in existing
+        }
+        if not legacy:
+            continue
+        reflected = Table(table.name, MetaData(), autoload_with=connection)
+        for index in reflected.indexes:
+            if index.name in legacy:
+                index.drop(connection)
+
+
+table_size_queries: dict[str, str] = {
+    "sqlite": "SELECT SUM(pgsize) FROM dbstat WHERE name = :table",
+    "postgresql": "SELECT pg_total_relation_size(:table)",
+    "mysql": (
+        "SELECT data_length + index_length FROM information_schema.tables"
+        " WHERE table_schema = DATABASE() AND table_name = :table"
+    ),
+}
+"""Query for the bytes a table and its indexes take, for each database backend"""
+table_size_queries["mariadb"] = table_size_queries["mysql"]
+
+
+async def table_stats() -> list[dict]:
+    """Row counts and sizes of the tables
+
+    Returns:
+        list[dict]: Table name, rows and bytes - None when the backend can't tell.
+    """
+    size_query = table_size_queries.get(engine.dialect.name)
+    stats = []
+    async with Session() as session:
+        for table in Base.metadata.sorted_tables:
+            rows = await session.scalar(select(func.count()).select_from(table))
+            size = None
+            if size_query:
+                try:
+                    size = await session.scalar(
+                        text(size_query), dict(table=table.name)
+                    )
+                except Exception as e:
+                    logging.debug("Failed to get size of %s - %s", table.name, e)
+                    await session.rollback()
+            stats.append(dict(name=table.name, rows=rows, size=size))
+    return stats
+
+
+async def migrate_history():
+    """Split legacy `Chat.history` texts into `ChatMessage` rows
+
+    Histories that don't render back from the messages split off them e.g
+    with text before the first turn are left as they are.
+    """
+    async with Session() as session:
+        chat_ids = await session.scalars(
+            select(Chat.id).where(Chat.history != "", Chat.history.is_not(None))
+        )
+        for chat_id in chat_ids.all():
+            chat = await session.get(Chat, chat_id)
+            messages = [
+                ChatMessage(
+                    chat_id=chat.id,
+                    seq=seq,
+                    role=role,
+                    content=content,
+                    token_estimate=estimate_tokens(render_message(role, content)),
+                )
+                for seq, (role, content) in enumerate(split_history(chat.history))
+            ]
+            if render_history(messages) != chat.history:
+                logging.warning(
+                    "History of chat [%s] couldn't be split into messages - left unmigrated",
+                    chat.id,
+                )
+                continue
+            session.add_all(messages)
+            chat.history = ""
+            await session.commit()
+
+
+async def init_db():
+    """Create tables, migrate data and release the connections bound to the current event loop"""
+    await create_all()
+    await create_indexes()
+    await migrate_history()
+    await engine.dispose()
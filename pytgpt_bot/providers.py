@@ -0,0 +1,124 @@
+import httpx
+import logging
+from typing import AsyncGenerator
+import pytgpt.imager as image_generator
+from pytgpt.gpt4free import AsyncGPT4FREE
+from pytgpt_bot.utils import provider_map
+
+image_providers: dict[str, type] = dict(
+    default=image_generator.AsyncImager,
+    prodia=image_generator.AsyncProdia,
+)
+
+unpooled_providers: tuple[str] = ("auto",)
+"""Providers that swap their underlying client on every request"""
+
+
+class ProviderPool:
+    """Long-lived provider clients keyed by (provider name, timeout)
+
+    Clients are reused across messages so that their http connections are
+    kept alive instead of being re-established on every request.
+    """
+
+    def __init__(self, pool_size: int = 20):
+        """Constructor
+
+        Args:
+            pool_size (int, optional): Connections each client keeps alive. Defaults to 20.
+        """
+        self.limits = httpx.Limits(
+            max_connections=pool_size, max_keepalive_connections=pool_size
+        )
+        self.__clients: dict[tuple[str, int], object] = {}
+
+    def __make(self, name: str, timeout: int) -> object:
+        """Instantiate provider"""
+        if name in image_providers:
+            client = image_providers[name](timeout=timeout)
+        else:
+            provider_class = provider_map.get(name, AsyncGPT4FREE)
+            provider_class_kwargs: dict = dict(is_conversation=False, timeout=timeout)
+            if provider_class is AsyncGPT4FREE:
+                # gp4f provider
+                provider_class_kwargs["provider"] = name
+            client = provider_class(**provider_class_kwargs)
+
+        session = getattr(client, "session", None)
+        if isinstance(session, httpx.AsyncClient):
+            # Size the connection pool - the replaced client hasn't connected yet
+            client.session = httpx.AsyncClient(
+                headers=session.headers,
+                cookies=session.cookies,
+                timeout=session.timeout,
+                follow_redirects=session.follow_redirects,
+                limits=self.limits,
+            )
+        return client
+
+    def get(self, name: str, timeout: int) -> object:
+        """Get a provider client, creating it on first use
+
+        Args:
+            name (str): Chat provider name or image provider (default/prodia).
+            timeout (int): Http request timeout.
+
+        Returns:
+            object: Provider instance.
+        """
+        if name in unpooled_providers:
+            return self.__make(name, timeout)
+        key = (name, timeout)
+        client = self.__clients.get(key)
+        if client is None:
+            client = self.__make(name, timeout)
+            self.__clients[key] = client
+        return client
+
+    async def chat(self, name: str, prompt: str, timeout: int) -> str:
+        """Generate response from a chat provider
+
+        Args:
+            name (str): Provider name.
+            prompt (str): Conversation prompt.
+            timeout (int): Http request timeout.
+
+        Returns:
+            str: Response generated.
+        """
+        if name in unpooled_providers:
+            return await self.get(name, timeout).chat(prompt)
+        # Shared clients keep `last_response` per instance, so read the final
+        # chunk of this request's own stream instead.
+        response: str = ""
+        async for response in self.stream(name, prompt, timeout):
+            pass
+        return response
+
+    async def stream(
+        self, name: str, prompt: str, timeout: int
+    ) -> AsyncGenerator[str, None]:
+        """Generate response from a chat provider chunk by chunk
+
+        Args:
+            name (str): Provider name.
+            prompt (str): Conversation prompt.
+            timeout (int): Http request timeout.
+
+        Yields:
+            str: Response generated so far.
+        """
+        provider = self.get(name, timeout)
+        async for response in await provider.chat(prompt, stream=True):
+            yield response
+
+    async def close(self) -> None:
+        """Close the connections of all clients"""
+        for (name, _), client in self.__clients.items():
+            session = getattr(client, "session", None)
+            if isinstance(session, httpx.AsyncClient):
+                try:
+                    await session.aclose()
+                except Exception as e:
+                    logging.debug("Failed to close provider client - %s : %s", name, e)
+        self.__clients.clear()
@@ -0,0 +1,209 @@
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+
+class ChatQueueFull(Exception):
+    """Chat has too many updates waiting to be served"""
+
+
+class ChatQueues:
+    """Serves the updates of each chat one at a time
+
+    Updates of a chat wait for the ones before them, so that a turn always sees
+    the history written by the previous one. Excess updates are rejected and the
+    number of updates being served across all chats is capped.
+
+    A chat's turns are handed out in the order they're reserved. Reserve one as
+    soon as an update is received - before anything is awaited - for updates to
+    be served in the order they arrive.
+
+    ```python
+    ticket = chat_queues.reserve(chat_id)
+    ...
+    async with chat_queues.slot(chat_id, ticket):
+        ...
+    ```
+    """
+
+    def __init__(self, max_depth: int = 3, concurrency: int = 50):
+        """Constructor
+
+        Args:
+            max_depth (int, optional): Updates a chat can have queued, including the one being served. Defaults to 3.
+            concurrency (int, optional): Updates served at once across all chats. Defaults to 50.
+        """
+        self.max_depth = max_depth
+        self.concurrency = concurrency
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.__turns: dict[str, deque[asyncio.Future]] = {}
+        """Chat id to its reserved turns, the one being served first"""
+        self.__depths: dict[str, int] = {}
+        self.in_flight: int = 0
+        """Updates being served across all chats"""
+
+    def depth(self, chat_id: int | str) -> int:
+        """Updates of a chat queued or being served"""
+        return self.__depths.get(str(chat_id), 0)
+
+    @property
+    def queued(self) -> int:
+        """Updates queued or being served across all chats"""
+        return sum(self.__depths.values())
+
+    def reserve(self, chat_id: int | str) -> asyncio.Future:
+        """Take the chat's next turn
+
+        Args:
+            chat_id (int | str): Chat id.
+
+        Returns:
+            asyncio.Future: Ticket - done once the turns before it are released.
+        """
+        turns = self.__turns.setdefault(str(chat_id), deque())
+        ticket = asyncio.get_running_loop().create_future()
+        if not turns:
+            ticket.set_result(None)
+        turns.append(ticket)
+        return ticket
+
+    def release(self, chat_id: int | str, ticket: asyncio.Future) -> None:
+        """Give up a turn, used or not, letting the next one through
+
+        Args:
+            chat_id (int | str): Chat id.
+            ticket (asyncio.Future): Ticket of the turn - released ones are ignored.
+        """
+        chat_id = str(chat_id)
+        turns = self.__turns.get(chat_id)
+        if not turns or ticket not in turns:
+            return
+        turns.remove(ticket)
+        if not turns:
+            # Chat is idle
+            del self.__turns[chat_id]
+        elif not turns[0].done():
+            turns[0].set_result(None)
+
+    @asynccontextmanager
+    async def capacity(self) -> AsyncIterator[None]:
+        """Wait for a free slot, regardless of chats' turns"""
+        async with self.semaphore:
+            self.in_flight += 1
+            try:
+                yield
+            finally:
+                self.in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(
+        self, chat_id: int | str, ticket: asyncio.Future = None
+    ) -> AsyncIterator[None]:
+        """Wait for the chat's turn and a free slot
+
+        Args:
+            chat_id (int | str): Chat id.
+            ticket (asyncio.Future, optional): Turn reserved earlier. Defaults to None (next one).
+
+        Raises:
+            ChatQueueFull: The chat already has `max_depth` updates queued.
+        """
+        chat_id = str(chat_id)
+        depth = self.__depths.get(chat_id, 0)
+        if depth >= self.max_depth:
+            raise ChatQueueFull(f"Chat [{chat_id}] has {depth} updates queued")
+        self.__depths[chat_id] = depth + 1
+        ticket = ticket or self.reserve(chat_id)
+        try:
+            await asyncio.shield(ticket)
+            async with self.capacity():
+                yield
+        finally:
+            self.release(chat_id, ticket)
+            self.__depths[chat_id] -= 1
+            if not self.__depths[chat_id]:
+                del self.__depths[chat_id]
+
+
+class Superseded(Exception):
+    """A newer call took over"""
+
+
+class Debouncer:
+    """Runs the latest call per key after a quiet period
+
+    A call cancels the pending one of the same key, unless it's made for the
+    same thing - then it takes the pending one's result instead, which is kept
+    for `keep` seconds. Meant for inline queries, which are sent as the user
+    types.
+    """
+
+    def __init__(self, delay: float = 0.5, keep: float = 60):
+        """Constructor
+
+        Args:
+            delay (float, optional): Seconds a call waits for a newer one. Defaults to 0.5.
+            keep (float, optional): Seconds a result is kept for repeated calls. Defaults to 60.
+        """
+        self.delay = delay
+        self.keep = keep
+        self.superseded: int = 0
+        self.__pending: dict[str, tuple[str, asyncio.Task]] = {}
+
+    async def __delayed(self, generate: Callable[[], Awaitable]) -> Any:
+        await asyncio.sleep(self.delay)
+        return await generate()
+
+    def __drop(self, key: str, task: asyncio.Task) -> None:
+        if self.__pending.get(key, (None, None))[1] is task:
+            del self.__pending[key]
+
+    def __done(self, key: str, task: asyncio.Task) -> None:
+        # Exception is retrieved for calls no longer awaited
+        if task.cancelled() or task.exception():
+            self.__drop(key, task)
+        else:
+            asyncio.get_running_loop().call_later(self.keep, self.__drop, key, task)
+
+    async def run(
+        self,
+        key: int | str,
+        tag: str,
+        generate: Callable[[], Awaitable],
+        deadline: float = None,
+    ) -> Any:
+        """Run a call once no newer one has been made in `delay` seconds
+
+        Args:
+            key (int | str): Calls of the same key supersede each other e.g user id.
+            tag (str): What the call is for e.g query.
+            generate (Callable[[], Awaitable]): Makes the call.
+            deadline (float, optional): Seconds to wait for the result. Defaults to None.
+
+        Raises:
+            Superseded: A newer call of the same key was made.
+            asyncio.TimeoutError: Deadline passed - the call carries on in the background.
+
+        Returns:
+            Any: Result of the call.
+        """
+        key = str(key)
+        pending_tag, task = self.__pending.get(key, (None, None))
+        if task is None or pending_tag != tag:
+            if task and task.cancel():
+                self.superseded += 1
+            task = asyncio.create_task(self.__delayed(generate))
+            task.add_done_callback(lambda task: self.__done(key, task))
+            self.__pending[key] = (tag, task)
+        done, _ = await asyncio.wait({task}, timeout=deadline)
+        if not done:
+            raise asyncio.TimeoutError(f"Call [{key}] is past its deadline")
+        if task.cancelled():
+            raise Superseded(f"Call [{key}] was superseded")
+        return task.result()
+
+    @property
+    def pending(self) -> int:
+        """Calls being waited for or made"""
+        return sum(not task.done() for _, task in self.__pending.values())
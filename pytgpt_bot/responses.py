@@ -0,0 +1,128 @@
+from datetime import datetime, timedelta
+from hashlib import sha256
+from time import monotonic
+from typing import Awaitable, Callable
+from pytgpt_bot.cache import LRUCache
+from pytgpt_bot.models import Session, CachedResponse
+
+
+class ResponseCache:
+    """Responses to identical prompts, kept in memory and optionally in the database
+
+    Only to be used where the response doesn't depend on conversation history
+    i.e inline queries and first turns.
+    """
+
+    def __init__(self, maxsize: int = 1000, ttl: int = 3600, persist: bool = False):
+        """Constructor
+
+        Args:
+            maxsize (int, optional): Responses kept in memory. Defaults to 1000.
+            ttl (int, optional): Seconds a response is reused. Defaults to 3600.
+            persist (bool, optional): Keep responses in the database too. Defaults to False.
+        """
+        self.memory = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.ttl = ttl
+        self.persist = persist
+        self.hits: int = 0
+        self.misses: int = 0
+        self.saved_seconds: float = 0
+
+    @staticmethod
+    def make_key(provider: str, intro: str, prompt: str) -> str:
+        """Hash of what determines a stateless response"""
+        return sha256("\0".join((provider, intro, prompt)).encode()).hexdigest()
+
+    async def __lookup(self, key: str) -> tuple[str, float] | None:
+        entry = self.memory.get(key)
+        if entry or not self.persist:
+            return entry
+        async with Session() as session:
+            cached = await session.get(CachedResponse, key)
+            if cached is None:
+                return
+            if self.ttl and cached.created_on < datetime.utcnow() - timedelta(
+                seconds=self.ttl
+            ):
+                await session.delete(cached)
+                await session.commit()
+                return
+        entry = (cached.response, cached.latency)
+        self.memory.set(key, entry)
+        return entry
+
+    async def get(self, key: str) -> str | None:
+        """Look up a response
+
+        Args:
+            key (str): Response key.
+
+        Returns:
+            str | None: Response.
+        """
+        entry = await self.__lookup(key)
+        if entry is None:
+            self.misses += 1
+            return
+        self.hits += 1
+        self.saved_seconds += entry[1]
+        return entry[0]
+
+    async def set(self, key: str, response: str, latency: float) -> None:
+        """Keep a response
+
+        Args:
+            key (str): Response key.
+            response (str): Response generated.
+            latency (float): Seconds it took to generate.
+        """
+        self.memory.set(key, (response, latency))
+        if self.persist:
+            async with Session() as session:
+                await session.merge(
+                    CachedResponse(
+                        key=key,
+                        response=response,
+                        latency=latency,
+                        created_on=datetime.utcnow(),
+                    )
+                )
+                await session.commit()
+
+    async def get_or_generate(
+        self, provider: str, intro: str, prompt: str, generate: Callable[[], Awaitable]
+    ) -> str:
+        """Reuse the response to an identical prompt or generate one
+
+        Args:
+            provider (str): Provider name.
+            intro (str): Chat intro.
+            prompt (str): User prompt.
+            generate (Callable[[], Awaitable[str]]): Generates the response.
+
+        Returns:
+            str: Response.
+        """
+        key = self.make_key(provider, intro, prompt)
+        response = await self.get(key)
+        if response is not None:
+            return response
+        started = monotonic()
+        response = await generate()
+        await self.set(key, response, monotonic() - started)
+        return response
+
+    def clear(self) -> None:
+        """Drop responses kept in memory"""
+        self.memory.clear()
+
+    def stats(self) -> dict:
+        """Hit and miss counters"""
+        lookups = self.hits + self.misses
+        return dict(
+            size=len(self.memory),
+            hits=self.hits,
+            misses=self.misses,
+            hit_rate=round(self.hits / lookups, 3) if lookups else 0,
+            saved_seconds=round(self.saved_seconds, 1),
+        )
@@ -0,0 +1,259 @@
+import asyncio
+import logging
+from collections import deque
+from time import monotonic
+from typing import AsyncGenerator, Callable
+from pytgpt_bot.providers import ProviderPool
+from pytgpt_bot import metrics
+
+unhealthy_error_rate: float = 0.5
+"""Error rate past which a provider isn't failed over to"""
+
+min_samples: int = 5
+"""Requests made before a provider's stats are trusted"""
+
+
+class ProviderStats:
+    """Latencies and outcomes of a provider's latest requests"""
+
+    def __init__(self, size: int = 100):
+        """Constructor
+
+        Args:
+            size (int, optional): Requests remembered. Defaults to 100.
+        """
+        self.latencies: deque[float] = deque(maxlen=size)
+        self.outcomes: deque[bool] = deque(maxlen=size)
+
+    def record(self, latency: float, ok: bool) -> None:
+        """Remember a request
+
+        Args:
+            latency (float): Seconds taken.
+            ok (bool): Request succeeded.
+        """
+        self.outcomes.append(ok)
+        if ok:
+            self.latencies.append(latency)
+
+    def percentile(self, q: float) -> float | None:
+        """Latency of successful requests at a percentile e.g 0.95"""
+        if not self.latencies:
+            return
+        latencies = sorted(self.latencies)
+        return latencies[min(int(q * len(latencies)), len(latencies) - 1)]
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    @property
+    def is_trusted(self) -> bool:
+        return len(self.outcomes) >= min_samples
+
+    @property
+    def score(self) -> float:
+        """Expected cost of a request - lower is better"""
+        return (self.percentile(0.5) or 0) * (1 + 4 * self.error_rate)
+
+
+class ProviderRouter:
+    """Routes chat requests to providers by their latency and error rate
+
+    The chat's provider is tried first. If it fails, the request fails over to
+    the next best providers. With hedging, a request still pending after the
+    provider's p95 latency is raced against the next best provider and the
+    slower one is cancelled.
+    """
+
+    def __init__(
+        self,
+        pool: ProviderPool,
+        candidates: Callable[[], list[str]],
+        failover: int = 2,
+        hedge: bool = False,
+        min_hedge_delay: float = 1,
+    ):
+        """Constructor
+
+        Args:
+            pool (ProviderPool): Provider clients.
+            candidates (Callable[[], list[str]]): Returns providers requests can be failed over to.
+            failover (int, optional): Other providers tried after a failure. Defaults to 2.
+            hedge (bool, optional): Race slow requests against another provider. Defaults to False.
+            min_hedge_delay (float, optional): Seconds waited before hedging. Defaults to 1.
+        """
+        self.pool = pool
+        self.candidates = candidates
+        self.failover = failover
+        self.hedge = hedge
+        self.min_hedge_delay = min_hedge_delay
+        self.stats: dict[str, ProviderStats] = {}
+
+    def get_stats(self, name: str) -> ProviderStats:
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = ProviderStats()
+        return stats
+
+    def record(self, name: str, latency: float, ok: bool) -> None:
+        """Remember a request to a provider"""
+        self.get_stats(name).record(latency, ok)
+        metrics.provider_seconds.observe(latency, name, "ok" if ok else "error")
+
+    def rank(self, preferred: str) -> list[str]:
+        """Providers to try in order
+
+        Args:
+            preferred (str): Chat's provider.
+
+        Returns:
+            list[str]: The preferred provider followed by the best others.
+        """
+        others = []
+        for position, name in enumerate(self.candidates()):
+            if name == preferred:
+                continue
+            stats = self.stats.get(name)
+            if stats is None or not stats.is_trusted:
+                # Untried providers keep their listed order after the known ones
+                others.append((1, position, name))
+            elif stats.error_rate < unhealthy_error_rate:
+                others.append((0, stats.score, name))
+        return [preferred] + [name for *_, name in sorted(others)][: self.failover]
+
+    async def __request(self, name: str, prompt: str, timeout: int) -> str:
+        """Make a request, recording its latency and outcome"""
+        started = monotonic()
+        try:
+            response = await self.pool.chat(name, prompt, timeout)
+            if not response:
+                raise ValueError("Empty response")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.record(name, monotonic() - started, False)
+            raise
+        self.record(name, monotonic() - started, True)
+        return response
+
+    def __hedge_delay(self, name: str) -> float | None:
+        stats = self.stats.get(name)
+        if not (self.hedge and stats and stats.is_trusted):
+            return
+        return max(stats.percentile(0.95) or 0, self.min_hedge_delay)
+
+    async def __hedged_request(
+        self, name: str, backups: list[str], prompt: str, timeout: int
+    ) -> tuple[str, str]:
+        """Race a slow request against the first of the backup providers,
+        taking it off the list once it's used"""
+        primary = asyncio.create_task(self.__request(name, prompt, timeout))
+        done, _ = await asyncio.wait({primary}, timeout=self.__hedge_delay(name))
+        if done:
+            return name, primary.result()
+
+        backup = backups.pop(0)
+        logging.debug("Hedging request to [%s] with [%s]", name, backup)
+        metrics.hedged_requests.inc(name)
+        secondary = asyncio.create_task(self.__request(backup, prompt, timeout))
+        tasks = {primary: name, secondary: backup}
+        pending = set(tasks)
+        error: Exception = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        return tasks[task], task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def chat(self, preferred: str, prompt: str, timeout: int) -> tuple[str, str]:
+        """Generate response, failing over to other providers on error
+
+        Args:
+            preferred (str): Chat's provider.
+            prompt (str): Conversation prompt.
+            timeout (int): Http request timeout.
+
+        Returns:
+            tuple[str, str]: Provider that responded and its response.
+        """
+        providers = self.rank(preferred)
+        error: Exception = None
+        while providers:
+            name = providers.pop(0)
+            try:
+                if providers and self.__hedge_delay(name):
+                    return await self.__hedged_request(name, providers, prompt, timeout)
+                return name, await self.__request(name, prompt, timeout)
+            except Exception as e:
+                logging.warning("Provider [%s] failed - %s", name, e)
+                error = e
+        raise error
+
+    async def stream(
+        self, preferred: str, prompt: str, timeout: int
+    ) -> AsyncGenerator[str, None]:
+        """Generate response chunk by chunk, failing over to other providers
+        on errors raised before the first chunk
+
+        Args:
+            preferred (str): Chat's provider.
+            prompt (str): Conversation prompt.
+            timeout (int): Http request timeout.
+
+        Yields:
+            str: Response generated so far.
+        """
+        error: Exception = None
+        for name in self.rank(preferred):
+            started = monotonic()
+            streamed = False
+            try:
+                async for response in self.pool.stream(name, prompt, timeout):
+                    streamed = True
+                    yield response
+                if not streamed:
+                    raise ValueError("Empty response")
+            except Exception as e:
+                self.record(name, monotonic() - started, False)
+                if streamed:
+                    raise
+                logging.warning("Provider [%s] failed - %s", name, e)
+                error = e
+                continue
+            self.record(name, monotonic() - started, True)
+            return
+        raise error
+
+    def summary(self, limit: int = 10) -> list[dict]:
+        """Stats of the most used providers
+
+        Args:
+            limit (int, optional): Providers listed. Defaults to 10.
+
+        Returns:
+            list[dict]: Provider name, requests, p50 and p95 latencies and error rate.
+        """
+        ranked = sorted(
+            self.stats.items(), key=lambda item: len(item[1].outcomes), reverse=True
+        )
+        return [
+            dict(
+                name=name,
+                requests=len(stats.outcomes),
+                p50=stats.percentile(0.5),
+                p95=stats.percentile(0.95),
+                error_rate=stats.error_rate,
+            )
+            for name, stats in ranked[:limit]
+        ]
@@ -0,0 +1,91 @@
+import json
+import re
+from collections import defaultdict
+from hashlib import sha256
+
+name_weight: float = 3.0
+"""Weight of trigrams matched in a name over those matched in a body"""
+
+
+def make_trigrams(text: str) -> set[str]:
+    """Trigrams of the words of a text, padded so that prefixes count
+
+    Args:
+        text (str): Text.
+
+    Returns:
+        set[str]: Trigrams e.g {"  l", " li", "lin", "inu", "nux", "ux "}
+    """
+    trigrams = set()
+    for word in re.findall(r"\w+", text.lower()):
+        padded = f"  {word} "
+        trigrams.update(padded[index : index + 3] for index in range(len(padded) - 2))
+    return trigrams
+
+
+class TrigramIndex:
+    """Inverted index of trigrams over named documents e.g awesome prompts
+
+    Documents are scored by the query trigrams found in their names and
+    bodies - names weigh more - over the number of query trigrams, so partial
+    and misspelt words still match.
+    """
+
+    def __init__(self):
+        self.fingerprint: str = None
+        """Hash of the documents indexed"""
+        self.postings: dict[str, dict[str, float]] = {}
+        """Trigram to the names of documents it occurs in and its weight there"""
+
+    @staticmethod
+    def make_fingerprint(documents: dict[str, str]) -> str:
+        return sha256(json.dumps(documents, sort_keys=True).encode()).hexdigest()
+
+    def update(self, documents: dict[str, str]) -> bool:
+        """Index documents, unless they're the ones indexed already
+
+        Args:
+            documents (dict[str, str]): Names and bodies.
+
+        Returns:
+            bool: Index was rebuilt.
+        """
+        fingerprint = self.make_fingerprint(documents)
+        if fingerprint == self.fingerprint:
+            return False
+        postings: dict[str, dict[str, float]] = defaultdict(dict)
+        for name, body in documents.items():
+            for trigram in make_trigrams(body):
+                postings[trigram][name] = 1.0
+            for trigram in make_trigrams(name):
+                postings[trigram][name] = postings[trigram].get(name, 0) + name_weight
+        self.postings = dict(postings)
+        self.fingerprint = fingerprint
+        return True
+
+    def search(self, query: str, limit: int = 10, min_score: float = 0.3) -> list[str]:
+        """Names of the documents matching a query best
+
+        Args:
+            query (str): Text searched for.
+            limit (int, optional): Names returned. Defaults to 10.
+            min_score (float, optional): Score a document must reach - 1 being all the
+                query trigrams found in its name. Defaults to 0.3.
+
+        Returns:
+            list[str]: Names, best match first.
+        """
+        trigrams = make_trigrams(query)
+        if not trigrams:
+            return []
+        scores: dict[str, float] = defaultdict(float)
+        for trigram in trigrams:
+            for name, weight in self.postings.get(trigram, {}).items():
+                scores[name] += weight
+        full_name_match = len(trigrams) * name_weight
+        ranked = sorted(
+            (-score / full_name_match, name)
+            for name, score in scores.items()
+            if score / full_name_match >= min_score
+        )
+        return [name for _, name in ranked[:limit]]
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from time import monotonic
+from sqlalchemy import Column, select, delete
+from pytgpt_bot.models import Session
+
+
+class Sweeper:
+    """Deletes expired rows in the background
+
+    Rows are deleted in batches - each in its own transaction - so that a large
+    backlog doesn't hold locks for long.
+
+    ```python
+    sweeper.add(Temp.updated_on, 7 * 24 * 3600)
+    sweeper.start()
+    ```
+    """
+
+    def __init__(self, interval: int = 3600, batch_size: int = 1000):
+        """Constructor
+
+        Args:
+            interval (int, optional): Seconds between sweeps. Defaults to 3600.
+            batch_size (int, optional): Rows deleted at once. Defaults to 1000.
+        """
+        self.interval = interval
+        self.batch_size = batch_size
+        self.rules: list[tuple[Column, int]] = []
+        self.deleted: dict[str, int] = {}
+        """Rows deleted per table since launch"""
+        self.__task: asyncio.Task = None
+
+    def add(self, column: Column, retention: int) -> None:
+        """Expire rows of a table
+
+        Args:
+            column (Column): Indexed datetime column rows expire by e.g `Temp.updated_on`.
+            retention (int): Seconds rows are kept, 0 keeps them forever.
+        """
+        if retention:
+            self.rules.append((column, retention))
+
+    async def sweep(self, column: Column, retention: int) -> int:
+        """Delete rows older than `retention` seconds
+
+        Returns:
+            int: Rows deleted.
+        """
+        table = column.table
+        primary_key = table.primary_key.columns[0]
+        cutoff = datetime.utcnow() - timedelta(seconds=retention)
+        deleted = 0
+        while True:
+            # MySQL doesn't take LIMIT in `IN` subqueries - ids are selected first
+            async with Session() as session:
+                ids = (
+                    await session.scalars(
+                        select(primary_key)
+                        .where(column < cutoff)
+                        .order_by(column)
+                        .limit(self.batch_size)
+                    )
+                ).all()
+                if ids:
+                    await session.execute(delete(table).where(primary_key.in_(ids)))
+                    await session.commit()
+            deleted += len(ids)
+            if len(ids) < self.batch_size:
+                break
+            # Let updates be served between batches
+            await asyncio.sleep(0)
+        self.deleted[table.name] = self.deleted.get(table.name, 0) + deleted
+        return deleted
+
+    async def sweep_all(self) -> None:
+        """Delete expired rows of all tables"""
+        for column, retention in self.rules:
+            started = monotonic()
+            deleted = await self.sweep(column, retention)
+            if deleted:
+                logging.info(
+                    "Deleted %s expired rows from %s in %.2fs",
+                    deleted,
+                    column.table.name,
+                    monotonic() - started,
+                )
+
+    async def run(self) -> None:
+        """Sweep every `interval` seconds until cancelled"""
+        while True:
+            try:
+                await self.sweep_all()
+            except Exception as e:
+                logging.error("Failed to delete expired rows - %s", e)
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        """Run in the background"""
+        if self.rules:
+            self.__task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Stop running in the background"""
+        if self.__task:
+            self.__task.cancel()
+            await asyncio.gather(self.__task, return_exceptions=True)
+            self.__task = None
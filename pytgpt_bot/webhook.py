@@ -0,0 +1,166 @@
+import asyncio
+import hmac
+import json
+import logging
+import ssl
+from aiohttp import web
+from pathlib import Path
+from secrets import token_urlsafe
+from telebot.async_telebot import AsyncTeleBot
+from telebot.types import Update
+from pytgpt_bot import config
+
+secret_token_header: str = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """Receives updates pushed by Telegram over http
+
+    Every request is acknowledged as soon as its update is parsed and the
+    update is served in the background, so slow handlers don't hold up
+    Telegram's delivery of the next ones.
+    """
+
+    def __init__(
+        self,
+        bot: AsyncTeleBot,
+        secret_token: str,
+        path: str = "/webhook",
+        host: str = "127.0.0.1",
+        port: int = 8443,
+        certificate: str = None,
+        certificate_key: str = None,
+    ):
+        """Constructor
+
+        Args:
+            bot (AsyncTeleBot): Bot serving the updates.
+            secret_token (str): Expected value of the secret token header.
+            path (str, optional): Url path updates are posted to. Defaults to "/webhook".
+            host (str, optional): Interface to listen on. Defaults to "127.0.0.1".
+            port (int, optional): Port to listen on. Defaults to 8443.
+            certificate (str, optional): Path to TLS certificate. Defaults to None.
+            certificate_key (str, optional): Path to TLS certificate's private key. Defaults to None.
+        """
+        if not secret_token:
+            raise ValueError("A secret token is required to verify updates")
+        self.bot = bot
+        self.path = "/" + path.lstrip("/")
+        self.secret_token = secret_token
+        self.host = host
+        self.port = port
+        self.certificate = certificate
+        self.certificate_key = certificate_key
+        self.__tasks: set[asyncio.Task] = set()
+
+    @classmethod
+    def from_config(cls, bot: AsyncTeleBot, **kwargs) -> "WebhookServer":
+        """Make a server from the webhook settings
+
+        A secret token is generated when none is configured but the webhook is
+        to be registered on launch. A webhook registered elsewhere e.g behind a
+        reverse proxy must be given its token - updates aren't accepted
+        unverified, anyone could post them as the bot's owner.
+
+        Args:
+            bot (AsyncTeleBot): Bot serving the updates.
+
+        Raises:
+            ValueError: Neither `webhook-secret` nor `webhook-url` is set.
+
+        Returns:
+            WebhookServer: Server.
+        """
+        if not (config.webhook_secret or config.webhook_url):
+            raise ValueError(
+                "Set webhook-secret to the secret token the webhook was registered with"
+            )
+        return cls(
+            bot,
+            secret_token=config.webhook_secret or token_urlsafe(32),
+            path=config.webhook_path,
+            host=config.webhook_host,
+            port=config.webhook_port,
+            certificate=config.webhook_cert or None,
+            certificate_key=config.webhook_key or None,
+            **kwargs,
+        )
+
+    async def register(self, skip_pending: bool = False) -> None:
+        """Point Telegram to the webhook when `webhook-url` is set, otherwise
+        it's assumed to be set up already e.g behind a reverse proxy
+
+        Args:
+            skip_pending (bool, optional): Drop updates sent before launch. Defaults to False.
+        """
+        if not config.webhook_url:
+            return
+        await self.bot.set_webhook(
+            url=config.webhook_url.rstrip("/") + self.path,
+            certificate=(
+                Path(self.certificate).read_bytes() if self.certificate else None
+            ),
+            drop_pending_updates=skip_pending,
+            secret_token=self.secret_token,
+        )
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """Accept an update"""
+        if not hmac.compare_digest(
+            request.headers.get(secret_token_header, ""), self.secret_token
+        ):
+            logging.warning("Rejected webhook request from %s", request.remote)
+            return web.Response(status=401)
+        try:
+            self.dispatch(await request.json())
+        except (json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+            logging.debug("Malformed update - %s", e)
+            return web.Response(status=400)
+        return web.Response()
+
+    def dispatch(self, update: dict) -> None:
+        """Serve an update in the background
+
+        Args:
+            update (dict): Update as posted by Telegram.
+        """
+        task = asyncio.create_task(
+            self.bot.process_new_updates([Update.de_json(update)])
+        )
+        self.__tasks.add(task)
+        task.add_done_callback(self.__tasks.discard)
+
+    def make_app(self) -> web.Application:
+        """Web application serving the webhook path"""
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        return app
+
+    @property
+    def ssl_context(self) -> ssl.SSLContext | None:
+        if not self.certificate:
+            return
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(self.certificate, self.certificate_key)
+        return context
+
+    async def serve(self) -> None:
+        """Listen for updates until cancelled"""
+        runner = web.AppRunner(self.make_app())
+        await runner.setup()
+        site = web.TCPSite(runner, self.host, self.port, ssl_context=self.ssl_context)
+        await site.start()
+        logging.info(
+            "Listening for updates on %s://%s:%s%s",
+            "https" if self.certificate else "http",
+            self.host,
+            self.port,
+            self.path,
+        )
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+            # Let updates being served finish
+            if self.__tasks:
+                await asyncio.gather(*self.__tasks, return_exceptions=True)
@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import multiprocessing
+from multiprocessing.process import BaseProcess
+from multiprocessing.queues import Queue
+from multiprocessing.sharedctypes import Synchronized
+from zlib import crc32
+from telebot import asyncio_helper
+from telebot.async_telebot import AsyncTeleBot
+from pytgpt_bot.config import bot_token, loglevel, logfile
+from pytgpt_bot.config import (
+    log_max_bytes,
+    log_rotate_when,
+    log_backups,
+    log_compress,
+    log_json,
+)
+from pytgpt_bot import logs
+from pytgpt_bot.webhook import WebhookServer
+from pytgpt_bot.models import init_db
+
+long_polling_timeout: int = 20
+
+unordered_updates: frozenset[str] = frozenset(("callback_query", "inline_query"))
+"""Kinds of updates workers serve without waiting for the chat's earlier ones"""
+
+
+def get_update_key(update: dict) -> str:
+    """Id of the chat an update belongs to
+
+    Matches `get_user_id` - private chats' ids are their users' ids - for
+    updates that are yet to be parsed.
+
+    Args:
+        update (dict): Update as sent by Telegram.
+
+    Returns:
+        str: Chat id.
+    """
+    for kind, payload in update.items():
+        if not isinstance(payload, dict):
+            # update_id
+            continue
+        chat = payload.get("chat") or (payload.get("message") or {}).get("chat")
+        if chat:
+            return str(chat["id"])
+        if payload.get("from"):
+            # inline queries etc
+            return str(payload["from"]["id"])
+    return str(update.get("update_id"))
+
+
+def run_worker(
+    queue: Queue, index: int, log_queue: Queue, cache_generation: Synchronized
+) -> None:
+    """Worker process - serves the updates routed to it"""
+    # Records are written by the front process
+    logs.forward_logs(log_queue, loglevel)
+    from pytgpt_bot.db import share_invalidation
+    from pytgpt_bot.main import start_worker
+
+    # Admin commands served by any worker invalidate the chat caches of all
+    share_invalidation(cache_generation)
+
+    try:
+        # One worker tests g4f providers, the rest read its results
+        asyncio.run(start_worker(queue, check_providers=index == 0, index=index))
+    except KeyboardInterrupt:
+        pass
+
+
+class Supervisor:
+    """Shards updates onto worker processes by chat
+
+    Updates of a chat always go to the same worker, in the order they're
+    received, which serves them in that order too - see `unordered_updates`.
+    Workers that exit are started again.
+    """
+
+    def __init__(self, workers: int):
+        """Constructor
+
+        Args:
+            workers (int): Worker processes.
+        """
+        self.context = multiprocessing.get_context("spawn")
+        self.queues: list[Queue] = [self.context.Queue() for _ in range(workers)]
+        self.log_queue: Queue = self.context.Queue()
+        """Records of all workers"""
+        self.cache_generation: Synchronized = self.context.Value("L", 0)
+        """Bumped by workers invalidating their chat caches"""
+        self.processes: list[BaseProcess] = [None] * workers
+
+    def start_worker(self, index: int) -> None:
+        process = self.context.Process(
+            target=run_worker,
+            args=(self.queues[index], index, self.log_queue, self.cache_generation),
+            name=f"pytgpt-bot-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        self.processes[index] = process
+        logging.info("Started %s - PID %s", process.name, process.pid)
+
+    def start(self) -> None:
+        """Start all workers"""
+        for index in range(len(self.processes)):
+            self.start_worker(index)
+
+    def route(self, update: dict) -> None:
+        """Hand over an update to its chat's worker
+
+        Args:
+            update (dict): Update as sent by Telegram.
+        """
+        index = crc32(get_update_key(update).encode()) % len(self.queues)
+        self.queues[index].put(update)
+
+    async def watch(self, interval: float = 5) -> None:
+        """Restart workers that exit until cancelled
+
+        Args:
+            interval (float, optional): Seconds between checks. Defaults to 5.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            for index, process in enumerate(self.processes):
+                if not process.is_alive():
+                    logging.error(
+                        "%s exited with code %s - restarting",
+                        process.name,
+                        process.exitcode,
+                    )
+                    self.start_worker(index)
+
+    def stop(self, timeout: float = 30) -> None:
+        """Let workers finish the updates they have then stop them
+
+        Args:
+            timeout (float, optional): Seconds to wait for each worker. Defaults to 30.
+        """
+        for queue in self.queues:
+            queue.put(None)
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+
+
+class ShardingWebhookServer(WebhookServer):
+    """Webhook server that hands over updates to worker processes"""
+
+    def __init__(self, *args, supervisor: Supervisor, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.supervisor = supervisor
+
+    def dispatch(self, update: dict) -> None:
+        self.supervisor.route(update)
+
+
+async def poll(supervisor: Supervisor, timeout: int, skip_pending: bool = False):
+    """Long poll for updates and hand them over to workers until cancelled
+
+    Args:
+        supervisor (Supervisor): Workers' supervisor.
+        timeout (int): Http request timeout.
+        skip_pending (bool, optional): Ignore updates sent before launch. Defaults to False.
+    """
+    await asyncio_helper.delete_webhook(
+        bot_token, drop_pending_updates=skip_pending or None
+    )
+    offset: int = None
+    while True:
+        try:
+            updates = await asyncio_helper.get_updates(
+                bot_token,
+                offset,
+                limit=100,
+                timeout=long_polling_timeout,
+                request_timeout=long_polling_timeout + timeout,
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error("Failed to get updates - %s", e)
+            await asyncio.sleep(3)
+            continue
+        for update in updates:
+            offset = update["update_id"] + 1
+            supervisor.route(update)
+
+
+async def start_front(
+    workers: int, timeout: int, skip_pending: bool = False, webhook: bool = False
+):
+    """Receive updates and shard them onto worker processes until stopped
+
+    Args:
+        workers (int): Worker processes.
+        timeout (int): Http request timeout.
+        skip_pending (bool, optional): Ignore updates sent before launch. Defaults to False.
+        webhook (bool, optional): Receive updates over the webhook instead of long polling. Defaults to False.
+    """
+    supervisor = Supervisor(workers)
+    # Records of the workers are written here - stopped on exit
+    logs.setup_logging(
+        loglevel,
+        logfile,
+        max_bytes=log_max_bytes,
+        when=log_rotate_when,
+        backups=log_backups,
+        compress=log_compress,
+        json_lines=log_json,
+        queue=supervisor.log_queue,
+    )
+    # Tables are created and migrated once before workers start
+    await init_db()
+    supervisor.start()
+    watcher = asyncio.create_task(supervisor.watch())
+    try:
+        if webhook:
+            server = ShardingWebhookServer.from_config(
+                AsyncTeleBot(bot_token), supervisor=supervisor
+            )
+            await server.register(skip_pending)
+            await server.serve()
+        else:
+            await poll(supervisor, timeout, skip_pending)
+    finally:
+        watcher.cancel()
+        await asyncio.to_thread(supervisor.stop)
+        session = asyncio_helper.session_manager.session
+        if session and not session.closed:
+            await session.close()
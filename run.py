@@ -7,14 +7,35 @@ root_path = Path(__file__).parent
 dotenv_path = root_path / ".env"
 load_dotenv(dotenv_path)
 
-from pytgpt_bot.main import bot
-
 if __name__ == "__main__":
     timeout = int(os.environ.get("timeout", 30))
-    print("Infinity polling ...")
-    asyncio.run(
-        bot.infinity_polling(
-            timeout=timeout,
-            skip_pending=str(os.environ.get("skip-pending", "true")).lower() == "true",
+    skip_pending = str(os.environ.get("skip-pending", "true")).lower() == "true"
+    webhook = str(os.environ.get("webhook", "false")).lower() == "true"
+    workers = int(os.environ.get("workers", 1))
+    if workers > 1:
+        from pytgpt_bot.workers import start_front
+
+        print(f"Sharding updates onto {workers} workers ...")
+        asyncio.run(
+            start_front(
+                workers=workers,
+                timeout=timeout,
+                skip_pending=skip_pending,
+                webhook=webhook,
+            )
+        )
+    elif webhook:
+        from pytgpt_bot.main import start_webhook
+
+        print("Serving webhook ...")
+        asyncio.run(start_webhook(skip_pending=skip_pending))
+    else:
+        from pytgpt_bot.main import start_polling
+
+        print("Infinity polling ...")
+        asyncio.run(
+            start_polling(
+                timeout=timeout,
+                skip_pending=skip_pending,
+            )
         )
-    )
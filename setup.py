@@ -38,8 +38,13 @@ setup(
         "python-tgpt>=0.8.0",
         "python-dotenv==1.0.0",
         "click==8.1.3",
-        "SQLAlchemy==2.0.29",
+        "SQLAlchemy[asyncio]==2.0.29",
+        "aiosqlite==0.20.0",
     ],
+    extras_require={
+        "postgresql": ["asyncpg"],
+        "mysql": ["aiomysql"],
+    },
     python_requires=">=3.10",
     keywords=[
         "ai",
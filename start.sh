@@ -15,7 +15,7 @@ function setup(){
     fi
     pip install -U pip
     pip install .
-    pip install pymysql
+    pip install aiomysql
 }
 
 function move_to_path(){
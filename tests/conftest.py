@@ -0,0 +1,4 @@
+from os import environ
+
+# Config refuses to load without a token
+environ.setdefault("token", "123:test")
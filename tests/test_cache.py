@@ -0,0 +1,75 @@
+import pytest
+from pytgpt_bot import cache
+from pytgpt_bot.cache import LRUCache
+
+
+class Clock:
+    """Stands in for `monotonic`, moved by hand"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache, "monotonic", clock)
+    return clock
+
+
+def test_entries_expire_after_ttl(clock):
+    lru = LRUCache(maxsize=10, ttl=5)
+    lru.set("a", 1)
+    clock.now += 4.9
+    assert lru.get("a") == 1
+    clock.now += 0.2
+    assert lru.get("a", "missing") == "missing"
+    # Expired entries are dropped once looked up
+    assert len(lru) == 0
+
+
+def test_zero_ttl_never_expires(clock):
+    lru = LRUCache(maxsize=10, ttl=0)
+    lru.set("a", 1)
+    clock.now += 10**6
+    assert lru.get("a") == 1
+
+
+def test_least_recently_used_is_evicted(clock):
+    lru = LRUCache(maxsize=2, ttl=0)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    lru.get("a")
+    lru.set("c", 3)
+    assert lru.get("b") is None
+    assert (lru.get("a"), lru.get("c")) == (1, 3)
+
+
+def test_setting_refreshes_ttl(clock):
+    lru = LRUCache(maxsize=10, ttl=5)
+    lru.set("a", 1)
+    clock.now += 4
+    lru.set("a", 2)
+    clock.now += 4
+    assert lru.get("a") == 2
+
+
+def test_zero_maxsize_disables_caching():
+    lru = LRUCache(maxsize=0)
+    lru.set("a", 1)
+    assert lru.get("a") is None and len(lru) == 0
+
+
+def test_invalidation_and_stats():
+    lru = LRUCache(maxsize=10)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    lru.get("a")
+    lru.pop("a")
+    lru.get("a")
+    assert lru.stats()["hit_rate"] == 0.5
+    lru.clear()
+    assert len(lru) == 0
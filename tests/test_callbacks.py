@@ -0,0 +1,86 @@
+import pytest
+from pytgpt_bot.callbacks import (
+    CallbackRouter,
+    decode_media_callback,
+    decode_varint,
+    encode_media_callback,
+    encode_varint,
+    max_callback_bytes,
+    media_callback_prefix,
+)
+
+
+def payload(data: str) -> str:
+    """Callback data less its namespace"""
+    prefix, _, rest = data.partition(":")
+    assert prefix == media_callback_prefix
+    return rest
+
+
+@pytest.mark.parametrize("value", [0, 1, -1, 63, -64, 64, 2**31, -(2**40), 2**62])
+def test_varint_round_trip(value):
+    encoded = encode_varint(value)
+    assert decode_varint(b"\x00" + encoded, 1) == (value, len(encoded) + 1)
+
+
+def test_small_values_take_a_byte():
+    assert len(encode_varint(-64)) == len(encode_varint(63)) == 1
+
+
+@pytest.mark.parametrize("provider", ["default", "prodia", "speech"])
+@pytest.mark.parametrize("user_id", [1, "123456789", -1001234567890])
+def test_prompt_round_trip(provider, user_id):
+    data = encode_media_callback(provider, user_id, prompt="Desert: dunes")
+    assert len(data.encode()) <= max_callback_bytes
+    assert decode_media_callback(payload(data)) == (
+        provider,
+        str(user_id),
+        "Desert: dunes",
+        None,
+    )
+
+
+def test_temp_id_round_trip():
+    data = encode_media_callback("speech", -1001234567890, temp_id=2**33)
+    assert decode_media_callback(payload(data)) == (
+        "speech",
+        "-1001234567890",
+        None,
+        2**33,
+    )
+
+
+def test_prompts_over_the_size_cap_are_not_encoded():
+    assert encode_media_callback("default", 123456789, prompt="x" * 64) is None
+    # Characters are counted in bytes
+    assert encode_media_callback("default", 123456789, prompt="é" * 30) is None
+
+
+@pytest.mark.parametrize(
+    "garbage",
+    [
+        "",
+        "nocolon",
+        "!!!:prompt",
+        "AA:prompt",
+        "_w==:prompt",
+        "gICAgA:prompt",
+        # Trailing bytes after the user id
+        "AAIA:prompt",
+    ],
+)
+def test_garbage_is_rejected(garbage):
+    with pytest.raises(ValueError):
+        decode_media_callback(garbage)
+
+
+def test_router_resolves_namespaces_then_legacy_data():
+    router = CallbackRouter()
+
+    @router.route("voice", legacy={"Brian"}.__contains__)
+    async def voice(call, payload):
+        pass
+
+    assert router.resolve("voice:Brian") == (voice, "Brian")
+    assert router.resolve("Brian:123") == (voice, "Brian:123")
+    assert router.resolve("unknown:123") is None
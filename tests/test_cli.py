@@ -0,0 +1,61 @@
+import importlib
+from os import environ
+import click
+import pytest
+from click.testing import CliRunner
+from pytgpt_bot import cli
+
+
+def zero_options() -> list[str]:
+    """Arguments passing 0 to every numeric option of `run` that accepts it"""
+    arguments = []
+    for param in cli.run.params:
+        if not isinstance(param, click.Option) or not isinstance(
+            param.type, (click.IntRange, click.FloatRange)
+        ):
+            continue
+        if param.type.min is None or param.type.min <= 0:
+            arguments.extend([param.opts[0], "0"])
+    return arguments
+
+
+@pytest.fixture
+def started(monkeypatch):
+    """Invoke `run` then load config off the environment it sets, in place of
+    starting the bot"""
+    saved = dict(environ)
+    loaded = {}
+
+    def fake_run(coroutine):
+        coroutine.close()
+        import pytgpt_bot.config as config
+
+        loaded["config"] = importlib.reload(config)
+
+    monkeypatch.setattr(cli.asyncio, "run", fake_run)
+
+    def start(*args: str):
+        result = CliRunner().invoke(cli.run, ["token", *args], catch_exceptions=False)
+        assert result.exit_code == 0, result.output
+        return loaded["config"]
+
+    yield start
+    environ.clear()
+    environ.update(saved)
+
+
+def test_run_with_defaults(started):
+    config = started()
+    assert config.cache_size == 1000
+    assert config.media_cache_bytes == 0
+    assert config.failover == 2
+
+
+def test_run_with_zeros(started):
+    arguments = zero_options()
+    assert "--media-cache-bytes" in arguments
+    config = started(*arguments)
+    for option in arguments[::2]:
+        assert float(environ[option[2:]]) == 0
+    assert config.cache_size == 0
+    assert config.failover == 0
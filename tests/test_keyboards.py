@@ -0,0 +1,79 @@
+import json
+from types import SimpleNamespace
+from pytgpt_bot.keyboards import PagedKeyboard, page_namespace
+from pytgpt_bot.search import TrigramIndex
+
+call = SimpleNamespace(message=SimpleNamespace(chat=SimpleNamespace(id=42)))
+
+
+def buttons(markup: str) -> list[dict]:
+    return [button for row in json.loads(markup)["inline_keyboard"] for button in row]
+
+
+def test_choices_are_split_into_pages_with_navigation():
+    keyboard = PagedKeyboard("voice", [f"v{i}" for i in range(7)], page_size=3)
+    assert len(keyboard.pages) == 3
+    first = buttons(keyboard.page(0))
+    assert [button["text"] for button in first[:3]] == ["v0", "v1", "v2"]
+    assert [button["callback_data"] for button in first[3:]] == [
+        f"{page_namespace}:voice:2",
+        f"{page_namespace}:voice:0",
+        f"{page_namespace}:voice:1",
+    ]
+    # Pages wrap around
+    assert keyboard.page(3) == keyboard.page(0)
+
+
+def test_single_page_has_no_navigation():
+    keyboard = PagedKeyboard("voice", ["a", "b"], page_size=3)
+    assert [button["text"] for button in buttons(keyboard.page(0))] == ["a", "b"]
+
+
+def test_pages_are_rebuilt_only_when_choices_change():
+    keyboard = PagedKeyboard("prov", ["a", "b"])
+    pages = keyboard.pages
+    keyboard.update(["a", "b"])
+    assert keyboard.pages is pages
+    keyboard.update(["a", "b", "c"])
+    assert "c" in keyboard
+
+
+def test_long_choices_round_trip_through_a_stable_key():
+    long_choice = "An awesome prompt " * 5
+    keyboard = PagedKeyboard("aw", ["short", long_choice])
+    data = buttons(keyboard.page(0))[1]["callback_data"]
+    assert len(data.encode()) <= 64
+    payload = data.split(":", 1)[1]
+    assert keyboard.parse(call, payload) == (long_choice, "42")
+    # Same key once the other choices change
+    keyboard.update(["other", long_choice, "more"])
+    assert keyboard.parse(call, payload) == (long_choice, "42")
+
+
+def test_stale_and_forged_choices_are_rejected():
+    keyboard = PagedKeyboard("prov", ["a", "b"])
+    assert keyboard.parse(call, "a") == ("a", "42")
+    assert keyboard.parse(call, "gone") is None
+    assert keyboard.parse(call, "~forged") is None
+    assert keyboard.parse(call, "#99") is None
+
+
+def test_legacy_payload_carries_its_user_id():
+    keyboard = PagedKeyboard("voice", ["Brian", "en-US"])
+    assert keyboard.parse(call, "en-US:123") == ("en-US", "123")
+
+
+def test_search_ranks_prefix_then_substring_then_fuzzy_matches():
+    keyboard = PagedKeyboard("voice", ["Brian", "Ivy", "Brianna", "Sabrina", "Bryan"])
+    assert keyboard.search("bri") == ["Brian", "Brianna", "Sabrina"]
+    # Misspelt
+    assert "Brian" in keyboard.search("brain")
+    markup, total = keyboard.render_search("zzz")
+    assert markup is None and total == 0
+
+
+def test_search_through_an_index_only_returns_listed_choices():
+    index = TrigramIndex()
+    index.update({"Linux Terminal": "act as a shell", "Gone": "linux"})
+    keyboard = PagedKeyboard("aw", ["Linux Terminal"], index=index)
+    assert keyboard.search("linux") == ["Linux Terminal"]
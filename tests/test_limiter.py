@@ -0,0 +1,132 @@
+import asyncio
+import pytest
+from telebot.asyncio_helper import ApiTelegramException
+from pytgpt_bot import limiter
+from pytgpt_bot.limiter import BULK, INTERACTIVE, SendScheduler, TokenBucket
+
+
+class Clock:
+    """Stands in for `monotonic`, moved by hand"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(limiter, "monotonic", clock)
+    return clock
+
+
+def test_bucket_drains_and_refills(clock):
+    bucket = TokenBucket(rate=2, capacity=2)
+    bucket.consume()
+    bucket.consume()
+    assert bucket.delay() == pytest.approx(0.5)
+    clock.now += 0.5
+    assert bucket.delay() == 0
+    clock.now += 10
+    bucket.consume()
+    # Capped at capacity
+    assert bucket.tokens == pytest.approx(1)
+
+
+def test_bucket_pause_withholds_tokens(clock):
+    bucket = TokenBucket(rate=1, capacity=5)
+    bucket.pause(3)
+    assert bucket.delay() == pytest.approx(3)
+    clock.now += 3
+    assert bucket.delay() == 0
+
+
+def flood_error(retry_after: int) -> ApiTelegramException:
+    return ApiTelegramException(
+        "sendMessage",
+        None,
+        dict(
+            error_code=429,
+            description="Too Many Requests",
+            parameters=dict(retry_after=retry_after),
+        ),
+    )
+
+
+def test_flood_wait_pauses_global_and_chat_buckets():
+    async def main():
+        scheduler = SendScheduler(global_rate=1000, chat_rate=1000, retries=1)
+        calls = []
+
+        async def request():
+            calls.append(len(calls))
+            if len(calls) == 1:
+                raise flood_error(0.05)
+            return "sent"
+
+        started = asyncio.get_running_loop().time()
+        result = await scheduler.send(1, request)
+        return result, calls, asyncio.get_running_loop().time() - started, scheduler
+
+    result, calls, elapsed, scheduler = asyncio.run(main())
+    assert result == "sent" and calls == [0, 1]
+    assert elapsed >= 0.04
+    assert scheduler.global_bucket.tokens < scheduler.global_bucket.capacity
+
+
+def test_flood_wait_gives_up_after_retries():
+    async def main():
+        scheduler = SendScheduler(global_rate=1000, chat_rate=1000, retries=1)
+
+        async def request():
+            raise flood_error(0)
+
+        await scheduler.send(1, request)
+
+    with pytest.raises(ApiTelegramException):
+        asyncio.run(main())
+
+
+def test_private_chats_are_paced_per_chat():
+    async def main():
+        scheduler = SendScheduler(global_rate=1000, chat_rate=20)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        for _ in range(3):
+            await scheduler.acquire(1)
+        chat_elapsed = loop.time() - started
+        started = loop.time()
+        # Requests not bound to a chat only take from the global bucket
+        for _ in range(3):
+            await scheduler.acquire(None)
+        return chat_elapsed, loop.time() - started
+
+    chat_elapsed, global_elapsed = asyncio.run(main())
+    assert chat_elapsed >= 0.09
+    assert global_elapsed < 0.05
+
+
+def test_waiting_sends_are_released_by_priority():
+    async def main():
+        scheduler = SendScheduler(global_rate=50, chat_rate=1000)
+        # Drain the global bucket
+        for _ in range(50):
+            await scheduler.acquire(None)
+        order = []
+
+        async def send(name: str, priority: int):
+            await scheduler.acquire(None, priority)
+            order.append(name)
+
+        tasks = [
+            asyncio.create_task(send("bulk", BULK)),
+            asyncio.create_task(send("interactive", INTERACTIVE)),
+        ]
+        await asyncio.sleep(0)
+        assert scheduler.waiting == 2
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(main()) == ["interactive", "bulk"]
@@ -0,0 +1,117 @@
+import gzip
+import pytest
+from pytgpt_bot import logs
+
+
+def record(level: str, message: str, second: int = 0) -> str:
+    return f"18-Oct-2026 12:00:{second:02d} : {level} - {message}"
+
+
+@pytest.fixture
+def logfile(tmp_path):
+    lines = [
+        record("INFO", "Serving user [1]", 1),
+        record("ERROR", "Error on function - text_chat - timeout", 2),
+        "Traceback (most recent call last):",
+        '  File "main.py", line 1',
+        "TimeoutError",
+        record("DEBUG", "Served function [text_chat] in 1.2s", 3),
+        record("WARNING", "Provider [phind] failed - timeout", 4),
+    ]
+    path = tmp_path / "bot.log"
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return path
+
+
+@pytest.mark.parametrize("block_size", [1, 7, 64, 64 * 1024])
+def test_lines_are_read_backwards_across_blocks(logfile, block_size):
+    lines = logfile.read_text(encoding="utf-8").split("\n")
+    assert list(logs.read_lines_backwards(logfile, block_size)) == lines[::-1]
+
+
+def test_multibyte_characters_split_across_blocks(tmp_path):
+    path = tmp_path / "bot.log"
+    path.write_text("ünïcödé\nlast", encoding="utf-8")
+    assert list(logs.read_lines_backwards(path, block_size=3)) == [
+        "last",
+        "ünïcödé",
+    ]
+
+
+traceback_record = [
+    record("ERROR", "Error on function - text_chat - timeout", 2),
+    "Traceback (most recent call last):",
+    '  File "main.py", line 1',
+    "TimeoutError",
+]
+
+
+def test_tail_of_a_file_shorter_than_a_block(logfile):
+    assert logfile.stat().st_size < 64 * 1024
+    records = logs.tail(logfile, count=10)
+    assert len(records) == 4
+    assert records[1].splitlines() == traceback_record
+
+
+@pytest.mark.parametrize("block_size", [1, 5, 30, 70, 100, 150])
+def test_tail_of_a_record_split_by_a_block_boundary(logfile, monkeypatch, block_size):
+    # Boundaries of some of these sizes fall within the traceback
+    reader = logs.read_lines_backwards
+    monkeypatch.setattr(
+        logs, "read_lines_backwards", lambda path: reader(path, block_size)
+    )
+    records = logs.tail(logfile, count=10)
+    assert len(records) == 4
+    assert records[1].splitlines() == traceback_record
+
+
+def test_tail_returns_the_latest_records_oldest_first(logfile):
+    records = logs.tail(logfile, count=2)
+    assert [line.split(" - ", 1)[1] for line in records] == [
+        "Served function [text_chat] in 1.2s",
+        "Provider [phind] failed - timeout",
+    ]
+
+
+def test_tail_filters_by_level_and_text(logfile):
+    assert [r.split(" : ")[1][:5] for r in logs.tail(logfile, level="warning")] == [
+        "ERROR",
+        "WARNI",
+    ]
+    assert len(logs.tail(logfile, pattern="TIMEOUTERROR")) == 1
+    assert logs.tail(logfile, level="error", pattern="phind") == []
+
+
+def test_tail_of_json_lines(tmp_path):
+    path = tmp_path / "bot.log"
+    path.write_text(
+        '{"time": "t", "level": "INFO", "message": "a"}\n'
+        '{"time": "t", "level": "ERROR", "message": "b"}\n',
+        encoding="utf-8",
+    )
+    assert logs.tail(path, level="ERROR") == [
+        '{"time": "t", "level": "ERROR", "message": "b"}'
+    ]
+
+
+def test_tail_of_an_empty_file(tmp_path):
+    path = tmp_path / "bot.log"
+    path.write_text("")
+    assert logs.tail(path) == []
+
+
+@pytest.mark.parametrize(
+    "arguments, parsed",
+    [
+        (None, (50, None, None, False)),
+        ("100", (100, None, None, False)),
+        ("error provider failed 5", (5, "ERROR", "provider failed", False)),
+        ("gz", (50, None, None, True)),
+    ],
+)
+def test_parse_arguments(arguments, parsed):
+    assert logs.parse_arguments(arguments) == parsed
+
+
+def test_compress(logfile):
+    assert gzip.decompress(logs.compress(logfile).read()) == logfile.read_bytes()
@@ -0,0 +1,164 @@
+import asyncio
+import pytest
+from pytgpt_bot.queues import ChatQueues, ChatQueueFull, Debouncer, Superseded
+
+
+def test_turns_follow_reservations_not_arrival_at_the_slot():
+    async def main():
+        queues = ChatQueues()
+        served = []
+
+        async def serve(name: str, ticket: asyncio.Future, load: float):
+            # e.g the chat being loaded from the database first
+            await asyncio.sleep(load)
+            async with queues.slot(1, ticket):
+                served.append(name)
+
+        first, second = queues.reserve(1), queues.reserve(1)
+        await asyncio.gather(serve("first", first, 0.05), serve("second", second, 0))
+        return served
+
+    assert asyncio.run(main()) == ["first", "second"]
+
+
+def test_unused_turns_are_released():
+    async def main():
+        queues = ChatQueues()
+        unused = queues.reserve(1)
+        ticket = queues.reserve(1)
+        queues.release(1, unused)
+        async with queues.slot(1, ticket):
+            return True
+
+    assert asyncio.run(asyncio.wait_for(main(), 1))
+
+
+def test_excess_updates_are_turned_down():
+    async def main():
+        queues = ChatQueues(max_depth=1)
+        async with queues.slot(1):
+            with pytest.raises(ChatQueueFull):
+                async with queues.slot(1):
+                    pass
+            # Other chats are unaffected
+            async with queues.slot(2):
+                pass
+        return queues.queued
+
+    assert asyncio.run(main()) == 0
+
+
+def test_concurrency_is_capped():
+    async def main():
+        queues = ChatQueues(concurrency=2)
+        peak = 0
+
+        async def serve(chat_id: int):
+            nonlocal peak
+            async with queues.slot(chat_id):
+                peak = max(peak, queues.in_flight)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(serve(chat_id) for chat_id in range(6)))
+        return peak, queues.in_flight
+
+    assert asyncio.run(main()) == (2, 0)
+
+
+def test_capacity_is_shared_with_chat_slots():
+    async def main():
+        queues = ChatQueues(concurrency=1)
+        async with queues.capacity():
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(queues.slot(1).__aenter__(), 0.05)
+        return queues.in_flight
+
+    assert asyncio.run(main()) == 0
+
+
+class Generator:
+    """Counts the calls made, answering after a delay"""
+
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.calls: list[str] = []
+
+    def __call__(self, tag: str):
+        async def generate() -> str:
+            self.calls.append(tag)
+            await asyncio.sleep(self.delay)
+            return f"response to {tag}"
+
+        return generate
+
+
+def test_newer_call_supersedes_pending_one():
+    async def main():
+        debouncer = Debouncer(delay=0.05)
+        generator = Generator()
+        first = asyncio.create_task(debouncer.run(1, "hel", generator("hel")))
+        await asyncio.sleep(0.01)
+        second = await debouncer.run(1, "hello", generator("hello"))
+        with pytest.raises(Superseded):
+            await first
+        return second, generator.calls, debouncer.superseded
+
+    assert asyncio.run(main()) == ("response to hello", ["hello"], 1)
+
+
+def test_other_keys_are_not_superseded():
+    async def main():
+        debouncer = Debouncer(delay=0.01)
+        generator = Generator()
+        return await asyncio.gather(
+            debouncer.run(1, "a", generator("a")),
+            debouncer.run(2, "b", generator("b")),
+        )
+
+    assert asyncio.run(main()) == ["response to a", "response to b"]
+
+
+def test_repeated_call_shares_the_pending_result():
+    async def main():
+        debouncer = Debouncer(delay=0.01, keep=1)
+        generator = Generator()
+        results = await asyncio.gather(
+            debouncer.run(1, "hi", generator("hi")),
+            debouncer.run(1, "hi", generator("hi")),
+        )
+        # Kept for repeats made after it's done
+        results.append(await debouncer.run(1, "hi", generator("hi")))
+        return results, generator.calls
+
+    results, calls = asyncio.run(main())
+    assert results == ["response to hi"] * 3
+    assert calls == ["hi"]
+
+
+def test_call_past_its_deadline_carries_on():
+    async def main():
+        debouncer = Debouncer(delay=0, keep=1)
+        generator = Generator(delay=0.1)
+        with pytest.raises(asyncio.TimeoutError):
+            await debouncer.run(1, "hi", generator("hi"), deadline=0.02)
+        assert debouncer.pending == 1
+        # Asked again, the call still being made is waited for
+        result = await debouncer.run(1, "hi", generator("hi"), deadline=1)
+        return result, generator.calls, debouncer.pending
+
+    assert asyncio.run(main()) == ("response to hi", ["hi"], 0)
+
+
+def test_failed_call_is_not_kept():
+    async def main():
+        debouncer = Debouncer(delay=0)
+
+        async def fail():
+            raise ValueError("provider down")
+
+        with pytest.raises(ValueError):
+            await debouncer.run(1, "hi", fail)
+        await asyncio.sleep(0)
+        return await debouncer.run(1, "hi", Generator()("hi"))
+
+    assert asyncio.run(main()) == "response to hi"
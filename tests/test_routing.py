@@ -0,0 +1,91 @@
+import asyncio
+import pytest
+from pytgpt_bot.routing import ProviderRouter, ProviderStats, min_samples
+
+
+class Pool:
+    """Stands in for `ProviderPool`, answering after set delays"""
+
+    def __init__(self, delays: dict[str, float], failing: set[str] = ()):
+        self.delays = delays
+        self.failing = set(failing)
+        self.calls: list[str] = []
+        self.cancelled: list[str] = []
+
+    async def chat(self, name: str, prompt: str, timeout: int) -> str:
+        self.calls.append(name)
+        try:
+            await asyncio.sleep(self.delays.get(name, 0))
+        except asyncio.CancelledError:
+            self.cancelled.append(name)
+            raise
+        if name in self.failing:
+            raise ConnectionError(f"{name} is down")
+        return f"{name}: {prompt}"
+
+
+def make_router(pool: Pool, candidates: list[str], **kwargs) -> ProviderRouter:
+    return ProviderRouter(pool, candidates=lambda: candidates, **kwargs)
+
+
+def train(router: ProviderRouter, name: str, latency: float, ok: bool = True):
+    for _ in range(min_samples):
+        router.record(name, latency, ok)
+
+
+def test_stats_percentiles_and_error_rate():
+    stats = ProviderStats(size=4)
+    for latency in (1, 2, 3, 4, 5):
+        stats.record(latency, True)
+    stats.record(9, False)
+    # Only the latest requests are remembered
+    assert sorted(stats.latencies) == [2, 3, 4, 5]
+    assert stats.percentile(0.5) == 4
+    assert stats.error_rate == 0.25
+
+
+def test_rank_keeps_preferred_first_then_fastest_then_untried():
+    router = make_router(Pool({}), ["a", "b", "c", "d", "e"], failover=3)
+    train(router, "c", 2)
+    train(router, "d", 1)
+    assert router.rank("a") == ["a", "d", "c", "b"]
+
+
+def test_rank_skips_unhealthy_providers():
+    router = make_router(Pool({}), ["a", "b", "c"], failover=2)
+    train(router, "b", 0.1, ok=False)
+    assert router.rank("a") == ["a", "c"]
+
+
+def test_chat_fails_over():
+    pool = Pool({}, failing={"a"})
+    router = make_router(pool, ["a", "b"])
+    assert asyncio.run(router.chat("a", "hi", 10)) == ("b", "b: hi")
+    assert router.stats["a"].error_rate == 1
+
+
+def test_chat_raises_when_every_provider_fails():
+    router = make_router(Pool({}, failing={"a", "b"}), ["a", "b"])
+    with pytest.raises(ConnectionError):
+        asyncio.run(router.chat("a", "hi", 10))
+
+
+def test_slow_request_is_hedged_and_loser_cancelled():
+    pool = Pool({"a": 0.5, "b": 0})
+    router = make_router(pool, ["a", "b"], hedge=True, min_hedge_delay=0.05)
+    train(router, "a", 0.01)
+
+    async def main():
+        return await router.chat("a", "hi", 10)
+
+    assert asyncio.run(main()) == ("b", "b: hi")
+    assert pool.calls == ["a", "b"]
+    assert pool.cancelled == ["a"]
+
+
+def test_fast_request_is_not_hedged():
+    pool = Pool({"a": 0, "b": 0})
+    router = make_router(pool, ["a", "b"], hedge=True, min_hedge_delay=0.05)
+    train(router, "a", 0.01)
+    assert asyncio.run(router.chat("a", "hi", 10)) == ("a", "a: hi")
+    assert pool.calls == ["a"]
@@ -0,0 +1,48 @@
+from pytgpt_bot.search import TrigramIndex, make_trigrams
+
+documents = {
+    "Linux Terminal": "I want you to act as a linux terminal",
+    "English Translator": "I want you to act as an English translator",
+    "Travel Guide": "suggest places to visit, act as a travel guide",
+    "Poet": "write poems that stir souls",
+}
+
+
+def make_index() -> TrigramIndex:
+    index = TrigramIndex()
+    index.update(documents)
+    return index
+
+
+def test_trigrams_are_padded_so_prefixes_count():
+    assert make_trigrams("Linux") == {"  l", " li", "lin", "inu", "nux", "ux "}
+    assert make_trigrams("!?") == set()
+
+
+def test_names_outrank_bodies():
+    assert make_index().search("linux")[0] == "Linux Terminal"
+    # Only found in a body
+    assert make_index().search("poems") == ["Poet"]
+
+
+def test_partial_and_misspelt_words_match():
+    index = make_index()
+    assert index.search("transl")[0] == "English Translator"
+    assert index.search("termnal")[0] == "Linux Terminal"
+
+
+def test_unrelated_queries_match_nothing():
+    index = make_index()
+    assert index.search("quantum chromodynamics") == []
+    assert index.search("") == []
+
+
+def test_limit():
+    assert len(make_index().search("act as", limit=2, min_score=0)) == 2
+
+
+def test_rebuilt_only_when_documents_change():
+    index = make_index()
+    assert index.update(dict(documents)) is False
+    assert index.update({**documents, "Chef": "cook recipes"}) is True
+    assert index.search("chef") == ["Chef"]
@@ -0,0 +1,66 @@
+import asyncio
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+from pytgpt_bot.webhook import WebhookServer, secret_token_header
+
+forged_update = {
+    "update_id": 1,
+    "message": {
+        "message_id": 1,
+        "date": 0,
+        "chat": {"id": 1, "type": "private"},
+        "from": {"id": 1, "is_bot": False, "first_name": "Admin"},
+        "text": "/drop",
+    },
+}
+
+
+class LocalWebhookServer(WebhookServer):
+    """Keeps the updates accepted instead of serving them"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(None, *args, **kwargs)
+        self.updates: list[dict] = []
+
+    def dispatch(self, update: dict) -> None:
+        self.updates.append(update)
+
+
+def post(server: WebhookServer, headers: dict) -> int:
+    async def main():
+        async with TestClient(TestServer(server.make_app())) as client:
+            response = await client.post(
+                server.path, json=forged_update, headers=headers
+            )
+            return response.status
+
+    return asyncio.run(main())
+
+
+def test_update_with_secret_token_is_accepted():
+    server = LocalWebhookServer("secret")
+    assert post(server, {secret_token_header: "secret"}) == 200
+    assert server.updates == [forged_update]
+
+
+@pytest.mark.parametrize("headers", [{}, {secret_token_header: "guess"}])
+def test_update_without_secret_token_is_rejected(headers):
+    server = LocalWebhookServer("secret")
+    assert post(server, headers) == 401
+    assert server.updates == []
+
+
+def test_secret_token_is_required():
+    with pytest.raises(ValueError):
+        LocalWebhookServer(None)
+
+
+def test_webhook_registered_elsewhere_needs_its_secret_token(monkeypatch):
+    from pytgpt_bot import config
+
+    monkeypatch.setattr(config, "webhook_url", "")
+    monkeypatch.setattr(config, "webhook_secret", "")
+    with pytest.raises(ValueError):
+        WebhookServer.from_config(None)
+    monkeypatch.setattr(config, "webhook_url", "https://example.com")
+    assert WebhookServer.from_config(None).secret_token